@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark fiaas-deploy-daemon against a FakeApiServer running in the same process
+
+Synthetic Applications are created directly in the fake API server, and the daemon deploys them like it would in a
+cluster. The benchmark ends when every Application has a successful (or failed) ApplicationStatus, and prints the
+results as JSON on stdout. Arguments not recognized by the benchmark are passed on to the daemon.
+
+With a scenario file, faults are injected into the requests the daemon makes to the API server (see
+`fault_injection`). Every scenario in the file is run in a process of its own, unless a single scenario is selected.
+"""
+from __future__ import absolute_import
+
+import argparse
+import collections
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pinject
+from k8s.client import Client
+from monotonic import monotonic as time_monotonic
+from prometheus_client import REGISTRY
+
+from .fake_api_server import FakeApiServer
+from .fault_injection import install, load_scenarios
+from fiaas_deploy_daemon import MainBindings, Main, init_k8s_client
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.crd import CustomResourceDefinitionBindings
+from fiaas_deploy_daemon.deployer import DeployerBindings
+from fiaas_deploy_daemon.deployer.kubernetes import K8sAdapterBindings
+from fiaas_deploy_daemon.log_extras import StatusHandler
+from fiaas_deploy_daemon.specs import SpecBindings
+from fiaas_deploy_daemon.usage_reporting import UsageReportingBindings
+from fiaas_deploy_daemon.web import WebBindings
+
+LOG = logging.getLogger(__name__)
+NAMESPACE = "default"
+STARTUP_TIMEOUT = 30
+FINAL_RESULTS = ("SUCCESS", "FAILED")
+SAMPLE_INTERVAL = 0.1
+# Metrics telling how retries, watches and the deploy queue behaved during the benchmark
+DAEMON_METRICS = (
+    "fiaas_upsert_conflict_retry",
+    "fiaas_upsert_conflict_failure",
+    "crd_watch_reconnects",
+    "crd_watch_relists",
+    "deployer_coalesced_events",
+    "deployer_errors",
+    "status_writer_coalesced",
+)
+
+
+class Benchmark(object):
+    def __init__(self, api_server, apps, namespace=NAMESPACE):
+        self._api_server = api_server
+        self._names = ["benchmark-app-{}".format(i) for i in range(apps)]
+        self._namespace = namespace
+        self._created = {}
+        self._finished = {}
+        self._results = {}
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._peak_queue_depth = 0
+        api_server.add_listener(self._handle_change)
+
+    def run(self, timeout):
+        """Create the Applications and wait for them to be deployed, returning the results"""
+        before = self._api_server.calls()
+        for name in self._names:
+            with self._lock:
+                self._created[name] = time_monotonic()
+            self._api_server.create("applications", self._namespace, _application(name, self._namespace))
+        deadline = time_monotonic() + timeout
+        while not self._done.wait(SAMPLE_INTERVAL) and time_monotonic() < deadline:
+            queue_depth = REGISTRY.get_sample_value("deployer_queue_depth") or 0
+            self._peak_queue_depth = max(self._peak_queue_depth, queue_depth)
+        calls = self._api_server.calls()
+        calls.subtract(before)
+        return self._report(calls)
+
+    def _handle_change(self, event_type, plural, obj):
+        if plural != "application-statuses" or obj.get("result") not in FINAL_RESULTS:
+            return
+        name = (obj["metadata"].get("labels") or {}).get("app")
+        with self._lock:
+            if name not in self._created or name in self._finished:
+                return
+            self._finished[name] = time_monotonic()
+            self._results[name] = obj["result"]
+            if len(self._finished) == len(self._names):
+                self._done.set()
+
+    def _report(self, calls):
+        with self._lock:
+            started = min(self._created.values())
+            ready = sorted(self._finished[name] - self._created[name] for name in self._finished)
+            duration = max(self._finished.values()) - started if self._finished else None
+            results = collections.Counter(self._results.values())
+        deployed = len(ready)
+        per_verb = collections.Counter()
+        for (verb, _), count in calls.items():
+            if verb != "WATCH":
+                per_verb[verb] += count
+        return {
+            "apps": len(self._names),
+            "deployed": deployed,
+            "succeeded": results["SUCCESS"],
+            "failed": results["FAILED"],
+            "timed_out": len(self._names) - deployed,
+            "duration_seconds": duration,
+            "throughput_per_second": deployed / duration if duration else None,
+            "time_to_ready_seconds": {
+                "p50": _percentile(ready, 50),
+                "p99": _percentile(ready, 99),
+                "max": ready[-1] if ready else None,
+            },
+            "api_calls_per_deploy": {verb: float(count) / len(self._names) for verb, count in per_verb.items()},
+            "api_calls": {"{} {}".format(verb, plural): count for (verb, plural), count in calls.items() if count},
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "daemon": _daemon_metrics(self._peak_queue_depth),
+        }
+
+
+def _daemon_metrics(peak_queue_depth):
+    metrics = {name: 0 for name in DAEMON_METRICS}
+    for family in REGISTRY.collect():
+        if family.name in metrics:
+            metrics[family.name] = sum(sample.value for sample in family.samples if sample.name.endswith("_total"))
+    metrics["deployer_peak_queue_depth"] = peak_queue_depth
+    return metrics
+
+
+def _application(name, namespace):
+    return {
+        "apiVersion": "fiaas.schibsted.io/v1",
+        "kind": "Application",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "labels": {"app": name, "fiaas/deployment_id": "1"},
+        },
+        "spec": {
+            "application": name,
+            "image": "example.com/{}:1".format(name),
+            "config": {"version": 3},
+        },
+    }
+
+
+def _percentile(values, percentile):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(int(round(percentile / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def _free_port():
+    sock = socket.socket()
+    try:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def _configure(api_server, daemon_args):
+    os.environ.setdefault("NAMESPACE", NAMESPACE)
+    args = ["--api-server", api_server.url, "--port", str(_free_port()), "--enable-crd-support"] + daemon_args
+    cfg = Configuration(args)
+    init_k8s_client(cfg)
+    return cfg
+
+
+def _start_daemon(cfg):
+    binding_specs = [
+        MainBindings(cfg),
+        DeployerBindings(),
+        K8sAdapterBindings(),
+        WebBindings(),
+        SpecBindings(),
+        CustomResourceDefinitionBindings(),
+        UsageReportingBindings(),
+    ]
+    obj_graph = pinject.new_object_graph(modules=None, binding_specs=binding_specs)
+    main = obj_graph.provide(Main)
+    thread = threading.Thread(target=main.run, name="Main")
+    thread.daemon = True
+    thread.start()
+
+
+def _wait_for_watch(api_server, plural):
+    deadline = time_monotonic() + STARTUP_TIMEOUT
+    while api_server.calls()[("WATCH", plural)] == 0:
+        if time_monotonic() > deadline:
+            raise RuntimeError("fiaas-deploy-daemon did not start watching {} within {} seconds".format(
+                plural, STARTUP_TIMEOUT))
+        time.sleep(0.1)
+
+
+def _init_logging(verbose):
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setLevel(logging.INFO if verbose else logging.WARNING)
+    handler.setFormatter(logging.Formatter("[%(asctime)s|%(levelname)7s] %(message)s [%(name)s|%(threadName)s]"))
+    root.addHandler(handler)
+    # Collect logs for ApplicationStatuses, like the daemon does
+    root.addHandler(StatusHandler())
+    logging.getLogger("werkzeug").setLevel(logging.WARN)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", help="Number of Applications to deploy (default: %(default)s)", type=int,
+                        default=100)
+    parser.add_argument("--rollout-delay", help="Seconds before a Deployment becomes ready (default: %(default)s)",
+                        type=float, default=0)
+    parser.add_argument("--timeout", help="Seconds to wait for all Applications (default: %(default)s)", type=float,
+                        default=300)
+    parser.add_argument("--verbose", help="Log from the daemon at INFO level to stderr", action="store_true")
+    parser.add_argument("--scenario-file", help="YAML file with fault injection scenarios")
+    parser.add_argument("--scenario", help="Only run this scenario from the scenario file")
+    parser.add_argument("--seed", help="Seed for the random faults, to make runs repeatable", type=int)
+    args = sys.argv[1:] if args is None else args
+    options, daemon_args = parser.parse_known_args(args)
+    if options.scenario_file and not options.scenario:
+        return _run_scenarios(options.scenario_file, args)
+    _init_logging(options.verbose)
+    # Keep stdout for the results, Flask prints a banner when the web-interface starts
+    output, sys.stdout = sys.stdout, sys.stderr
+    api_server = FakeApiServer(rollout_delay=options.rollout_delay)
+    api_server.start()
+    cfg = _configure(api_server, daemon_args)
+    adapter = None
+    if options.scenario_file:
+        adapter = install(Client._session, load_scenarios(options.scenario_file)[options.scenario], options.seed)
+    _start_daemon(cfg)
+    _wait_for_watch(api_server, "applications")
+    benchmark = Benchmark(api_server, options.apps)
+    results = benchmark.run(options.timeout)
+    if adapter:
+        results["faults"] = {"{} {} {}".format(*key): count for key, count in adapter.faults.items()}
+    json.dump(results, output, indent=2, sort_keys=True)
+    output.write("\n")
+    return 0 if results["timed_out"] == 0 and results["failed"] == 0 else 1
+
+
+def _run_scenarios(scenario_file, args):
+    """Run the benchmark once for each scenario, each in a process of its own, since the daemon can't be stopped"""
+    code = "import sys; from benchmark import main; sys.exit(main(sys.argv[1:]))"
+    results = collections.OrderedDict()
+    for name in load_scenarios(scenario_file):
+        process = subprocess.Popen([sys.executable, "-c", code] + args + ["--scenario", name], stdout=subprocess.PIPE)
+        output, _ = process.communicate()
+        results[name] = json.loads(output) if output else {"error": "exited with {}".format(process.returncode)}
+    json.dump({"scenarios": results}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
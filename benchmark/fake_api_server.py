@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import collections
+import copy
+import datetime
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+
+from monotonic import monotonic as time_monotonic
+from werkzeug.serving import make_server, WSGIRequestHandler
+from werkzeug.wrappers import Request, Response
+
+from fiaas_deploy_daemon.base_thread import DaemonThread
+
+LOG = logging.getLogger(__name__)
+
+RESOURCE_PATH = re.compile(r"^/(?:api/v1|apis/[^/]+/[^/]+)(?P<watch>/watch)?(?:/namespaces/(?P<namespace>[^/]+))?"
+                           r"/(?P<plural>[^/]+)/?(?P<name>[^/]*)$")
+SET_REQUIREMENT = re.compile(r"^(?P<key>\S+)\s+(?P<operator>in|notin)\s+\((?P<values>[^)]*)\)$")
+ROLLED_OUT = frozenset(("deployments",))
+HISTORY = 10000
+WATCH_TIMEOUT = 300
+TICK_INTERVAL = 1
+
+
+class FakeApiServer(object):
+    """An in-process stand-in for the parts of the Kubernetes API used by fiaas-deploy-daemon
+
+    Resources of any kind are kept in memory and can be created, read, updated, deleted, listed and watched, using
+    the same paths as the real API server. Deployments are rolled out as soon as they are written, or after
+    `rollout_delay` seconds, by setting their status to all replicas being available.
+    Every request is counted by verb and resource, so that tests and benchmarks can tell how many API calls were made.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, rollout_delay=0, history=HISTORY):
+        self._rollout_delay = rollout_delay
+        self._objects = {}
+        self._events = collections.deque(maxlen=history)
+        self._expired_version = 0
+        self._resource_version = 0
+        self._condition = threading.Condition()
+        self._listeners = []
+        self._calls = collections.Counter()
+        self._calls_lock = threading.Lock()
+        self._server = make_server(host, port, self, threaded=True, request_handler=_RequestHandler)
+        self._server_thread = None
+        self._ticker = _Ticker(self._condition)
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(self._server.server_address[0], self._server.server_port)
+
+    def start(self):
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="FakeApiServer")
+        self._server_thread.daemon = True
+        self._server_thread.start()
+        self._ticker.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_listener(self, listener):
+        """Call listener with the event type and a copy of the object for every change, as seen by watches"""
+        self._listeners.append(listener)
+
+    def calls(self):
+        """Return a Counter of requests served, keyed by (verb, plural). Watches are counted with the verb WATCH"""
+        with self._calls_lock:
+            return self._calls.copy()
+
+    def get(self, plural, namespace, name):
+        with self._condition:
+            obj = self._objects.get((plural, namespace, name))
+            return copy.deepcopy(obj)
+
+    def create(self, plural, namespace, obj):
+        """Create a resource directly in the store, as another client of the API server would"""
+        with self._condition:
+            if (plural, namespace, obj["metadata"]["name"]) in self._objects:
+                raise ValueError("{} {}/{} already exists".format(plural, namespace, obj["metadata"]["name"]))
+            return copy.deepcopy(self._create(plural, namespace, copy.deepcopy(obj)))
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        response = self._dispatch(request)
+        return response(environ, start_response)
+
+    def _dispatch(self, request):
+        match = RESOURCE_PATH.match(request.path)
+        if not match:
+            return _status(404, "NotFound", "the server could not find the requested resource")
+        plural, namespace, name = match.group("plural", "namespace", "name")
+        watch = bool(match.group("watch")) or request.args.get("watch") in ("true", "1")
+        selector = _parse_selector(request.args.get("labelSelector", ""))
+        verb = "WATCH" if watch else request.method
+        with self._calls_lock:
+            self._calls[(verb, plural)] += 1
+        if watch:
+            return self._watch(plural, namespace, selector, request.args.get("resourceVersion"),
+                               int(request.args.get("timeoutSeconds", WATCH_TIMEOUT)))
+        with self._condition:
+            if request.method == "GET" and name:
+                return self._read(plural, namespace, name)
+            elif request.method == "GET":
+                return self._list(plural, namespace, selector, int(request.args.get("limit", 0)),
+                                  request.args.get("continue"))
+            elif request.method == "POST" and not name:
+                return self._post(plural, namespace, _body(request))
+            elif request.method == "PUT" and name:
+                return self._replace(plural, namespace, name, _body(request))
+            elif request.method == "DELETE" and name:
+                return self._delete(plural, namespace, name)
+            elif request.method == "DELETE":
+                return self._delete_collection(plural, namespace, selector)
+        return _status(405, "MethodNotAllowed", "the server does not allow this method on the requested resource")
+
+    def _read(self, plural, namespace, name):
+        obj = self._objects.get((plural, namespace, name))
+        if obj is None:
+            return _not_found(plural, name)
+        return _json(200, obj)
+
+    def _list(self, plural, namespace, selector, limit, token):
+        """List in pages of limit items, continuing after the offset in token
+
+        Pages are not taken from a snapshot like the real API server does, but a token is still expired along with
+        the resourceVersion it was given at.
+        """
+        resource_version, offset = self._resource_version, 0
+        if token:
+            resource_version, offset = (int(part) for part in token.split(":"))
+            if resource_version < self._expired_version:
+                return _json(410, _gone(str(resource_version)))
+        items = sorted(self._matching(plural, namespace, selector),
+                       key=lambda obj: (obj["metadata"]["namespace"], obj["metadata"]["name"]))
+        metadata = {"resourceVersion": str(resource_version)}
+        if limit and offset + limit < len(items):
+            metadata["continue"] = "{}:{}".format(resource_version, offset + limit)
+            items = items[offset:offset + limit]
+        else:
+            items = items[offset:]
+        return _json(200, {
+            "kind": "List",
+            "apiVersion": "v1",
+            "metadata": metadata,
+            "items": items,
+        })
+
+    def _post(self, plural, namespace, obj):
+        metadata = obj.setdefault("metadata", {})
+        namespace = namespace or metadata.get("namespace")
+        name = metadata.get("name")
+        if (plural, namespace, name) in self._objects:
+            return _status(409, "AlreadyExists", '{} "{}" already exists'.format(plural, name))
+        return _json(201, self._create(plural, namespace, obj))
+
+    def _create(self, plural, namespace, obj):
+        metadata = obj.setdefault("metadata", {})
+        namespace = namespace or metadata.get("namespace")
+        name = metadata["name"]
+        metadata.update(namespace=namespace, uid=str(uuid.uuid4()), generation=1,
+                        creationTimestamp=datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"))
+        self._store(plural, namespace, name, obj, "ADDED")
+        return obj
+
+    def _replace(self, plural, namespace, name, obj):
+        current = self._objects.get((plural, namespace, name))
+        if current is None:
+            return _not_found(plural, name)
+        metadata = obj.setdefault("metadata", {})
+        resource_version = metadata.get("resourceVersion")
+        if resource_version and resource_version != current["metadata"]["resourceVersion"]:
+            return _status(409, "Conflict", 'Operation cannot be fulfilled on {} "{}": the object has been modified; '
+                                            'please apply your changes to the latest version and try again'
+                                            .format(plural, name))
+        for key in ("namespace", "uid", "creationTimestamp", "generation"):
+            metadata[key] = current["metadata"][key]
+        if obj.get("spec") != current.get("spec"):
+            metadata["generation"] += 1
+        if "status" in current and plural in ROLLED_OUT:
+            obj["status"] = current["status"]
+        self._store(plural, namespace, name, obj, "MODIFIED")
+        return _json(200, obj)
+
+    def _delete(self, plural, namespace, name):
+        obj = self._objects.pop((plural, namespace, name), None)
+        if obj is None:
+            return _not_found(plural, name)
+        self._record("DELETED", plural, namespace, obj)
+        return _json(200, {"kind": "Status", "apiVersion": "v1", "status": "Success"})
+
+    def _delete_collection(self, plural, namespace, selector):
+        for obj in list(self._matching(plural, namespace, selector)):
+            del self._objects[(plural, obj["metadata"]["namespace"], obj["metadata"]["name"])]
+            self._record("DELETED", plural, obj["metadata"]["namespace"], obj)
+        return _json(200, {"kind": "Status", "apiVersion": "v1", "status": "Success"})
+
+    def _store(self, plural, namespace, name, obj, event_type):
+        if plural in ROLLED_OUT and not self._rollout_delay:
+            _roll_out(obj)
+        self._objects[(plural, namespace, name)] = obj
+        self._record(event_type, plural, namespace, obj)
+        if plural in ROLLED_OUT and self._rollout_delay:
+            timer = threading.Timer(self._rollout_delay, self._delayed_rollout,
+                                    args=(plural, namespace, name, obj["metadata"]["generation"]))
+            timer.daemon = True
+            timer.start()
+
+    def _delayed_rollout(self, plural, namespace, name, generation):
+        with self._condition:
+            obj = self._objects.get((plural, namespace, name))
+            if obj is None or obj["metadata"]["generation"] != generation:
+                return
+            obj = copy.deepcopy(obj)
+            _roll_out(obj)
+            self._objects[(plural, namespace, name)] = obj
+            self._record("MODIFIED", plural, namespace, obj)
+
+    def _record(self, event_type, plural, namespace, obj):
+        """Give obj a new resourceVersion, and pass the change on to watches and listeners. Holds the condition"""
+        self._resource_version += 1
+        obj["metadata"]["resourceVersion"] = str(self._resource_version)
+        if len(self._events) == self._events.maxlen:
+            self._expired_version = self._events[0][0]
+        self._events.append((self._resource_version, plural, namespace, event_type, obj))
+        self._condition.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(event_type, plural, copy.deepcopy(obj))
+            except Exception:
+                LOG.exception("Error in listener for %s on %s", event_type, plural)
+
+    def _matching(self, plural, namespace, selector):
+        for (kind, ns, _), obj in self._objects.items():
+            if kind == plural and namespace in (None, ns) and _selected(obj, selector):
+                yield obj
+
+    def _watch(self, plural, namespace, selector, resource_version, timeout):
+        with self._condition:
+            if resource_version and int(resource_version) < self._expired_version:
+                return _json(410, _gone(resource_version))
+            if resource_version:
+                initial, last_seen = [], int(resource_version)
+            else:
+                initial, last_seen = list(self._matching(plural, namespace, selector)), self._resource_version
+        stream = self._stream(plural, namespace, selector, initial, last_seen, timeout)
+        return Response(_chunked(stream), status=200, mimetype="application/json",
+                        headers={"Transfer-Encoding": "chunked"}, direct_passthrough=True)
+
+    def _stream(self, plural, namespace, selector, initial, last_seen, timeout):
+        for obj in initial:
+            yield _event_line("ADDED", obj)
+        deadline = time_monotonic() + timeout
+        while time_monotonic() < deadline:
+            with self._condition:
+                if last_seen < self._expired_version:
+                    yield _event_line("ERROR", _gone(last_seen))
+                    return
+                while self._resource_version == last_seen and time_monotonic() < deadline:
+                    # Woken at least every TICK_INTERVAL by the ticker, since Condition.wait with a timeout polls
+                    self._condition.wait()
+                events = [event for event in self._events if event[0] > last_seen]
+                last_seen = self._resource_version
+            for _, kind, ns, event_type, obj in events:
+                if kind == plural and namespace in (None, ns) and _selected(obj, selector):
+                    yield _event_line(event_type, obj)
+
+
+class _RequestHandler(WSGIRequestHandler):
+    """Keep connections alive between requests, and allow chunked responses, like the real API server"""
+    protocol_version = "HTTP/1.1"
+
+
+class _Ticker(DaemonThread):
+    """Wake up watches regularly, so they notice when their timeout has passed"""
+
+    def __init__(self, condition):
+        super(_Ticker, self).__init__()
+        self._condition = condition
+
+    def __call__(self):
+        while True:
+            time.sleep(TICK_INTERVAL)
+            with self._condition:
+                self._condition.notify_all()
+
+
+def _chunked(lines):
+    """The development server doesn't encode chunks, but clients only read watch events as they arrive when chunked"""
+    for line in lines:
+        yield "{:x}\r\n{}\r\n".format(len(line), line)
+    yield "0\r\n\r\n"
+
+
+def _roll_out(deployment):
+    replicas = deployment.get("spec", {}).get("replicas", 1)
+    deployment["status"] = {
+        "observedGeneration": deployment["metadata"]["generation"],
+        "replicas": replicas,
+        "updatedReplicas": replicas,
+        "availableReplicas": replicas,
+        "readyReplicas": replicas,
+    }
+
+
+def _parse_selector(selector):
+    """Parse a label selector into a list of (key, operator, values)"""
+    requirements = []
+    for requirement in _split_selector(selector):
+        match = SET_REQUIREMENT.match(requirement)
+        if match:
+            values = [value.strip() for value in match.group("values").split(",")]
+            requirements.append((match.group("key"), match.group("operator"), values))
+        elif "!=" in requirement:
+            key, value = requirement.split("!=", 1)
+            requirements.append((key.strip(), "!=", [value.strip()]))
+        elif "=" in requirement:
+            key, value = requirement.replace("==", "=").split("=", 1)
+            requirements.append((key.strip(), "=", [value.strip()]))
+        elif requirement.startswith("!"):
+            requirements.append((requirement[1:].strip(), "!", []))
+        else:
+            requirements.append((requirement, "exists", []))
+    return requirements
+
+
+def _split_selector(selector):
+    """Split on the commas between requirements, but not those in the value sets of in and notin"""
+    parts, depth, current = [], 0, ""
+    for char in selector:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _selected(obj, selector):
+    labels = obj.get("metadata", {}).get("labels") or {}
+    for key, operator, values in selector:
+        if operator == "exists" and key not in labels:
+            return False
+        if operator == "!" and key in labels:
+            return False
+        if operator in ("=", "in") and labels.get(key) not in values:
+            return False
+        if operator in ("!=", "notin") and labels.get(key) in values:
+            return False
+    return True
+
+
+def _body(request):
+    return json.loads(request.get_data(as_text=True))
+
+
+def _json(code, data):
+    return Response(json.dumps(data), status=code, mimetype="application/json")
+
+
+def _event_line(event_type, obj):
+    return json.dumps({"type": event_type, "object": obj}) + "\n"
+
+
+def _status(code, reason, message):
+    return _json(code, {"kind": "Status", "apiVersion": "v1", "metadata": {}, "status": "Failure",
+                        "message": message, "reason": reason, "code": code})
+
+
+def _not_found(plural, name):
+    return _status(404, "NotFound", '{} "{}" not found'.format(plural, name))
+
+
+def _gone(resource_version):
+    return {"kind": "Status", "apiVersion": "v1", "metadata": {}, "status": "Failure", "reason": "Expired",
+            "message": "too old resource version: {}".format(resource_version), "code": 410}
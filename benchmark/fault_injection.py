@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Slow down and break the requests made to the API server, to see how fiaas-deploy-daemon copes
+
+A scenario file is a YAML document with a list of named scenarios. Each scenario has a list of rules, and the first
+rule matching the verb and kind of a request decides what happens to it::
+
+    scenarios:
+      - name: conflicts
+        rules:
+          - verbs: [PUT]
+            kinds: [deployments, services]
+            latency: {distribution: exponential, mean: 0.02}
+            error_rate: 0.2
+            errors: {409: 1}
+          - verbs: [WATCH]
+            disconnect_after: {distribution: uniform, min: 1, max: 10}
+
+Verbs are HTTP methods, or WATCH for watches. Kinds are the plural resource names used in the API paths. Rules
+without verbs or kinds match all of them. Latencies and disconnects are given as a number of seconds, or a
+distribution: constant (value), uniform (min, max), exponential (mean) or normal (mean, stddev). Failed requests get
+a status code drawn from `errors`, weighted by the given numbers, and are not sent to the API server. Watches are
+disconnected by asking the API server to end them after the given number of seconds.
+"""
+from __future__ import absolute_import
+
+import collections
+import json
+import random
+import threading
+import time
+
+import requests
+import yaml
+from k8s import config
+from requests.adapters import BaseAdapter, HTTPAdapter
+from six.moves.http_client import responses
+from six.moves.urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from fiaas_deploy_daemon.tools import api_resource_kind
+
+WATCH = "WATCH"
+# Missing from httplib on Python 2
+REASONS = {429: "Too Many Requests"}
+
+
+class Distribution(object):
+    SAMPLERS = {
+        "constant": lambda rng, value: value,
+        "uniform": lambda rng, min, max: rng.uniform(min, max),
+        "exponential": lambda rng, mean: rng.expovariate(1.0 / mean),
+        "normal": lambda rng, mean, stddev: max(rng.gauss(mean, stddev), 0),
+    }
+
+    def __init__(self, spec):
+        if isinstance(spec, (int, float)):
+            spec = {"distribution": "constant", "value": spec}
+        params = dict(spec)
+        self._name = params.pop("distribution", "constant")
+        if self._name not in self.SAMPLERS:
+            raise ValueError("Unknown distribution {!r}, use one of {}".format(
+                self._name, ", ".join(sorted(self.SAMPLERS))))
+        self._params = params
+
+    def sample(self, rng):
+        return self.SAMPLERS[self._name](rng, **self._params)
+
+
+class Rule(object):
+    def __init__(self, verbs=None, kinds=None, latency=None, error_rate=0, errors=None, disconnect_after=None):
+        self._verbs = frozenset(verb.upper() for verb in verbs) if verbs else None
+        self._kinds = frozenset(kinds) if kinds else None
+        self._latency = Distribution(latency) if latency is not None else None
+        self._error_rate = error_rate
+        self._errors = sorted((int(code), weight) for code, weight in (errors or {500: 1}).items())
+        self._disconnect_after = Distribution(disconnect_after) if disconnect_after is not None else None
+
+    def matches(self, verb, kind):
+        return (self._verbs is None or verb in self._verbs) and (self._kinds is None or kind in self._kinds)
+
+    def latency(self, rng):
+        return self._latency.sample(rng) if self._latency else 0
+
+    def error(self, rng):
+        """Return the status code to fail with, or None"""
+        if rng.random() >= self._error_rate:
+            return None
+        point = rng.uniform(0, sum(weight for _, weight in self._errors))
+        for code, weight in self._errors:
+            point -= weight
+            if point <= 0:
+                return code
+        return self._errors[-1][0]
+
+    def disconnect_after(self, rng):
+        return max(int(round(self._disconnect_after.sample(rng))), 1) if self._disconnect_after else None
+
+
+class Scenario(object):
+    def __init__(self, name, rules):
+        self.name = name
+        self._rules = rules
+
+    def rule_for(self, verb, kind):
+        for rule in self._rules:
+            if rule.matches(verb, kind):
+                return rule
+        return None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], [Rule(**rule) for rule in data.get("rules", [])])
+
+
+def load_scenarios(path):
+    """Return the scenarios in the file at path, by name, in the order they are given"""
+    with open(path) as fobj:
+        data = yaml.safe_load(fobj)
+    scenarios = collections.OrderedDict()
+    for item in data.get("scenarios", []):
+        scenario = Scenario.from_dict(item)
+        scenarios[scenario.name] = scenario
+    return scenarios
+
+
+class FaultInjectingAdapter(BaseAdapter):
+    """A transport adapter for requests, which applies a Scenario to every request before passing it on to transport
+
+    Mount it on the session of the k8s client with `install`. The faults injected are counted in `faults`, keyed by
+    (verb, kind, fault), where fault is "latency", "disconnect" or the status code returned.
+    """
+
+    def __init__(self, scenario, seed=None, sleep=time.sleep, transport=None):
+        super(FaultInjectingAdapter, self).__init__()
+        self._transport = transport or HTTPAdapter()
+        self._scenario = scenario
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.faults = collections.Counter()
+
+    def send(self, request, **kwargs):
+        verb, kind = _classify(request)
+        rule = self._scenario.rule_for(verb, kind)
+        if rule is None:
+            return self._transport.send(request, **kwargs)
+        with self._lock:
+            latency = rule.latency(self._random)
+            error = rule.error(self._random)
+            disconnect_after = rule.disconnect_after(self._random) if verb == WATCH else None
+        if latency:
+            self._count(verb, kind, "latency")
+            self._sleep(latency)
+        if error:
+            self._count(verb, kind, error)
+            return _error_response(request, error)
+        if disconnect_after:
+            self._count(verb, kind, "disconnect")
+            request.url = _with_timeout(request.url, disconnect_after)
+        return self._transport.send(request, **kwargs)
+
+    def close(self):
+        self._transport.close()
+
+    def _count(self, verb, kind, fault):
+        with self._lock:
+            self.faults[(verb, kind, fault)] += 1
+
+
+def install(session, scenario, seed=None):
+    """Send all requests made with session through a FaultInjectingAdapter for scenario, and return the adapter
+
+    The requests are passed on to the adapter already mounted for the API server, to keep its timeouts.
+    """
+    adapter = FaultInjectingAdapter(scenario, seed, transport=session.get_adapter(config.api_server))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter
+
+
+def _classify(request):
+    path_url = request.path_url
+    verb = WATCH if "watch=true" in path_url or "/watch/" in path_url else request.method
+    return verb, api_resource_kind(path_url)
+
+
+def _with_timeout(url, seconds):
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    params = [(key, value) for key, value in parse_qsl(query) if key != "timeoutSeconds"]
+    params.append(("timeoutSeconds", str(seconds)))
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+
+def _error_response(request, status_code):
+    reason = REASONS.get(status_code) or responses.get(status_code, "Unknown")
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.reason = reason
+    resp.url = request.url
+    resp.request = request
+    resp.encoding = "utf-8"
+    resp.headers["Content-Type"] = "application/json"
+    if status_code == 429:
+        resp.headers["Retry-After"] = "1"
+    resp._content = json.dumps({
+        "kind": "Status",
+        "apiVersion": "v1",
+        "metadata": {},
+        "status": "Failure",
+        "message": "Injected fault: {} {}".format(status_code, reason),
+        "reason": reason.replace(" ", ""),
+        "code": status_code,
+    })
+    return resp
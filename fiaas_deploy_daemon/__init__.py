@@ -17,39 +17,40 @@
 from __future__ import absolute_import
 
 import logging
+import os
 import signal
-import sys
-import threading
-import traceback
-from Queue import Queue
 
 import pinject
 import requests
 from k8s import config as k8s_config
+from k8s.client import Client
 
+from . import deadline, informer
 from .config import Configuration
 from .crd import CustomResourceDefinitionBindings, DisabledCustomResourceDefinitionBindings
 from .deployer import DeployerBindings
 from .deployer.kubernetes import K8sAdapterBindings
+from .leader_election import LeaderElector, NoElection
 from .lifecycle import Lifecycle
 from .logsetup import init_logging
 from .secrets import resolve_secrets
+from .sharding import ShardManager, Unsharded
 from .specs import SpecBindings
-from .tools import log_request_response
+from .tools import log_request_response, log_thread_stacks
 from .usage_reporting import UsageReportingBindings
+from .watchdog import Watchdog
 from .web import WebBindings
 
 
 class MainBindings(pinject.BindingSpec):
     def __init__(self, config):
         self._config = config
-        self._deploy_queue = Queue()
 
     def configure(self, bind):
         bind("config", to_instance=self._config)
-        bind("deploy_queue", to_instance=self._deploy_queue)
         bind("health_check", to_class=HealthCheck)
         bind("lifecycle", to_class=Lifecycle)
+        bind("watchdog", to_class=Watchdog)
 
     def provide_session(self, config):
         session = requests.Session()
@@ -65,34 +66,70 @@ class MainBindings(pinject.BindingSpec):
     def provide_secrets(self, config):
         return resolve_secrets(config.secrets_directory)
 
+    def provide_shard_manager(self, config):
+        if config.shards:
+            return ShardManager(config)
+        return Unsharded()
+
+    def provide_leader_elector(self, config):
+        if config.leader_election:
+            return LeaderElector(config)
+        return NoElection()
+
 
 class HealthCheck(object):
     @pinject.copy_args_to_internal_fields
-    def __init__(self, deployer, scheduler, crd_watcher, usage_reporter):
+    def __init__(self, deployer, scheduler, resource_cache, quota_cache, crd_watcher, status_index, status_writer,
+                 status_cleaner, usage_reporter, shard_manager, leader_elector, watchdog):
         pass
 
     def is_healthy(self):
         return all((
             self._deployer.is_alive(),
             self._scheduler.is_alive(),
+            self._resource_cache.is_alive(),
+            self._quota_cache.is_alive(),
             self._crd_watcher.is_alive(),
+            self._status_index.is_alive(),
+            self._status_writer.is_alive(),
+            self._status_cleaner.is_alive(),
             self._usage_reporter.is_alive(),
+            self._shard_manager.is_alive(),
+            self._leader_elector.is_alive(),
+            self._leader_elector.is_healthy(),
+            self._watchdog.is_alive(),
+            self._watchdog.is_healthy(),
         ))
 
 
 class Main(object):
     @pinject.copy_args_to_internal_fields
-    def __init__(self, deployer, scheduler, webapp, config, crd_watcher, usage_reporter):
+    def __init__(self, deployer, scheduler, resource_cache, quota_cache, webapp, config, crd_watcher, status_index,
+                 status_writer, status_cleaner, usage_reporter, shard_manager, leader_elector, watchdog):
         pass
 
     def run(self):
         self._deployer.start()
         self._scheduler.start()
+        self._resource_cache.start()
+        self._quota_cache.start()
+        self._status_index.start()
+        self._status_writer.start()
+        self._status_cleaner.start()
+        self._shard_manager.start()
+        self._leader_elector.start()
         self._crd_watcher.start()
         self._usage_reporter.start()
+        self._watchdog.start()
         # Run web-app in main thread
         self._webapp.run("0.0.0.0", self._config.port)
 
+    def resign(self, signum, frame):
+        """Give up the leadership on SIGTERM, so a standby takes over without waiting for the lease to expire"""
+        self._leader_elector.resign()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
 
 def init_k8s_client(config):
     k8s_config.api_server = config.api_server
@@ -104,15 +141,15 @@ def init_k8s_client(config):
     if config.client_cert:
         k8s_config.cert = (config.client_cert, config.client_key)
     k8s_config.debug = config.debug
+    k8s_config.stream_timeout = config.api_watch_timeout
+    informer.list_page_size = config.api_list_page_size
+    deadline.install(Client._session, config.api_connect_timeout, config.api_read_timeout)
 
 
 def thread_dump_logger(log):
     def _dump_threads(signum, frame):
         log.info("Received signal %s, dumping thread stacks", signum)
-        thread_names = {t.ident: t.name for t in threading.enumerate()}
-        for thread_ident, frame in sys._current_frames().items():
-            log.info("Thread ident=0x%x name=%s", thread_ident, thread_names.get(thread_ident, "unknown"))
-            log.info("".join(traceback.format_stack(frame)))
+        log_thread_stacks(log)
 
     return _dump_threads
 
@@ -135,7 +172,9 @@ def main():
             UsageReportingBindings(),
         ]
         obj_graph = pinject.new_object_graph(modules=None, binding_specs=binding_specs)
-        obj_graph.provide(Main).run()
+        daemon = obj_graph.provide(Main)
+        signal.signal(signal.SIGTERM, daemon.resign)
+        daemon.run()
     except BaseException:
         log.exception("General failure! Inspect traceback and make the code better!")
 
@@ -15,13 +15,22 @@ import logging
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from contextlib import contextmanager
 from threading import Thread
 
+from monotonic import monotonic as time_monotonic
+
 
 class DaemonThread(Thread):
+    """A daemon thread, which logs any error that ends it
+
+    Subclasses wrap each unit of work in `working_on`, so a watchdog can tell what the thread is doing, and for how long.
+    """
+
     def __init__(self):
         super(DaemonThread, self).__init__(None, self._logging_target, self._make_name())
         self.daemon = True
+        self._work = None
 
     def _logging_target(self):
         log = logging.getLogger()
@@ -33,5 +42,21 @@ class DaemonThread(Thread):
     def _make_name(self):
         return self.__class__.__name__
 
+    @contextmanager
+    def working_on(self, item):
+        self._work = (item, time_monotonic())
+        try:
+            yield
+        finally:
+            self._work = None
+
+    def current_work(self):
+        """Return the item the thread is working on and the seconds spent on it so far, or None when idle"""
+        work = self._work
+        if work is None:
+            return None
+        item, started = work
+        return item, time_monotonic() - started
+
     def __call__(self, *args, **kwargs):
         raise NotImplementedError("Subclass must implement this method")
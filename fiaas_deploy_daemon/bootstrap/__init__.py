@@ -18,7 +18,6 @@ from __future__ import absolute_import
 
 import logging
 import sys
-from Queue import Queue
 
 import pinject
 import requests
@@ -26,23 +25,29 @@ import requests
 from .bootstrapper import Bootstrapper
 from .. import init_k8s_client
 from ..config import Configuration
+from ..crd.status import StatusWriter
+from ..crd.status_index import StatusIndex
 from ..deployer import DeployerBindings
 from ..deployer.kubernetes import K8sAdapterBindings
+from ..leader_election import NoElection
 from ..lifecycle import Lifecycle
 from ..logsetup import init_logging
+from ..sharding import Unsharded
 from ..specs import SpecBindings
 
 
 class MainBindings(pinject.BindingSpec):
     def __init__(self, config):
         self._config = config
-        self._deploy_queue = Queue()
 
     def configure(self, bind):
         bind("config", to_instance=self._config)
-        bind("deploy_queue", to_instance=self._deploy_queue)
         bind("bootstrapper", to_class=Bootstrapper)
+        bind("status_index", to_class=StatusIndex)
+        bind("status_writer", to_class=StatusWriter)
         bind("lifecycle", to_class=Lifecycle)
+        bind("shard_manager", to_class=Unsharded)
+        bind("leader_elector", to_class=NoElection)
 
     def provide_session(self, config):
         session = requests.Session()
@@ -56,13 +61,18 @@ class MainBindings(pinject.BindingSpec):
 
 class Main(object):
     @pinject.copy_args_to_internal_fields
-    def __init__(self, deployer, scheduler, config, bootstrapper):
+    def __init__(self, deployer, scheduler, resource_cache, quota_cache, config, status_writer, bootstrapper):
         pass
 
     def run(self):
         self._deployer.start()
         self._scheduler.start()
-        if not self._bootstrapper.run():
+        self._resource_cache.start()
+        self._quota_cache.start()
+        self._status_writer.start()
+        bootstrapped = self._bootstrapper.run()
+        self._status_writer.flush()
+        if not bootstrapped:
             sys.exit(1)
 
 
@@ -20,14 +20,15 @@ import logging
 import threading
 import time
 
-from blinker import signal
 from monotonic import monotonic as time_monotonic
 from yaml import YAMLError
 
 from ..config import InvalidConfigurationException
 from ..crd.types import FiaasApplication
 from ..deployer import DeployerEvent
-from ..lifecycle import DEPLOY_STATUS_CHANGED, STATUS_SUCCESS
+from ..deployer.deploy_queue import priority_of
+from ..informer import iter_resources
+from ..lifecycle import STATUS_SUCCESS, OVERFLOW_COALESCE, subscribe
 from ..log_extras import set_extras
 from ..specs.factory import InvalidConfiguration
 
@@ -66,16 +67,15 @@ class Bootstrapper(object):
 
         if config.enable_crd_support:
             self._resource_class = FiaasApplication
-            from ..crd.status import connect_signals
         else:
             raise InvalidConfigurationException(
                 "Custom Resource Definition support must be enabled when bootstrapping")
-        connect_signals()
-        signal(DEPLOY_STATUS_CHANGED).connect(self._store_status)
+        # Only the latest status of each application is collected
+        subscribe("Bootstrapper", self._store_status, config.lifecycle_queue_size, OVERFLOW_COALESCE,
+                  key=lambda subject: (subject.app_name, subject.namespace))
 
     def run(self):
-        for application in self._resource_class.find(name=None, namespace=self._namespace,
-                                                     labels={"fiaas/bootstrap": "true"}):
+        for application in iter_resources(self._resource_class, self._namespace, {"fiaas/bootstrap": "true"}):
             try:
                 self._deploy(application)
             except BaseException:
@@ -118,7 +118,7 @@ class Bootstrapper(object):
                 additional_annotations=application.spec.additional_annotations,
             )
             self._store_status(None, DEPLOY_SCHEDULED, lifecycle_subject)
-            self._deploy_queue.put(DeployerEvent("UPDATE", app_spec, lifecycle_subject))
+            self._deploy_queue.put(DeployerEvent("UPDATE", app_spec, lifecycle_subject, priority_of(application.metadata)))
             LOG.debug("Queued deployment for %s in namespace %s", application.spec.application,
                       application.metadata.namespace)
         except (YAMLError, InvalidConfiguration):
@@ -17,10 +17,13 @@
 import logging
 import os
 import re
-from argparse import Namespace
+from argparse import Namespace, ArgumentTypeError
 
 import configargparse
 
+from .informer import DEFAULT_PAGE_SIZE
+from .log_extras import DEFAULT_MAX_LINES, DEFAULT_MAX_BYTES, DEFAULT_TTL
+
 DEFAULT_CONFIG_FILE = "/var/run/config/fiaas/cluster_config.yaml"
 DEFAULT_SECRETS_DIR = "/var/run/secrets/fiaas/"
 
@@ -207,6 +210,46 @@ class Configuration(Namespace):
         parser.add_argument("--ready-check-timeout-multiplier", type=int,
                             help="Multiply default ready check timeout (replicas * initialDelaySeconds) with this " +
                                  "number of seconds  (default: %(default)s)", default=10)
+        parser.add_argument("--deploy-workers", type=_positive_int,
+                            help="Number of applications to deploy in parallel (default: %(default)s)", default=4)
+        parser.add_argument("--namespace-weight", default=[], action="append", type=_namespace_weight,
+                            dest="namespace_weights",
+                            help="Number of deploys in a row a namespace gets when namespaces take turns in the deploy "
+                                 "queue, given as namespace=weight. Namespaces not listed have weight 1")
+        parser.add_argument("--scheduler-workers", type=_positive_int,
+                            help="Number of threads used to run scheduled tasks, like ready checks. "
+                                 "With 1, tasks are run by the scheduler itself (default: %(default)s)", default=1)
+        parser.add_argument("--shards", type=_non_negative_int,
+                            help="Number of shards to share Applications between replicas of the daemon. "
+                                 "With 0, this replica handles all Applications (default: %(default)s)", default=0)
+        parser.add_argument("--shard-lease-duration", type=_positive_int,
+                            help="Seconds a replica holds a shard without renewing it, before other replicas take "
+                                 "it over (default: %(default)s)", default=15)
+        parser.add_argument("--replica-id", help="Name of this replica, unique among the replicas sharing shards "
+                                                 "or electing a leader (default: the host name)", default=None)
+        parser.add_argument("--leader-election", help="Elect one replica to deploy, while the others stand by",
+                            action="store_true")
+        parser.add_argument("--leader-lease-duration", type=_positive_int,
+                            help="Seconds the leader holds the leadership without renewing it, before a standby "
+                                 "takes over (default: %(default)s)", default=15)
+        parser.add_argument("--status-cleanup-interval", type=_positive_int,
+                            help="Seconds between each clean up of old ApplicationStatuses (default: %(default)s)",
+                            default=300)
+        parser.add_argument("--statuses-to-keep", type=_positive_int,
+                            help="Number of ApplicationStatuses to keep for each application (default: %(default)s)",
+                            default=10)
+        parser.add_argument("--status-log-lines", type=_positive_int,
+                            help="Number of log messages to keep in the ApplicationStatus of each deployment "
+                                 "(default: %(default)s)", default=DEFAULT_MAX_LINES)
+        parser.add_argument("--status-log-bytes", type=_positive_int,
+                            help="Bytes of log messages to hold for ApplicationStatuses of all deployments, before the "
+                                 "least recently updated are dropped (default: %(default)s)", default=DEFAULT_MAX_BYTES)
+        parser.add_argument("--status-log-ttl", type=_positive_int,
+                            help="Seconds to hold log messages for a deployment that is no longer logged to "
+                                 "(default: %(default)s)", default=DEFAULT_TTL)
+        parser.add_argument("--lifecycle-queue-size", type=_positive_int,
+                            help="Number of deploy status changes each subscriber can fall behind before the overflow "
+                                 "policy of the subscriber applies (default: %(default)s)", default=1000)
         parser.add_argument("--disable-pipeline-consumer", help=DISABLE_PIPELINE_CONSUMER_HELP,
                             action="store_true")
         parser.add_argument("--disable-deprecated-managed-env-vars", help=DISABLE_DEPRECATED_MANAGED_ENV_VARS,
@@ -221,12 +264,54 @@ class Configuration(Namespace):
         usage_reporting_parser.add_argument("--usage-reporting-team",
                                             help="""Name of team that is responsible for components deployed \
                                                  "by the fiaas-deploy-daemon instance""")
+        usage_reporting_parser.add_argument("--usage-reporting-batch-size", type=_positive_int,
+                                            help="Number of events to send in each request. With more than 1, a list "
+                                                 "of events is sent (default: %(default)s)", default=1)
+        usage_reporting_parser.add_argument("--usage-reporting-batch-delay", type=_positive_int,
+                                            help="Milliseconds to wait for a batch to fill before sending it "
+                                                 "(default: %(default)s)", default=1000)
+        usage_reporting_parser.add_argument("--usage-reporting-workers", type=_positive_int,
+                                            help="Number of requests to send in parallel (default: %(default)s)",
+                                            default=2)
+        usage_reporting_parser.add_argument("--usage-reporting-spool-dir",
+                                            help="Directory to keep events in until they are sent, so they survive a "
+                                                 "restart (default: keep them in memory)", default=None)
+        usage_reporting_parser.add_argument("--usage-reporting-spool-size", type=_positive_int,
+                                            help="Number of events to keep before dropping the oldest "
+                                                 "(default: %(default)s)", default=10000)
+        usage_reporting_parser.add_argument("--usage-reporting-overflow", choices=("block", "drop-oldest"),
+                                            help="What to do with a new event when the usage reporter is "
+                                                 "lifecycle-queue-size events behind: make the deploy wait, or drop "
+                                                 "the oldest event (default: %(default)s)", default="block")
         api_parser = parser.add_argument_group("API server")
         api_parser.add_argument("--api-server", help="Address of the api-server to use (IP or name)",
                                 default="https://kubernetes.default.svc.cluster.local")
         api_parser.add_argument("--api-token", help="Token to use (default: lookup from service account)", default=None)
         api_parser.add_argument("--api-cert", help="API server certificate (default: lookup from service account)",
                                 default=None)
+        api_parser.add_argument("--api-connect-timeout", type=_positive_float,
+                                help="Seconds to wait for a connection to the API server (default: %(default)s)",
+                                default=5)
+        api_parser.add_argument("--api-read-timeout", type=_positive_float,
+                                help="Seconds to wait for a response from the API server (default: %(default)s)",
+                                default=20)
+        api_parser.add_argument("--api-watch-timeout", type=_positive_int,
+                                help="Seconds before a watch is ended and resumed (default: %(default)s)", default=300)
+        api_parser.add_argument("--api-list-page-size", type=_positive_int,
+                                help="Number of resources to fetch in each request when listing (default: %(default)s)",
+                                default=DEFAULT_PAGE_SIZE)
+        parser.add_argument("--deploy-timeout", type=_positive_int,
+                            help="Seconds a single deploy may spend calling the API server before it is failed "
+                                 "(default: %(default)s)", default=300)
+        parser.add_argument("--stuck-deploy-timeout", type=_positive_int,
+                            help="Seconds a deploy worker may work on one deploy before it is replaced "
+                                 "(default: %(default)s)", default=600)
+        parser.add_argument("--stuck-watch-timeout", type=_positive_int,
+                            help="Seconds a single watch may last before fiaas-deploy-daemon is reported as unhealthy "
+                                 "(default: %(default)s)", default=900)
+        parser.add_argument("--max-deploy-queue-lag", type=_positive_int,
+                            help="Seconds an application may wait in the deploy queue before fiaas-deploy-daemon is "
+                                 "reported as unhealthy (default: %(default)s)", default=1800)
         client_cert_parser = parser.add_argument_group("Client certificate")
         client_cert_parser.add_argument("--client-cert", help="Client certificate to use", default=None)
         client_cert_parser.add_argument("--client-key", help="Client certificate key to use", default=None)
@@ -247,9 +332,12 @@ class Configuration(Namespace):
                                                    help="Images to use for secret init-containers by key",
                                                    action="append", type=KeyValue, dest="secret_init_containers")
         parser.parse_args(args, namespace=self)
+        if self.leader_election and self.shards:
+            parser.error("--leader-election can not be combined with --shards")
         self.global_env = {env_var.key: env_var.value for env_var in self.global_env}
         self.datadog_global_tags = {tag.key: tag.value for tag in self.datadog_global_tags}
         self.secret_init_containers = {provider.key: provider.value for provider in self.secret_init_containers}
+        self.namespace_weights = {weight.key: weight.value for weight in self.namespace_weights}
 
     def _resolve_api_config(self):
         token_file = "/var/run/secrets/kubernetes.io/serviceaccount/token"
@@ -340,3 +428,30 @@ def _int_or_unicode(arg):
         return int(arg)
     except ValueError:
         return unicode(arg)
+
+
+def _positive_int(arg):
+    value = int(arg)
+    if value < 1:
+        raise ArgumentTypeError("must be at least 1, was {}".format(value))
+    return value
+
+
+def _non_negative_int(arg):
+    value = int(arg)
+    if value < 0:
+        raise ArgumentTypeError("must be at least 0, was {}".format(value))
+    return value
+
+
+def _namespace_weight(arg):
+    weight = KeyValue(arg)
+    weight.value = _positive_int(weight.value)
+    return weight
+
+
+def _positive_float(arg):
+    value = float(arg)
+    if value <= 0:
+        raise ArgumentTypeError("must be more than 0, was {}".format(value))
+    return value
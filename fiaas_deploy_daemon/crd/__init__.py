@@ -18,7 +18,8 @@ from __future__ import absolute_import
 
 import pinject
 
-from .status import connect_signals
+from .status import StatusCleaner, StatusWriter
+from .status_index import StatusIndex
 from .watcher import CrdWatcher
 
 
@@ -28,12 +29,17 @@ class CustomResourceDefinitionBindings(pinject.BindingSpec):
         require("deploy_queue")
 
         bind("crd_watcher", to_class=CrdWatcher)
-        connect_signals()
+        bind("status_index", to_class=StatusIndex)
+        bind("status_writer", to_class=StatusWriter)
+        bind("status_cleaner", to_class=StatusCleaner)
 
 
 class DisabledCustomResourceDefinitionBindings(pinject.BindingSpec):
     def configure(self, bind):
         bind("crd_watcher", to_class=FakeWatcher)
+        bind("status_index", to_class=FakeWatcher)
+        bind("status_writer", to_class=FakeWatcher)
+        bind("status_cleaner", to_class=FakeWatcher)
 
 
 class FakeWatcher(object):
@@ -42,3 +48,6 @@ class FakeWatcher(object):
 
     def is_alive(self):
         return True
+
+    def current_work(self):
+        return None
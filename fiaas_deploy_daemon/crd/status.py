@@ -17,27 +17,35 @@ from __future__ import absolute_import
 
 import logging
 import struct
+import threading
+import time
 from base64 import b32encode
+from collections import OrderedDict, defaultdict
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 import pytz
 from blinker import signal
-from k8s.client import NotFound
+from k8s.client import ClientError, NotFound
 from k8s.models.common import ObjectMeta, OwnerReference
+from prometheus_client import Counter, Histogram
 
 from .types import FiaasApplicationStatus
+from ..base_thread import DaemonThread
 from ..lifecycle import DEPLOY_STATUS_CHANGED, STATUS_STARTED
-from ..log_extras import get_final_logs, get_running_logs
-from ..retry import retry_on_upsert_conflict
+from ..log_extras import get_final_logs, get_running_logs, set_extras
+from ..retry import retry_on_upsert_conflict, UpsertConflict
 from ..tools import merge_dicts
 
 LAST_UPDATED_KEY = "fiaas/last_updated"
-OLD_STATUSES_TO_KEEP = 10
+CLEANUP_CONCURRENCY = 4
 LOG = logging.getLogger(__name__)
 
-
-def connect_signals():
-    signal(DEPLOY_STATUS_CHANGED).connect(_handle_signal)
+write_histogram = Histogram("status_writer_write_latency", "Seconds spent saving an ApplicationStatus")
+lag_histogram = Histogram("status_writer_queue_lag", "Seconds from a status change until it is saved")
+coalesced_counter = Counter("status_writer_coalesced", "Status changes replaced by a newer change before being saved")
+cleanup_histogram = Histogram("status_cleanup_duration", "Seconds spent deleting old ApplicationStatuses in a sweep")
+cleanup_counter = Counter("status_cleanup_deleted", "Old ApplicationStatuses deleted")
 
 
 def now():
@@ -46,18 +54,73 @@ def now():
     return now.isoformat()
 
 
-def _handle_signal(sender, status, subject):
-    if status == STATUS_STARTED:
-        status = "RUNNING"
-    else:
-        status = status.upper()
+class StatusWriter(DaemonThread):
+    """Save ApplicationStatuses for lifecycle changes in the background
+
+    Changes are queued by the lifecycle signal, so the thread changing the status never waits for the API server.
+    When a deployment changes status again before the previous change is saved, only the latest status is saved.
+    """
+
+    def __init__(self, status_index):
+        super(StatusWriter, self).__init__()
+        self._status_index = status_index
+        self._pending = OrderedDict()
+        self._writing = False
+        self._cond = threading.Condition()
+        signal(DEPLOY_STATUS_CHANGED).connect(self._handle_signal, weak=False)
+
+    def __call__(self):
+        while True:
+            self._process()
+
+    def flush(self):
+        """Wait until all queued status changes are saved"""
+        with self._cond:
+            while self._pending or self._writing:
+                self._cond.wait()
 
-    _save_status(status, subject)
-    _cleanup(subject.app_name, subject.namespace)
+    def _handle_signal(self, sender, status, subject):
+        if status == STATUS_STARTED:
+            result = "RUNNING"
+        else:
+            result = status.upper()
+        key = (subject.namespace, subject.app_name, subject.deployment_id)
+        with self._cond:
+            if key in self._pending:
+                queued_at = self._pending[key][2]
+                coalesced_counter.inc()
+            else:
+                queued_at = time.time()
+            self._pending[key] = (result, subject, queued_at)
+            self._cond.notify_all()
+
+    def _process(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            _, (result, subject, queued_at) = self._pending.popitem(last=False)
+            self._writing = True
+        try:
+            self._write(result, subject, queued_at)
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def _write(self, result, subject, queued_at):
+        lag_histogram.observe(time.time() - queued_at)
+        set_extras(app_name=subject.app_name, namespace=subject.namespace, deployment_id=subject.deployment_id)
+        try:
+            with write_histogram.time():
+                status = _save_status(result, subject, self._status_index)
+            self._status_index.put(status)
+        except Exception:
+            LOG.exception("Failed to save result %s for %s/%s deployment_id=%s", result, subject.namespace,
+                          subject.app_name, subject.deployment_id)
 
 
 @retry_on_upsert_conflict
-def _save_status(result, subject):
+def _save_status(result, subject, status_index):
     (uid, app_name, namespace, deployment_id, repository, labels, annotations) = subject
     LOG.info("Saving result %s for %s/%s deployment_id=%s", result, namespace, app_name, deployment_id)
     name = create_name(app_name, deployment_id)
@@ -68,7 +131,7 @@ def _save_status(result, subject):
     logs = _get_logs(app_name, namespace, deployment_id, result)
 
     try:
-        status = FiaasApplicationStatus.get(name, namespace)
+        status = _get_status(name, namespace, status_index)
         status.metadata.labels = merge_dicts(status.metadata.labels, labels)
         status.metadata.annotations = merge_dicts(status.metadata.annotations, annotations)
         status.logs = logs
@@ -81,7 +144,26 @@ def _save_status(result, subject):
     LOG.debug("save()-ing %s for %s/%s deployment_id=%s resourceVersion=%s", result, namespace, app_name,
               deployment_id, resource_version)
     _apply_owner_reference(status, subject)
-    status.save()
+    try:
+        status.save()
+    except ClientError as e:
+        if e.response.status_code not in (404, 409):
+            raise
+        # The known status was stale, so get the current one when trying again
+        status_index.remove(namespace, name)
+        raise UpsertConflict(e, e.response)
+    return status
+
+
+def _get_status(name, namespace, status_index):
+    """Return a copy of the known status, so that the update is conditional on its resourceVersion
+
+    Only the metadata is copied, as the result and logs are replaced before saving.
+    """
+    known = status_index.get(namespace, name)
+    if known is None:
+        return FiaasApplicationStatus.get(name, namespace)
+    return FiaasApplicationStatus(new=False, metadata=ObjectMeta.from_dict(known.metadata.as_dict()))
 
 
 def _get_logs(app_name, namespace, deployment_id, result):
@@ -89,19 +171,73 @@ def _get_logs(app_name, namespace, deployment_id, result):
            get_final_logs(app_name, namespace, deployment_id)
 
 
-def _cleanup(app_name=None, namespace=None):
-    statuses = FiaasApplicationStatus.find(app_name, namespace)
+class StatusCleaner(DaemonThread):
+    """Periodically delete the oldest ApplicationStatuses of every application, keeping the most recently updated
+
+    The statuses are found in the StatusIndex, so a sweep doesn't list anything from the API server. The deletes are
+    spread over a small pool of threads. A standby replica leaves the clean up to the leader, and when sharding is
+    enabled only the statuses of Applications in the shards this replica owns are cleaned up.
+    """
+
+    def __init__(self, config, status_index, leader_elector, shard_manager):
+        super(StatusCleaner, self).__init__()
+        self._status_index = status_index
+        self._leader_elector = leader_elector
+        self._shard_manager = shard_manager
+        self._interval = config.status_cleanup_interval
+        self._keep = config.statuses_to_keep
+        self._pool = ThreadPool(CLEANUP_CONCURRENCY)
 
-    def _last_updated(s):
-        annotations = s.metadata.annotations
-        return annotations.get(LAST_UPDATED_KEY, "") if annotations else ""
+    def __call__(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.sweep()
+            except Exception:
+                LOG.exception("Error while cleaning up old ApplicationStatuses")
 
-    statuses.sort(key=_last_updated)
-    for old_status in statuses[:-OLD_STATUSES_TO_KEEP]:
+    def sweep(self):
+        if not self._leader_elector.is_leader():
+            return
+        if not self._status_index.has_synced():
+            LOG.debug("ApplicationStatuses are not listed yet, skipping clean up")
+            return
+        old_statuses = _old_statuses(self._status_index.list(), self._keep, self._shard_manager.owns)
+        if old_statuses:
+            with cleanup_histogram.time():
+                self._pool.map(self._delete, old_statuses)
+            LOG.info("Deleted %d old ApplicationStatuses", len(old_statuses))
+
+    def _delete(self, status):
+        name, namespace = status.metadata.name, status.metadata.namespace
         try:
-            FiaasApplicationStatus.delete(old_status.metadata.name, old_status.metadata.namespace)
+            FiaasApplicationStatus.delete(name, namespace)
         except NotFound:
             pass  # already deleted
+        except Exception:
+            LOG.exception("Failed to delete ApplicationStatus %s in %s", name, namespace)
+            return
+        self._status_index.remove(namespace, name)
+        cleanup_counter.inc()
+
+
+def _old_statuses(statuses, keep, owns):
+    """Return the statuses of each owned application beyond the `keep` most recently updated"""
+    by_app = defaultdict(list)
+    for status in statuses:
+        app_name = (status.metadata.labels or {}).get("app")
+        if app_name and owns(status.metadata.namespace, app_name):
+            by_app[(status.metadata.namespace, app_name)].append(status)
+    old_statuses = []
+    for app_statuses in by_app.values():
+        app_statuses.sort(key=_last_updated)
+        old_statuses.extend(app_statuses[:-keep])
+    return old_statuses
+
+
+def _last_updated(status):
+    annotations = status.metadata.annotations
+    return annotations.get(LAST_UPDATED_KEY, "") if annotations else ""
 
 
 def create_name(name, deployment_id):
@@ -0,0 +1,42 @@
+# coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+from .status import create_name
+from .types import FiaasApplicationStatus
+from ..informer import Informer
+
+
+class StatusIndex(Informer):
+    """Local copy of the ApplicationStatuses, to look up the result of a deployment without asking the API server
+
+    The statuses are listed once and then watched, and the status writer puts every status it saves, so that a result
+    is known locally as soon as it is written. Only the metadata and result of each status are kept, as the logs can be
+    large and are never read from here.
+    """
+
+    def __init__(self, config):
+        namespace = None if config.enable_deprecated_multi_namespace_support else config.namespace
+        super(StatusIndex, self).__init__(FiaasApplicationStatus, namespace)
+
+    def _cached(self, obj):
+        return FiaasApplicationStatus(new=False, metadata=obj.metadata, result=obj.result)
+
+    def result(self, app_name, namespace, deployment_id):
+        """Return the result of the given deployment, or None if there is no status for it"""
+        status = self.get(namespace, create_name(app_name, deployment_id))
+        return status.result if status else None
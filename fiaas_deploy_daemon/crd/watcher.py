@@ -17,51 +17,161 @@
 from __future__ import absolute_import
 
 import logging
+import threading
+import time
 
 from k8s.base import WatchEvent
 from k8s.client import NotFound
 from k8s.models.common import ObjectMeta
 from k8s.models.custom_resource_definition import CustomResourceDefinition, CustomResourceDefinitionSpec, \
     CustomResourceDefinitionNames
-from k8s.watcher import Watcher
+from prometheus_client import Counter, Histogram
 from yaml import YAMLError
 
 from .status import create_name
 from .types import FiaasApplication, FiaasApplicationStatus
 from ..base_thread import DaemonThread
 from ..deployer import DeployerEvent
+from ..deployer.deploy_queue import priority_of
+from ..informer import iter_resources, list_pages, watch_resources, resource_key, ResourceVersionExpired, \
+    RETRY_DELAY
 from ..log_extras import set_extras
 from ..specs.factory import InvalidConfiguration
 
 LOG = logging.getLogger(__name__)
+FINISHED_RESULTS = ("SUCCESS", "FAILED")
+
+watch_reconnects = Counter("crd_watch_reconnects", "Application watches resumed from the last seen resourceVersion")
+watch_relists = Counter("crd_watch_relists", "Full listings of Applications, at startup or when the watch expired")
+relist_histogram = Histogram("crd_watch_relist_duration", "Seconds spent listing and handling all Applications")
 
 
 class CrdWatcher(DaemonThread):
-    def __init__(self, spec_factory, deploy_queue, config, lifecycle):
+    """Watch Applications, and queue a deploy or delete for every change
+
+    All Applications are listed once, and the watch is then resumed from the last seen resourceVersion each time the
+    API server closes the connection. The Applications are only listed again if the API server has expired that
+    resourceVersion, and then only the ones that changed in the meantime are handled.
+
+    When the work is sharded between replicas, only Applications owned by this replica are handled. A standby replica
+    keeps watching, but handles nothing until it is elected leader. When this replica takes over shards or becomes
+    leader, the Applications it now owns are listed in the background. Every watched Application is remembered, also
+    the ones left to other replicas, so only those that changed since, or whose deployment was never finished, are
+    handled.
+    """
+
+    def __init__(self, spec_factory, deploy_queue, config, lifecycle, status_index, shard_manager, leader_elector):
         super(CrdWatcher, self).__init__()
         self._spec_factory = spec_factory
         self._deploy_queue = deploy_queue
-        self._watcher = Watcher(FiaasApplication)
         self._lifecycle = lifecycle
+        self._status_index = status_index
+        self._resource_version = None
+        self._seen = {}
+        self._shard_manager = shard_manager
+        self._leader_elector = leader_elector
+        self._lock = threading.RLock()
         self.namespace = config.namespace
         self.enable_deprecated_multi_namespace_support = config.enable_deprecated_multi_namespace_support
+        shard_manager.add_listener(self._start_resync)
+        leader_elector.add_listener(self._start_resync)
 
     def __call__(self):
         while True:
-            if self.enable_deprecated_multi_namespace_support:
-                self._watch(namespace=None)
-            else:
-                self._watch(namespace=self.namespace)
+            self._watch(namespace=self._watched_namespace())
+
+    def _watched_namespace(self):
+        return None if self.enable_deprecated_multi_namespace_support else self.namespace
 
     def _watch(self, namespace):
         try:
-            for event in self._watcher.watch(namespace=namespace):
-                self._handle_watch_event(event)
+            with self.working_on("Application watch"):
+                if self._resource_version is None:
+                    self._relist(namespace)
+                else:
+                    watch_reconnects.inc()
+                for event in watch_resources(FiaasApplication, namespace, resource_version=self._resource_version):
+                    self._resource_version = event.object.metadata.resourceVersion
+                    with self._lock:
+                        if self._should_handle(event.type, event.object):
+                            self._handle_watch_event(event)
+        except ResourceVersionExpired:
+            LOG.info("Resource version %s of Applications has expired, listing again", self._resource_version)
+            self._resource_version = None
         except NotFound:
-            self.create_custom_resource_definitions()
+            if self._leader_elector.is_leader():
+                self.create_custom_resource_definitions()
+            else:
+                LOG.info("Applications are not defined yet, waiting for the leader to define them")
+                time.sleep(RETRY_DELAY)
         except Exception:
             LOG.exception("Error while watching for changes on FiaasApplications")
 
+    def _relist(self, namespace):
+        watch_relists.inc()
+        with relist_histogram.time():
+            listed = set()
+            resource_version = None
+            for page, resource_version in list_pages(FiaasApplication, namespace):
+                for application in page:
+                    listed.add(resource_key(application))
+                    self._handle_listed(WatchEvent.ADDED, application)
+            deleted = [application for key, application in self._seen.items() if key not in listed]
+            for application in deleted:
+                LOG.info("Application %s in %s was deleted while not watching", application.metadata.name,
+                         application.metadata.namespace)
+                self._handle_listed(WatchEvent.DELETED, application)
+            self._resource_version = resource_version
+
+    def _handle_listed(self, event_type, application, takeover=False):
+        with self._lock:
+            if not self._should_handle(event_type, application, takeover):
+                return
+            try:
+                self._handle(event_type, application)
+            except Exception:
+                LOG.exception("Error while handling listed Application %s", application.metadata.name)
+
+    def _start_resync(self, shards=None):
+        resync = threading.Thread(target=self._resync, args=(shards,), name="CrdWatcherResync")
+        resync.daemon = True
+        resync.start()
+
+    def _resync(self, shards=None):
+        """Handle the Applications just taken over, in shards or all, which may have changed while nobody owned them"""
+        try:
+            for application in iter_resources(FiaasApplication, self._watched_namespace()):
+                if shards is None or self._shard_manager.shard_of(*resource_key(application)) in shards:
+                    self._handle_listed(WatchEvent.ADDED, application, takeover=True)
+        except Exception:
+            LOG.exception("Error while handling Applications taken over from another replica")
+
+    def _should_handle(self, event_type, application, takeover=False):
+        seen = self._is_seen(event_type, application)
+        if not (self._leader_elector.is_leader() and self._shard_manager.owns(*resource_key(application))):
+            return False
+        # An Application seen while another replica owned it was left to that replica, which may not have finished
+        return not seen or (takeover and not self._is_finished(application))
+
+    def _is_finished(self, application):
+        deployment_id = (application.metadata.labels or {}).get("fiaas/deployment_id")
+        if deployment_id is None:
+            return False
+        return self._result(application.spec.application, application.metadata.namespace,
+                            deployment_id) in FINISHED_RESULTS
+
+    def _is_seen(self, event_type, application):
+        """Remember the last seen version of the Application, returning True if this version is already seen"""
+        key = resource_key(application)
+        if event_type == WatchEvent.DELETED:
+            self._seen.pop(key, None)
+            return False
+        seen = self._seen.get(key)
+        if seen is not None and seen.metadata.resourceVersion == application.metadata.resourceVersion:
+            return True
+        self._seen[key] = application
+        return False
+
     @classmethod
     def create_custom_resource_definitions(cls):
         cls._create("Application", "applications", ("app", "fa"), "fiaas.schibsted.io")
@@ -78,12 +188,15 @@ class CrdWatcher(DaemonThread):
         LOG.info("Created CustomResourceDefinition with name %s", name)
 
     def _handle_watch_event(self, event):
-        if event.type in (WatchEvent.ADDED, WatchEvent.MODIFIED):
-            self._deploy(event.object)
-        elif event.type == WatchEvent.DELETED:
-            self._delete(event.object)
+        self._handle(event.type, event.object)
+
+    def _handle(self, event_type, application):
+        if event_type in (WatchEvent.ADDED, WatchEvent.MODIFIED):
+            self._deploy(application)
+        elif event_type == WatchEvent.DELETED:
+            self._delete(application)
         else:
-            raise ValueError("Unknown WatchEvent type {}".format(event.type))
+            raise ValueError("Unknown WatchEvent type {}".format(event_type))
 
     def _deploy(self, application):
         app_name = application.spec.application
@@ -121,7 +234,7 @@ class CrdWatcher(DaemonThread):
                 additional_annotations=application.spec.additional_annotations,
             )
             set_extras(app_spec)
-            self._deploy_queue.put(DeployerEvent("UPDATE", app_spec, lifecycle_subject))
+            self._deploy_queue.put(DeployerEvent("UPDATE", app_spec, lifecycle_subject, priority_of(application.metadata)))
             LOG.debug("Queued deployment for %s", app_name)
         except (InvalidConfiguration, YAMLError):
             LOG.exception("Failed to create app spec from fiaas config file")
@@ -141,16 +254,21 @@ class CrdWatcher(DaemonThread):
             additional_annotations=application.spec.additional_annotations,
         )
         set_extras(app_spec)
-        self._deploy_queue.put(DeployerEvent("DELETE", app_spec, lifecycle_subject=None))
+        self._deploy_queue.put(DeployerEvent("DELETE", app_spec, lifecycle_subject=None,
+                                             priority=priority_of(application.metadata)))
         LOG.debug("Queued delete for %s", application.spec.application)
 
     def _already_deployed(self, app_name, namespace, deployment_id):
+        return self._result(app_name, namespace, deployment_id) == "SUCCESS"
+
+    def _result(self, app_name, namespace, deployment_id):
+        if self._status_index.has_synced():
+            return self._status_index.result(app_name, namespace, deployment_id)
         try:
             name = create_name(app_name, deployment_id)
-            status = FiaasApplicationStatus.get(name, namespace)
-            return status.result == "SUCCESS"
+            return FiaasApplicationStatus.get(name, namespace).result
         except NotFound:
-            return False
+            return None
 
 
 def _repository(application):
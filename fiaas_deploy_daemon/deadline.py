@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Timeouts and deadlines for calls to the API server
+
+Every request made with the session of the k8s client gets separate connect and read timeouts from the TimeoutAdapter.
+While a deadline is set for the current thread, the read timeout is shortened so that no request outlives it, and
+requests made after it has passed fail with DeadlineExceeded without being sent.
+"""
+from __future__ import absolute_import
+
+import contextlib
+import threading
+
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter
+from requests.adapters import HTTPAdapter
+from requests.exceptions import Timeout
+
+from .tools import api_resource_kind
+
+timeout_counter = Counter("k8s_api_timeouts", "Calls to the API server that timed out or exceeded their deadline",
+                          ["kind"])
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def deadline(seconds=None, expires=None):
+    """Set a deadline for the current thread, either in seconds from now, or as a time given by `time_monotonic`
+
+    A deadline inside another can only shorten it. With neither seconds nor expires, the deadline is left as it is.
+    """
+    previous = current_deadline()
+    if seconds is not None:
+        expires = time_monotonic() + seconds
+    if previous is not None and (expires is None or previous < expires):
+        expires = previous
+    _local.expires = expires
+    try:
+        yield expires
+    finally:
+        _local.expires = previous
+
+
+def current_deadline():
+    """Return the deadline of the current thread, or None"""
+    return getattr(_local, "expires", None)
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """Send requests with separate connect and read timeouts, bounded by the deadline of the current thread
+
+    Streaming requests, like watches, keep the read timeout they were made with.
+    """
+
+    def __init__(self, connect_timeout, read_timeout):
+        super(TimeoutAdapter, self).__init__()
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        read_timeout = timeout if stream and timeout is not None else self._read_timeout
+        expires = current_deadline()
+        if expires is not None:
+            remaining = expires - time_monotonic()
+            if remaining <= 0:
+                _count_timeout(request)
+                raise DeadlineExceeded("Deadline exceeded before {} {}".format(request.method, request.path_url))
+            read_timeout = min(read_timeout, remaining)
+        try:
+            return super(TimeoutAdapter, self).send(request, stream=stream,
+                                                    timeout=(self._connect_timeout, read_timeout), **kwargs)
+        except Timeout:
+            _count_timeout(request)
+            raise
+
+
+def install(session, connect_timeout, read_timeout):
+    adapter = TimeoutAdapter(connect_timeout, read_timeout)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def _count_timeout(request):
+    timeout_counter.labels(api_resource_kind(request.path_url)).inc()
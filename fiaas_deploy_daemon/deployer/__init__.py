@@ -21,18 +21,20 @@ from collections import namedtuple
 import pinject
 
 from .bookkeeper import Bookkeeper
-from .deploy import Deployer
+from .deploy import DeployerPool
+from .deploy_queue import DeployQueue, DEFAULT_PRIORITY
 from .scheduler import Scheduler
 
 
 class DeployerBindings(pinject.BindingSpec):
     def configure(self, bind, require):
         require("config")
-        require("deploy_queue")
         require("adapter")
+        bind("deploy_queue", to_class=DeployQueue)
         bind("bookkeeper", to_class=Bookkeeper)
         bind("scheduler", to_class=Scheduler)
-        bind("deployer", to_class=Deployer)
+        bind("deployer", to_class=DeployerPool)
 
 
-DeployerEvent = namedtuple('DeployerEvent', ['action', 'app_spec', 'lifecycle_subject'])
+DeployerEvent = namedtuple('DeployerEvent', ['action', 'app_spec', 'lifecycle_subject', 'priority'])
+DeployerEvent.__new__.__defaults__ = (DEFAULT_PRIORITY,)
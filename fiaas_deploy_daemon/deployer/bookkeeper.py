@@ -14,22 +14,213 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from monotonic import monotonic as time_monotonic
 from prometheus_client import Counter, Gauge, Histogram
 
+from ..log_extras import get_extras
+from ..tools import api_resource_kind
+
+LOG = logging.getLogger(__name__)
+
 
 class Bookkeeper(object):
-    """Measures time, fails and successes"""
+    """Measures time, fails and successes
+
+    While a deploy is traced, the time spent in each phase and on each call to the API server made on behalf of the
+    deploy is collected, and a summary is logged to the status logs when the deploy is done.
+
+    Each deploy is also stamped when it is queued, taken by a worker, applied and found ready or failed, to observe
+    how long it waits in the queue, how long applying it takes, how long the rollout takes, and the latency end to end.
+    """
     deploy_gauge = Gauge("deployer_requests", "Request to deploy an app", ["app"])
     error_counter = Counter("deployer_errors", "Deploy failed", ["app"])
     success_counter = Counter("deployer_success", "Deploy successful", ["app"])
     deploy_histogram = Histogram("deployer_time_to_deploy", "Time spent on each deploy")
+    queue_depth_gauge = Gauge("deployer_queue_depth", "Number of events waiting in the deploy queue")
+    queue_lag_gauge = Gauge("deployer_queue_lag", "Seconds the longest waiting application has waited to be deployed")
+    namespace_depth_gauge = Gauge("deployer_namespace_queue_depth", "Number of events waiting in the deploy queue",
+                                  ["namespace"])
+    workers_gauge = Gauge("deployer_workers", "Number of deploy workers")
+    busy_workers_gauge = Gauge("deployer_busy_workers", "Number of deploy workers currently handling an event")
+    coalesced_counter = Counter("deployer_coalesced_events", "Queued events replaced by a newer event for the same app",
+                                ["action"])
+    phase_histogram = Histogram("deployer_phase_duration", "Time spent on each phase of a deploy", ["phase"])
+    api_call_histogram = Histogram("k8s_api_call_duration", "Time spent on each call to the API server",
+                                   ["verb", "kind", "status"])
+    queue_wait_histogram = Histogram("deployer_queue_wait", "Seconds from a deploy is queued until a worker takes it",
+                                     ["priority"])
+    apply_histogram = Histogram("deployer_apply_duration",
+                                "Seconds from a worker takes a deploy until all resources are applied")
+    rollout_histogram = Histogram("deployer_rollout_duration",
+                                  "Seconds from all resources are applied until the deploy is ready or failed",
+                                  ["result"])
+    end_to_end_histogram = Histogram("deployer_end_to_end_latency",
+                                     "Seconds from a deploy is queued until it is ready or failed", ["result"])
+
+    def __init__(self):
+        self._traces = {}
+        self._timelines = {}
+        self._lock = threading.Lock()
 
     def time(self, app_spec):
         self.deploy_gauge.labels(app_spec.name).inc()
         return self.deploy_histogram.time()
 
+    @contextmanager
+    def trace(self, app_spec):
+        """Collect timings for the deploy of app_spec, on any thread with the log extras of the deploy"""
+        key = (app_spec.name, app_spec.namespace, app_spec.deployment_id)
+        trace = DeployTrace()
+        with self._lock:
+            self._traces[key] = trace
+        try:
+            yield trace
+        finally:
+            with self._lock:
+                self._traces.pop(key, None)
+            LOG.info("Timings: %s", trace.summary())
+
+    @contextmanager
+    def time_phase(self, phase):
+        start = time_monotonic()
+        try:
+            yield
+        finally:
+            duration = time_monotonic() - start
+            self.phase_histogram.labels(phase).observe(duration)
+            trace = self._current_trace()
+            if trace:
+                trace.add_phase(phase, duration)
+
+    def track_api_calls(self, session):
+        """Observe every response to requests made with session, typically the session of the k8s client"""
+        if self._record_api_call not in session.hooks["response"]:
+            session.hooks["response"].append(self._record_api_call)
+
+    def _record_api_call(self, resp, *args, **kwargs):
+        request = resp.request
+        verb = "WATCH" if "watch=true" in request.path_url else request.method
+        kind = api_resource_kind(request.path_url)
+        duration = resp.elapsed.total_seconds()
+        self.api_call_histogram.labels(verb, kind, resp.status_code).observe(duration)
+        trace = self._current_trace()
+        if trace:
+            trace.add_api_call(verb, kind, resp.status_code, duration)
+
+    def _current_trace(self):
+        key = get_extras()
+        if key is None:
+            return None
+        with self._lock:
+            return self._traces.get(key)
+
     def failed(self, app_spec):
         self.error_counter.labels(app_spec.name).inc()
+        self._finish(app_spec, "failed")
 
     def success(self, app_spec):
         self.success_counter.labels(app_spec.name).inc()
+        self._finish(app_spec, "success")
+
+    def queued(self, event):
+        with self._lock:
+            self._timelines[_deploy_key(event.app_spec)] = {"event": event, "queued": time_monotonic()}
+
+    def dequeued(self, event):
+        """Observe the queue wait of event. Only deploys are followed further, so a delete is forgotten"""
+        now = time_monotonic()
+        key = _deploy_key(event.app_spec)
+        with self._lock:
+            timeline = self._timelines.get(key)
+            if timeline is None or timeline["event"] is not event:
+                return
+            if event.action == "UPDATE":
+                timeline["dequeued"] = now
+            else:
+                del self._timelines[key]
+        self.queue_wait_histogram.labels(event.priority).observe(now - timeline["queued"])
+
+    def applied(self, app_spec):
+        now = time_monotonic()
+        with self._lock:
+            timeline = self._timelines.get(_deploy_key(app_spec))
+            if timeline is None or "dequeued" not in timeline:
+                return
+            timeline["applied"] = now
+        self.apply_histogram.observe(now - timeline["dequeued"])
+
+    def superseded(self, app_spec):
+        """Forget a deploy that was replaced by a newer deploy of the same application before it was ready"""
+        with self._lock:
+            self._timelines.pop(_deploy_key(app_spec), None)
+
+    def dropped(self, app_spec):
+        """Forget a deploy left to another replica, after losing the shard of the application or the leadership"""
+        with self._lock:
+            self._timelines.pop(_deploy_key(app_spec), None)
+
+    def _finish(self, app_spec, result):
+        now = time_monotonic()
+        with self._lock:
+            timeline = self._timelines.pop(_deploy_key(app_spec), None)
+        if timeline is None:
+            return
+        if "applied" in timeline:
+            self.rollout_histogram.labels(result).observe(now - timeline["applied"])
+        self.end_to_end_histogram.labels(result).observe(now - timeline["queued"])
+
+    def track_queue(self, deploy_queue):
+        self.queue_depth_gauge.set_function(deploy_queue.qsize)
+        self.queue_lag_gauge.set_function(deploy_queue.lag)
+
+    def namespace_depth(self, namespace, depth):
+        self.namespace_depth_gauge.labels(namespace).set(depth)
+
+    def set_workers(self, count):
+        self.workers_gauge.set(count)
+
+    def busy(self):
+        return self.busy_workers_gauge.track_inprogress()
+
+    def coalesced(self, event):
+        self.coalesced_counter.labels(event.action).inc()
+        key = _deploy_key(event.app_spec)
+        with self._lock:
+            # A newer event for the same deployment_id has its own timeline
+            if key in self._timelines and self._timelines[key]["event"] is event:
+                del self._timelines[key]
+
+
+class DeployTrace(object):
+    """Timings collected for one deploy"""
+
+    def __init__(self):
+        self._phases = []
+        self._api_calls = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase, duration):
+        with self._lock:
+            self._phases.append((phase, duration))
+
+    def add_api_call(self, verb, kind, status, duration):
+        with self._lock:
+            totals = self._api_calls[(verb, kind, status)]
+            totals[0] += 1
+            totals[1] += duration
+
+    def summary(self):
+        with self._lock:
+            phases = ", ".join("{} {:.3f}s".format(phase, duration) for phase, duration in self._phases)
+            api_calls = ", ".join("{} {} {} x{} {:.3f}s".format(verb, kind, status, count, total)
+                                  for (verb, kind, status), (count, total) in sorted(self._api_calls.items()))
+        return "phases: {}; API calls: {}".format(phases or "none", api_calls or "none")
+
+
+def _deploy_key(app_spec):
+    return app_spec.namespace, app_spec.name, app_spec.deployment_id
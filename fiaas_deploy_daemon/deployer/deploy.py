@@ -18,33 +18,117 @@
 from __future__ import absolute_import
 
 import logging
+import threading
+
+from k8s.client import Client
 
 from .kubernetes.ready_check import ReadyCheck
 from ..base_thread import DaemonThread
-from ..log_extras import set_extras
+from ..deadline import deadline, DeadlineExceeded
+from ..log_extras import set_extras, get_final_logs
 
 LOG = logging.getLogger(__name__)
 
 
+class DeployerPool(object):
+    """Run a number of Deployers, all taking events from the same deploy queue
+
+    The deploy queue makes sure that only one event for a given application is handed out at a time,
+    so events for different applications are deployed in parallel, while events for the same application
+    are deployed one at a time, in order.
+    """
+
+    def __init__(self, deploy_queue, bookkeeper, adapter, scheduler, lifecycle, config, readiness_tracker,
+                 shard_manager, leader_elector):
+        self._worker_args = (deploy_queue, bookkeeper, adapter, scheduler, lifecycle, config, readiness_tracker,
+                             shard_manager, leader_elector)
+        self._workers = [self._make_worker(i) for i in range(config.deploy_workers)]
+        self._replaced = []
+        self._lock = threading.Lock()
+        bookkeeper.track_queue(deploy_queue)
+        bookkeeper.track_api_calls(Client._session)
+        bookkeeper.set_workers(len(self._workers))
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def is_alive(self):
+        return all(worker.is_alive() for worker in self._workers)
+
+    def workers(self):
+        with self._lock:
+            return list(self._workers)
+
+    def replace(self, worker):
+        """Start a new worker in place of worker, which stops taking events once its current event is done"""
+        with self._lock:
+            index = self._workers.index(worker)
+            worker.retire()
+            replacement = self._make_worker(index)
+            self._workers[index] = replacement
+            self._replaced.append(worker)
+        replacement.start()
+        LOG.warning("Replaced deploy worker %s with %s", worker.name, replacement.name)
+
+    def replaced_alive(self):
+        """Return the number of replaced workers still running their last event"""
+        with self._lock:
+            self._replaced = [worker for worker in self._replaced if worker.is_alive()]
+            return len(self._replaced)
+
+    def _make_worker(self, index):
+        worker = Deployer(*self._worker_args)
+        worker.name = "{}-{}".format(worker.name, index)
+        return worker
+
+
 class Deployer(DaemonThread):
     """Take incoming AppSpecs and use the framework-adapter to deploy the app
 
-    Mainly focused on bookkeeping, and leaving the hard work to the framework-adapter.
+    Mainly focused on bookkeeping, and leaving the hard work to the framework-adapter. Events for applications in
+    shards this replica no longer owns, or queued before this replica lost its leadership, are dropped, both when they
+    are taken from the queue and right before deploying, since the replica taking over deploys them itself.
     """
 
-    def __init__(self, deploy_queue, bookkeeper, adapter, scheduler, lifecycle, config):
+    def __init__(self, deploy_queue, bookkeeper, adapter, scheduler, lifecycle, config, readiness_tracker,
+                 shard_manager, leader_elector):
         super(Deployer, self).__init__()
+        self._deploy_queue = deploy_queue
         self._queue = _make_gen(deploy_queue.get)
         self._bookkeeper = bookkeeper
         self._adapter = adapter
         self._scheduler = scheduler
         self._lifecycle = lifecycle
         self._config = config
+        self._readiness_tracker = readiness_tracker
+        self._shard_manager = shard_manager
+        self._leader_elector = leader_elector
+        self._retired = False
 
     def __call__(self):
         for event in self._queue:
-            set_extras(event.app_spec)
-            LOG.info("Received %r for %s", event.app_spec, event.action)
+            try:
+                with self._bookkeeper.busy(), self.working_on(_work_item(event.app_spec)):
+                    self._handle(event)
+            finally:
+                self._deploy_queue.task_done(event)
+            if self._retired:
+                LOG.info("%s was replaced, and has stopped", self.name)
+                return
+
+    def retire(self):
+        """Stop taking events once the current event is done"""
+        self._retired = True
+
+    def _handle(self, event):
+        set_extras(event.app_spec)
+        LOG.info("Received %r for %s", event.app_spec, event.action)
+        if not self._responsible_for(event.app_spec):
+            self._drop(event.app_spec, event.action)
+            return
+        # Calls to the API server made after the deadline fail, so a hanging API server can't hold up the worker
+        with deadline(self._config.deploy_timeout):
             if event.action == "UPDATE":
                 self._update(event.app_spec, event.lifecycle_subject)
             elif event.action == "DELETE":
@@ -54,16 +138,29 @@ class Deployer(DaemonThread):
 
     def _update(self, app_spec, lifecycle_subject):
         try:
+            # Checked before signalling start, so a dropped deploy leaves no RUNNING status behind for the new owner
+            if not self._responsible_for(app_spec):
+                self._drop(app_spec, "UPDATE")
+                return
             self._lifecycle.start(lifecycle_subject)
-            with self._bookkeeper.time(app_spec):
+            with self._bookkeeper.time(app_spec), self._bookkeeper.trace(app_spec):
                 self._adapter.deploy(app_spec)
+            self._bookkeeper.applied(app_spec)
             if app_spec.name != "fiaas-deploy-daemon":
-                self._scheduler.add(ReadyCheck(app_spec, self._bookkeeper, self._lifecycle, lifecycle_subject,
-                                               self._config))
+                ready_check = ReadyCheck(app_spec, self._bookkeeper, self._lifecycle, lifecycle_subject, self._config,
+                                         self._readiness_tracker, self._leader_elector)
+                # Register right away, so no change to the Deployment is missed before the first scheduled check
+                self._readiness_tracker.register(ready_check)
+                self._scheduler.add(ready_check)
             else:
                 self._lifecycle.success(lifecycle_subject)
                 self._bookkeeper.success(app_spec)
             LOG.info("Completed deployment of %r", app_spec)
+        except DeadlineExceeded:
+            LOG.error("Gave up deploying %s, after spending more than %d seconds", app_spec.name,
+                      self._config.deploy_timeout)
+            self._lifecycle.failed(lifecycle_subject)
+            self._bookkeeper.failed(app_spec)
         except Exception:
             LOG.exception("Error while deploying %s: ", app_spec.name)
             self._lifecycle.failed(lifecycle_subject)
@@ -72,6 +169,23 @@ class Deployer(DaemonThread):
     def _delete(self, app_spec):
         self._adapter.delete(app_spec)
         LOG.info("Completed removal of %r", app_spec)
+        # A delete has no status to collect its logs
+        get_final_logs(app_spec.name, app_spec.namespace, app_spec.deployment_id)
+
+    def _responsible_for(self, app_spec):
+        return self._leader_elector.is_leader() and self._shard_manager.owns(app_spec.namespace, app_spec.name)
+
+    def _drop(self, app_spec, action):
+        LOG.info("Dropping %s of %s, as this replica is no longer the leader or no longer owns its shard", action,
+                 app_spec.name)
+        self._bookkeeper.dropped(app_spec)
+        # The replica taking over saves the status, so the logs held here are not needed
+        get_final_logs(app_spec.name, app_spec.namespace, app_spec.deployment_id)
+
+
+def _work_item(app_spec):
+    """What the watchdog is told a worker is working on. It must be hashable, which an AppSpec is not"""
+    return app_spec.namespace, app_spec.name, app_spec.deployment_id
 
 
 def _make_gen(func):
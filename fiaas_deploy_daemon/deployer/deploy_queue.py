@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import logging
+import threading
+from collections import deque, OrderedDict, defaultdict
+
+from monotonic import monotonic as time_monotonic
+
+LOG = logging.getLogger(__name__)
+PRIORITY_ANNOTATION = "fiaas/deploy-priority"
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+
+
+def event_key(event):
+    return event.app_spec.namespace, event.app_spec.name
+
+
+def priority_of(metadata):
+    """Return the deploy priority asked for by the annotation on an Application, or the default priority"""
+    priority = (metadata.annotations or {}).get(PRIORITY_ANNOTATION, DEFAULT_PRIORITY)
+    if priority not in PRIORITIES:
+        LOG.warning("Unknown deploy priority %r for %s in %s, using %s", priority, metadata.name, metadata.namespace,
+                    DEFAULT_PRIORITY)
+        return DEFAULT_PRIORITY
+    return priority
+
+
+class DeployQueue(object):
+    """Queue of DeployerEvents, handing out at most one event per application at a time
+
+    Events for the same application (namespace and name) are handed out only after the previous event for that
+    application has been marked as done with `task_done`. Events for different applications can be worked on in
+    parallel.
+
+    Events of a higher priority are always handed out before events of a lower priority. Within a priority, each
+    namespace has a queue of its own, and the namespaces take turns, so a namespace deploying many applications at once
+    doesn't hold up the others. A namespace gets as many events handed out in a row as its weight in
+    `namespace-weight`, 1 by default. Within a namespace, events are handed out in the order they arrived.
+
+    Only the latest event for an application matters, so an event waiting in the queue is replaced when a newer event
+    for the same application arrives, taking the priority of the newer event. The lifecycle subject of the replaced
+    event is marked as superseded. Updating the status of a superseded event needs requests to the API server, so it is
+    left to the deployer threads calling `get` and `task_done`, to avoid holding up the thread putting events on the
+    queue.
+
+    The lag of the queue is how long the application that has waited the longest has been waiting, counting from the
+    first of its events that is still waiting, or was replaced while waiting.
+    """
+
+    def __init__(self, config, lifecycle, bookkeeper, time_func=time_monotonic):
+        self._lifecycle = lifecycle
+        self._bookkeeper = bookkeeper
+        self._time_func = time_func
+        self._weights = config.namespace_weights
+        self._lock = threading.Condition()
+        self._waiting = {}
+        self._waiting_since = {}
+        self._depth = defaultdict(int)
+        self._ready = {priority: OrderedDict() for priority in PRIORITIES}
+        self._turns = {priority: 0 for priority in PRIORITIES}
+        self._active = set()
+        self._superseded = []
+
+    def put(self, event):
+        key = event_key(event)
+        self._bookkeeper.queued(event)
+        with self._lock:
+            superseded = self._waiting.get(key)
+            self._waiting[key] = event
+            self._waiting_since.setdefault(key, self._time_func())
+            if superseded is not None:
+                self._superseded.append((superseded, event))
+                if key not in self._active and superseded.priority != event.priority:
+                    self._remove_ready(key, superseded.priority)
+                    self._add_ready(key, event.priority)
+            else:
+                self._set_depth(key[0], 1)
+                if key not in self._active:
+                    self._add_ready(key, event.priority)
+            self._lock.notify()
+
+    def get(self):
+        with self._lock:
+            while not any(self._ready.values()):
+                self._lock.wait()
+            key = self._next_ready()
+            self._active.add(key)
+            event = self._waiting.pop(key)
+            self._waiting_since.pop(key)
+            self._set_depth(key[0], -1)
+        self._bookkeeper.dequeued(event)
+        self._handle_superseded()
+        return event
+
+    def task_done(self, event):
+        key = event_key(event)
+        with self._lock:
+            self._active.discard(key)
+            if key in self._waiting:
+                self._add_ready(key, self._waiting[key].priority)
+                self._lock.notify()
+        self._handle_superseded()
+
+    def qsize(self):
+        with self._lock:
+            return len(self._waiting)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def lag(self):
+        """Seconds the application that has waited the longest has been waiting, or 0 when no events are waiting"""
+        with self._lock:
+            if not self._waiting_since:
+                return 0
+            return self._time_func() - min(self._waiting_since.values())
+
+    def _add_ready(self, key, priority):
+        namespaces = self._ready[priority]
+        namespaces.setdefault(key[0], deque()).append(key)
+
+    def _remove_ready(self, key, priority):
+        namespaces = self._ready[priority]
+        keys = namespaces[key[0]]
+        keys.remove(key)
+        if not keys:
+            if next(iter(namespaces)) == key[0]:
+                self._turns[priority] = 0
+            del namespaces[key[0]]
+
+    def _next_ready(self):
+        """Take the next key from the namespace whose turn it is, in the highest priority with keys ready"""
+        priority = next(priority for priority in PRIORITIES if self._ready[priority])
+        namespaces = self._ready[priority]
+        namespace, keys = next(iter(namespaces.items()))
+        key = keys.popleft()
+        self._turns[priority] += 1
+        if not keys or self._turns[priority] >= self._weights.get(namespace, 1):
+            self._turns[priority] = 0
+            del namespaces[namespace]
+            if keys:
+                namespaces[namespace] = keys
+        return key
+
+    def _set_depth(self, namespace, change):
+        self._depth[namespace] += change
+        self._bookkeeper.namespace_depth(namespace, self._depth[namespace])
+        if not self._depth[namespace]:
+            del self._depth[namespace]
+
+    def _handle_superseded(self):
+        with self._lock:
+            superseded, self._superseded = self._superseded, []
+        for replaced, event in superseded:
+            self._supersede(replaced, event)
+
+    def _supersede(self, superseded, event):
+        LOG.info("Replacing queued %s of %s with %s", superseded.action, superseded.app_spec, event.action)
+        self._bookkeeper.coalesced(superseded)
+        if superseded.lifecycle_subject:
+            self._lifecycle.superseded(superseded.lifecycle_subject)
@@ -22,6 +22,9 @@ from .adapter import K8s
 from .autoscaler import AutoscalerDeployer
 from .deployment import DeploymentBindings
 from .ingress import IngressDeployer, IngressTls
+from .quota_cache import QuotaCache
+from .ready_check import ReadinessTracker
+from .resource_cache import ResourceCache
 from .service import ServiceDeployer
 from .owner_references import OwnerReferences
 
@@ -34,6 +37,9 @@ class K8sAdapterBindings(pinject.BindingSpec):
         bind("autoscaler", to_class=AutoscalerDeployer)
         bind("ingress_tls", to_class=IngressTls)
         bind("owner_references", to_class=OwnerReferences)
+        bind("readiness_tracker", to_class=ReadinessTracker)
+        bind("resource_cache", to_class=ResourceCache)
+        bind("quota_cache", to_class=QuotaCache)
 
     def dependencies(self):
         return [DeploymentBindings()]
@@ -17,35 +17,79 @@
 from __future__ import absolute_import, unicode_literals
 
 import logging
+import sys
+from multiprocessing.pool import ThreadPool
 
-from k8s.models.resourcequota import ResourceQuota, NotBestEffort
+import six
 
+from ...deadline import deadline, current_deadline
+from ...log_extras import set_extras
 from ...specs.models import ResourcesSpec, ResourceRequirementSpec
 
 LOG = logging.getLogger(__name__)
+# The Service and Ingress are deployed on the executor, while the deploying thread does the Deployment and HPA
+PARALLEL_PHASES = 2
+
+
+class DeployFailed(Exception):
+    """More than one of the resources of an application failed to deploy"""
+
+    def __init__(self, errors):
+        super(DeployFailed, self).__init__("Failed to deploy {}".format(", ".join(
+            "{} ({})".format(phase, exc_info[1]) for phase, exc_info in errors)))
+        self.errors = errors
 
 
 class K8s(object):
     """Adapt from an AppSpec to the necessary definitions for a kubernetes cluster
+
+    The Service and Ingress don't depend on any of the other resources, and are deployed concurrently with the
+    Deployment. The HPA scales the Deployment, so it is deployed after the Deployment, and not at all if that failed.
     """
 
-    def __init__(self, config, service_deployer, deployment_deployer, ingress_deployer, autoscaler):
+    def __init__(self, config, service_deployer, deployment_deployer, ingress_deployer, autoscaler, quota_cache,
+                 bookkeeper):
         self._version = config.version
         self._service_deployer = service_deployer
         self._deployment_deployer = deployment_deployer
         self._ingress_deployer = ingress_deployer
         self._autoscaler_deployer = autoscaler
+        self._quota_cache = quota_cache
+        self._bookkeeper = bookkeeper
+        self._executor = ThreadPool(PARALLEL_PHASES * config.deploy_workers)
 
     def deploy(self, app_spec):
-        if _besteffort_qos_is_required(app_spec):
+        with self._bookkeeper.time_phase("resource_quota"):
+            besteffort_qos_is_required = self._quota_cache.besteffort_qos_is_required(app_spec.namespace)
+        if besteffort_qos_is_required:
             app_spec = _remove_resource_requirements(app_spec)
 
         selector = _make_selector(app_spec)
         labels = self._make_labels(app_spec)
-        self._service_deployer.deploy(app_spec, selector, labels)
-        self._ingress_deployer.deploy(app_spec, labels)
-        self._deployment_deployer.deploy(app_spec, selector, labels, _besteffort_qos_is_required(app_spec))
-        self._autoscaler_deployer.deploy(app_spec, labels)
+        expires = current_deadline()
+        concurrent = [
+            self._executor.apply_async(self._run_phase, ("service", app_spec, expires, self._service_deployer.deploy,
+                                                         app_spec, selector, labels)),
+            self._executor.apply_async(self._run_phase, ("ingress", app_spec, expires, self._ingress_deployer.deploy,
+                                                         app_spec, labels)),
+        ]
+        errors = []
+        error = self._run_phase("deployment", app_spec, expires, self._deployment_deployer.deploy, app_spec, selector,
+                                labels, besteffort_qos_is_required)
+        if error is None:
+            error = self._run_phase("autoscaler", app_spec, expires, self._autoscaler_deployer.deploy, app_spec, labels)
+        errors.append(error)
+        errors.extend(result.get() for result in concurrent)
+        _raise_errors([e for e in errors if e is not None])
+
+    def _run_phase(self, phase, app_spec, expires, func, *args):
+        """Run one phase of a deploy within the deadline of the deploy, returning the phase and exc_info if it failed"""
+        set_extras(app_spec)
+        try:
+            with deadline(expires=expires), self._bookkeeper.time_phase(phase):
+                func(*args)
+        except Exception:
+            return phase, sys.exc_info()
 
     def delete(self, app_spec):
         self._ingress_deployer.delete(app_spec)
@@ -79,6 +123,16 @@ def _to_valid_label_value(value):
         .replace(":", "-")
 
 
+def _raise_errors(errors):
+    if len(errors) == 1:
+        _, exc_info = errors[0]
+        six.reraise(*exc_info)
+    if errors:
+        for phase, exc_info in errors:
+            LOG.error("Failed to deploy %s", phase, exc_info=exc_info)
+        raise DeployFailed(errors)
+
+
 def _make_selector(app_spec):
     return {'app': app_spec.name}
 
@@ -86,8 +140,3 @@ def _make_selector(app_spec):
 def _remove_resource_requirements(app_spec):
     no_requirements = ResourceRequirementSpec(cpu=None, memory=None)
     return app_spec._replace(resources=ResourcesSpec(limits=no_requirements, requests=no_requirements))
-
-
-def _besteffort_qos_is_required(app_spec):
-    resourcequotas = ResourceQuota.list(namespace=app_spec.namespace)
-    return any(rq.spec.hard.get("pods") == "0" and NotBestEffort in rq.spec.scopes for rq in resourcequotas)
@@ -29,9 +29,10 @@ LOG = logging.getLogger(__name__)
 
 
 class AutoscalerDeployer(object):
-    def __init__(self, owner_references):
+    def __init__(self, owner_references, resource_cache):
         self.name = "autoscaler"
         self._owner_references = owner_references
+        self._resource_cache = resource_cache
 
     @retry_on_upsert_conflict
     def deploy(self, app_spec, labels):
@@ -45,20 +46,20 @@ class AutoscalerDeployer(object):
                                                minReplicas=app_spec.autoscaler.min_replicas,
                                                maxReplicas=app_spec.autoscaler.max_replicas,
                                                targetCPUUtilizationPercentage=app_spec.autoscaler.cpu_threshold_percentage)
-            autoscaler = HorizontalPodAutoscaler.get_or_create(metadata=metadata, spec=spec)
+            autoscaler = self._resource_cache.get_or_create(HorizontalPodAutoscaler, metadata=metadata, spec=spec)
             self._owner_references.apply(autoscaler, app_spec)
-            autoscaler.save()
+            self._resource_cache.save(autoscaler)
         else:
             try:
                 LOG.info("Deleting any pre-existing autoscaler for %s", app_spec.name)
-                HorizontalPodAutoscaler.delete(app_spec.name, app_spec.namespace)
+                self._resource_cache.delete(HorizontalPodAutoscaler, app_spec.name, app_spec.namespace)
             except NotFound:
                 pass
 
     def delete(self, app_spec):
         LOG.info("Deleting autoscaler for %s", app_spec.name)
         try:
-            HorizontalPodAutoscaler.delete(app_spec.name, app_spec.namespace)
+            self._resource_cache.delete(HorizontalPodAutoscaler, app_spec.name, app_spec.namespace)
         except NotFound:
             pass
 
@@ -36,7 +36,8 @@ LOG = logging.getLogger(__name__)
 class DeploymentDeployer(object):
     MINIMUM_GRACE_PERIOD = 30
 
-    def __init__(self, config, datadog, prometheus, deployment_secrets, owner_references):
+    def __init__(self, config, datadog, prometheus, deployment_secrets, owner_references, resource_cache):
+        self._resource_cache = resource_cache
         self._datadog = datadog
         self._prometheus = prometheus
         self._secrets = deployment_secrets
@@ -96,17 +97,14 @@ class DeploymentDeployer(object):
                                   annotations=app_spec.annotations.pod)
         pod_template_spec = PodTemplateSpec(metadata=pod_metadata, spec=pod_spec)
         replicas = app_spec.autoscaler.min_replicas
+        deployment = self._resource_cache.find(Deployment, app_spec.name, app_spec.namespace)
         # we must avoid that the deployment scales up to app_spec.autoscaler.min_replicas if autoscaler has set another value
-        if should_have_autoscaler(app_spec):
-            try:
-                deployment = Deployment.get(app_spec.name, app_spec.namespace)
-                # the autoscaler won't scale up the deployment if the current number of replicas is 0
-                if deployment.spec.replicas > 0:
-                    replicas = deployment.spec.replicas
-                    LOG.info("Configured replica size (%d) for deployment is being ignored, as current running replica size"
-                             " is different (%d) for %s", app_spec.autoscaler.min_replicas, deployment.spec.replicas, app_spec.name)
-            except NotFound:
-                pass
+        if should_have_autoscaler(app_spec) and deployment:
+            # the autoscaler won't scale up the deployment if the current number of replicas is 0
+            if deployment.spec.replicas > 0:
+                replicas = deployment.spec.replicas
+                LOG.info("Configured replica size (%d) for deployment is being ignored, as current running replica size"
+                         " is different (%d) for %s", app_spec.autoscaler.min_replicas, deployment.spec.replicas, app_spec.name)
 
         deployment_strategy = DeploymentStrategy(
             rollingUpdate=RollingUpdateDeployment(maxUnavailable=self._max_unavailable,
@@ -118,18 +116,18 @@ class DeploymentDeployer(object):
                               template=pod_template_spec, revisionHistoryLimit=5,
                               strategy=deployment_strategy)
 
-        deployment = Deployment.get_or_create(metadata=metadata, spec=spec)
+        deployment = self._resource_cache.update_or_create(Deployment, deployment, metadata=metadata, spec=spec)
         self._datadog.apply(deployment, app_spec, besteffort_qos_is_required)
         self._prometheus.apply(deployment, app_spec)
         self._secrets.apply(deployment, app_spec)
         self._owner_references.apply(deployment, app_spec)
-        deployment.save()
+        self._resource_cache.save(deployment)
 
     def delete(self, app_spec):
         LOG.info("Deleting deployment for %s", app_spec.name)
         try:
             body = {"kind": "DeleteOptions", "apiVersion": "v1", "propagationPolicy": "Foreground"}
-            Deployment.delete(app_spec.name, app_spec.namespace, body=body)
+            self._resource_cache.delete(Deployment, app_spec.name, app_spec.namespace, body=body)
         except NotFound:
             pass
 
@@ -35,11 +35,12 @@ LOG = logging.getLogger(__name__)
 
 
 class IngressDeployer(object):
-    def __init__(self, config, ingress_tls, owner_references):
+    def __init__(self, config, ingress_tls, owner_references, resource_cache):
         self._ingress_suffixes = config.ingress_suffixes
         self._host_rewrite_rules = config.host_rewrite_rules
         self._ingress_tls = ingress_tls
         self._owner_references = owner_references
+        self._resource_cache = resource_cache
 
     def deploy(self, app_spec, labels):
         if self._should_have_ingress(app_spec):
@@ -50,7 +51,8 @@ class IngressDeployer(object):
     def delete(self, app_spec):
         LOG.info("Deleting ingresses for %s", app_spec.name)
         try:
-            Ingress.delete_list(namespace=app_spec.namespace, labels={"app": Equality(app_spec.name), "fiaas/deployment_id": Exists()})
+            labels = {"app": Equality(app_spec.name), "fiaas/deployment_id": Exists()}
+            self._resource_cache.delete_list(Ingress, app_spec.namespace, labels)
         except NotFound:
             pass
 
@@ -112,12 +114,12 @@ class IngressDeployer(object):
 
         ingress_spec = IngressSpec(rules=host_ingress_rules)
 
-        ingress = Ingress.get_or_create(metadata=metadata, spec=ingress_spec)
+        ingress = self._resource_cache.get_or_create(Ingress, metadata=metadata, spec=ingress_spec)
 
         hosts_for_tls = [rule.host for rule in host_ingress_rules]
         self._ingress_tls.apply(ingress, app_spec, hosts_for_tls, use_suffixes=use_suffixes)
         self._owner_references.apply(ingress, app_spec)
-        ingress.save()
+        self._resource_cache.save(ingress)
 
     def _delete_unused(self, app_spec, labels):
         filter_labels = [
@@ -125,7 +127,7 @@ class IngressDeployer(object):
             ("fiaas/deployment_id", Exists()),
             ("fiaas/deployment_id", Inequality(labels["fiaas/deployment_id"]))
         ]
-        Ingress.delete_list(namespace=app_spec.namespace, labels=filter_labels)
+        self._resource_cache.delete_list(Ingress, app_spec.namespace, filter_labels)
 
     def _generate_default_hosts(self, name):
         for suffix in self._ingress_suffixes:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import logging
+import threading
+
+from k8s.models.resourcequota import ResourceQuota, NotBestEffort
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Gauge
+
+from ...informer import Informer
+
+LOG = logging.getLogger(__name__)
+
+cache_age = Gauge("resource_quota_cache_age", "Seconds since the oldest cached best-effort QoS decision was computed")
+
+
+class QuotaCache(object):
+    """Watch-backed cache of whether the ResourceQuotas of a namespace require best-effort QoS
+
+    The ResourceQuotas are listed once and then watched. The decision for a namespace is computed the first time it is
+    needed, and shared by all deploys to that namespace until a ResourceQuota in the namespace changes. Until the
+    ResourceQuotas have been listed, the decision is made by listing them from the API server.
+    """
+
+    def __init__(self, config, time_func=time_monotonic):
+        namespace = None if config.enable_deprecated_multi_namespace_support else config.namespace
+        self._informer = Informer(ResourceQuota, namespace)
+        self._informer.add_handler(self._on_change)
+        self._decisions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._time_func = time_func
+        cache_age.set_function(self.age)
+
+    def start(self):
+        self._informer.start()
+
+    def is_alive(self):
+        return self._informer.is_alive()
+
+    def threads(self):
+        return [self._informer]
+
+    def besteffort_qos_is_required(self, namespace):
+        if not self._informer.has_synced():
+            return _besteffort_qos_is_required(ResourceQuota.list(namespace=namespace))
+        with self._lock:
+            decision = self._decisions.get(namespace)
+            generation = self._generation
+        if decision is None:
+            required = _besteffort_qos_is_required(self._informer.list(namespace))
+            with self._lock:
+                # An invalidation while computing means the ResourceQuotas may have changed under us, so don't cache
+                if self._generation != generation:
+                    return required
+                decision = self._decisions.setdefault(namespace, (required, self._time_func()))
+        return decision[0]
+
+    def invalidate(self, namespace=None):
+        """Forget the decision for namespace, or for all namespaces"""
+        with self._lock:
+            self._generation += 1
+            if namespace is None:
+                self._decisions.clear()
+            else:
+                self._decisions.pop(namespace, None)
+
+    def age(self):
+        """Seconds since the oldest cached decision was computed"""
+        with self._lock:
+            if not self._decisions:
+                return 0
+            return self._time_func() - min(computed_at for _, computed_at in self._decisions.values())
+
+    def _on_change(self, event_type, resource_quota):
+        LOG.debug("ResourceQuota %s in %s was %s", resource_quota.metadata.name, resource_quota.metadata.namespace,
+                  event_type)
+        self.invalidate(resource_quota.metadata.namespace)
+
+
+def _besteffort_qos_is_required(resourcequotas):
+    return any(rq.spec.hard.get("pods") == "0" and NotBestEffort in rq.spec.scopes for rq in resourcequotas)
@@ -16,44 +16,148 @@
 # limitations under the License.
 
 import logging
+import threading
 
-from k8s.client import NotFound
 from k8s.models.deployment import Deployment
 from monotonic import monotonic as time_monotonic
+from prometheus_client import Gauge
 
 LOG = logging.getLogger(__name__)
+DEPLOYMENT_ID_LABEL = "fiaas/deployment_id"
+
+in_flight_gauge = Gauge("deployer_ready_checks_in_flight", "Number of deploys waiting to become ready")
+
+
+class ReadinessTracker(object):
+    """Tell waiting ReadyChecks when their Deployment changes, using the Deployment watch of the ResourceCache
+
+    This replaces polling each Deployment while it is rolled out. Until the cache has been filled, ReadyChecks read the
+    Deployment from the API server, and are still checked periodically by the Scheduler.
+    """
+
+    def __init__(self, resource_cache):
+        self._resource_cache = resource_cache
+        self._resource_cache.add_handler(Deployment, self._handle_change)
+        self._checks = {}
+        self._lock = threading.Lock()
+        in_flight_gauge.set_function(self.size)
+
+    def register(self, check):
+        """Notify check when its Deployment changes, replacing any check waiting for an earlier deployment"""
+        with self._lock:
+            replaced = self._checks.get(check.key)
+            self._checks[check.key] = check
+        if replaced is not None and replaced is not check:
+            # The replaced check will find the Deployment labeled with a newer deployment_id, and be superseded
+            replaced.notify()
+
+    def size(self):
+        """Return the number of ReadyChecks waiting for their Deployment to become ready"""
+        with self._lock:
+            return len(self._checks)
+
+    def unregister(self, check):
+        with self._lock:
+            if self._checks.get(check.key) is check:
+                del self._checks[check.key]
+
+    def get_deployment(self, name, namespace):
+        """Return the Deployment, or None if it doesn't exist"""
+        return self._resource_cache.find(Deployment, name, namespace)
+
+    def _handle_change(self, event_type, deployment):
+        with self._lock:
+            check = self._checks.get((deployment.metadata.namespace, deployment.metadata.name))
+        if check:
+            check.notify()
 
 
 class ReadyCheck(object):
-    def __init__(self, app_spec, bookkeeper, lifecycle, lifecycle_subject, config):
+    def __init__(self, app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker, leader_elector):
         self._app_spec = app_spec
         self._bookkeeper = bookkeeper
         self._lifecycle = lifecycle
         self._lifecycle_subject = lifecycle_subject
+        self._readiness_tracker = readiness_tracker
+        self._leader_elector = leader_elector
         self._fail_after_seconds = _calculate_fail_time(
             config.ready_check_timeout_multiplier,
             app_spec.autoscaler.max_replicas,
             app_spec.health_checks.readiness.initial_delay_seconds
         )
         self._fail_after = time_monotonic() + self._fail_after_seconds
+        self._lock = threading.Lock()
+        self._done = False
+
+    @property
+    def key(self):
+        return self._app_spec.namespace, self._app_spec.name
 
     def __call__(self):
-        if self._ready():
-            self._lifecycle.success(self._lifecycle_subject)
-            self._bookkeeper.success(self._app_spec)
+        """Called by the scheduler. Checks readiness and timeout, returning True while still waiting"""
+        with self._lock:
+            if self._done or self._abandon() or self._resolve():
+                return False
+            if time_monotonic() >= self._fail_after:
+                LOG.error("Timed out after %d seconds waiting for %s to become ready",
+                          self._fail_after_seconds, self._app_spec.name)
+                self._fail()
+                return False
+            return True
+
+    def notify(self):
+        """Called by the ReadinessTracker when the Deployment has changed"""
+        with self._lock:
+            if not self._done and not self._abandon():
+                self._resolve()
+
+    def _resolve(self):
+        """Succeed if the Deployment is ready, or give up if it has been deployed again since. True when done"""
+        dep = self._readiness_tracker.get_deployment(self._app_spec.name, self._app_spec.namespace)
+        if dep is None:
             return False
-        if time_monotonic() >= self._fail_after:
-            LOG.error("Timed out after %d seconds waiting for %s to become ready",
-                      self._fail_after_seconds, self._app_spec.name)
-            self._lifecycle.failed(self._lifecycle_subject)
-            self._bookkeeper.failed(self._app_spec)
+        deployment_id = dep.metadata.labels.get(DEPLOYMENT_ID_LABEL)
+        if deployment_id is not None and deployment_id != self._app_spec.deployment_id:
+            LOG.info("Deployment %s of %s has been replaced by %s, no longer waiting for it to become ready",
+                     self._app_spec.deployment_id, self._app_spec.name, deployment_id)
+            self._supersede()
+            return True
+        if self._ready(dep):
+            self._succeed()
+            return True
+        return False
+
+    def _abandon(self):
+        """Stop waiting without saving a result if this replica has lost its leadership. True when abandoned"""
+        if self._leader_elector.is_leader():
             return False
+        LOG.info("No longer the leader, leaving deployment %s of %s to the new leader", self._app_spec.deployment_id,
+                 self._app_spec.name)
+        self._done = True
+        self._readiness_tracker.unregister(self)
         return True
 
-    def _ready(self):
-        try:
-            dep = Deployment.get(self._app_spec.name, self._app_spec.namespace)
-        except NotFound:
+    def _succeed(self):
+        self._done = True
+        self._readiness_tracker.unregister(self)
+        self._lifecycle.success(self._lifecycle_subject)
+        self._bookkeeper.success(self._app_spec)
+
+    def _fail(self):
+        self._done = True
+        self._readiness_tracker.unregister(self)
+        self._lifecycle.failed(self._lifecycle_subject)
+        self._bookkeeper.failed(self._app_spec)
+
+    def _supersede(self):
+        self._done = True
+        self._readiness_tracker.unregister(self)
+        self._lifecycle.superseded(self._lifecycle_subject)
+        self._bookkeeper.superseded(self._app_spec)
+
+    @staticmethod
+    def _ready(dep):
+        if dep.metadata.labels.get(DEPLOYMENT_ID_LABEL) is None:
             return False
         expected_value = dep.spec.replicas if dep.spec.replicas > 0 else None
 
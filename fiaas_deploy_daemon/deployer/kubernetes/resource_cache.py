@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import hashlib
+import json
+import logging
+import threading
+
+from k8s.base import Model, LabelSelector, Equality, Inequality, In, NotIn, Exists
+from k8s.client import ClientError, NotFound
+from k8s.fields import ReadOnlyField, OnceField
+from k8s.models.autoscaler import HorizontalPodAutoscaler
+from k8s.models.deployment import Deployment
+from k8s.models.ingress import Ingress
+from k8s.models.service import Service
+from prometheus_client import Counter
+
+from ...informer import Informer, resource_key
+from ...retry import UpsertConflict
+
+LOG = logging.getLogger(__name__)
+CACHED_MODELS = (Deployment, Service, Ingress, HorizontalPodAutoscaler)
+# Every resource created by fiaas-deploy-daemon has this label, see K8s._make_labels
+MANAGED_LABELS = {"fiaas/deployment_id": Exists()}
+DESIRED_STATE_HASH_ANNOTATION = "fiaas/desired-state-hash"
+
+cache_hits = Counter("resource_cache_hits", "Reads of managed resources answered from the watch cache", ["kind"])
+cache_misses = Counter("resource_cache_misses", "Reads of managed resources that went to the API server", ["kind"])
+cache_stale = Counter("resource_cache_stale", "Writes of managed resources rejected because the cached copy was stale",
+                      ["kind"])
+skipped_writes = Counter("resource_cache_skipped_writes",
+                         "Writes of managed resources skipped because the desired state was unchanged", ["kind"])
+
+
+class ResourceCache(object):
+    """Watch-backed cache of the resources managed by the K8s adapter
+
+    Each kind is listed once and then kept up to date by a watch, so reading the current state of a resource before
+    updating it needs no request to the API server. Until a kind has been listed, reads go to the API server.
+    Resources written through `save` are put in the cache right away, and resources deleted through `delete` or
+    `delete_list` are removed. If the API server rejects a write because the cached copy was stale, the next read of
+    that resource goes to the API server.
+
+    Before saving, a hash of the desired state is stored in an annotation on the resource. When the hash is the same as
+    on the cached copy, the resource is already up to date, and the write is skipped.
+
+    Only resources labeled by fiaas-deploy-daemon are cached. An unlabeled resource with the same name is not found in
+    the cache, so creating it fails with a conflict, and the retry reads it from the API server.
+    """
+
+    def __init__(self, config):
+        namespace = None if config.enable_deprecated_multi_namespace_support else config.namespace
+        self._informers = {model: Informer(model, namespace, MANAGED_LABELS) for model in CACHED_MODELS}
+        self._invalid = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        for informer in self._informers.values():
+            informer.start()
+
+    def is_alive(self):
+        return all(informer.is_alive() for informer in self._informers.values())
+
+    def threads(self):
+        return list(self._informers.values())
+
+    def add_handler(self, model, handler):
+        self._informers[model].add_handler(handler)
+
+    def find(self, model, name, namespace):
+        """Return a copy of the current state of a resource, or None if it doesn't exist"""
+        informer = self._informers[model]
+        key = (model, namespace, name)
+        with self._lock:
+            use_cache = informer.has_synced() and key not in self._invalid
+            self._invalid.discard(key)
+        if use_cache:
+            cache_hits.labels(model.__name__).inc()
+            cached = informer.get(namespace, name)
+            return None if cached is None else _copy(cached)
+        cache_misses.labels(model.__name__).inc()
+        try:
+            instance = model.get(name, namespace)
+        except NotFound:
+            return None
+        informer.put(_copy(instance))
+        return instance
+
+    def get_or_create(self, model, **kwargs):
+        """Like `Model.get_or_create`, but reading the current state through the cache"""
+        metadata = kwargs.get("metadata")
+        return self.update_or_create(model, self.find(model, metadata.name, metadata.namespace), **kwargs)
+
+    @staticmethod
+    def update_or_create(model, instance, **kwargs):
+        """Set the fields given in kwargs on an instance returned from `find`, or create a new one if it was None"""
+        if instance is None:
+            return model(new=True, **kwargs)
+        for field in model._meta.fields:
+            field.set(instance, kwargs)
+        return instance
+
+    def save(self, instance):
+        """Save to the API server, keeping the cache up to date
+
+        A 404 when updating means the resource was deleted after it was read from the cache, and is raised as an
+        UpsertConflict, so it is retried like a 409.
+        """
+        model = type(instance)
+        updating = not instance._new
+        digest = _set_desired_state_hash(instance)
+        if updating and self._is_unchanged(model, instance, digest):
+            LOG.debug("%s %s/%s is unchanged, not saving", model.__name__, *resource_key(instance))
+            skipped_writes.labels(model.__name__).inc()
+            return
+        try:
+            instance.save()
+        except ClientError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code == 409 or (status_code == 404 and updating):
+                LOG.debug("Got %d saving %s %s/%s, will read it from the API server on retry", status_code,
+                          model.__name__, *resource_key(instance))
+                cache_stale.labels(model.__name__).inc()
+                self._invalidate(model, *resource_key(instance))
+                if status_code == 404:
+                    raise UpsertConflict(e, e.response)
+            raise
+        self._informers[model].put(_copy(instance))
+
+    def delete(self, model, name, namespace, **kwargs):
+        """Like `Model.delete`, removing the resource from the cache"""
+        try:
+            model.delete(name, namespace, **kwargs)
+        finally:
+            self._informers[model].remove(namespace, name)
+
+    def delete_list(self, model, namespace, labels, **kwargs):
+        """Like `Model.delete_list`, removing the matching resources from the cache"""
+        try:
+            model.delete_list(namespace=namespace, labels=labels, **kwargs)
+        finally:
+            informer = self._informers[model]
+            for instance in informer.list(namespace):
+                if _matches(instance.metadata.labels or {}, labels):
+                    informer.remove(*resource_key(instance))
+
+    def _is_unchanged(self, model, instance, digest):
+        namespace, name = resource_key(instance)
+        with self._lock:
+            if (model, namespace, name) in self._invalid:
+                return False
+        current = self._informers[model].get(namespace, name)
+        return current is not None and (current.metadata.annotations or {}).get(DESIRED_STATE_HASH_ANNOTATION) == digest
+
+    def _invalidate(self, model, namespace, name):
+        with self._lock:
+            self._invalid.add((model, namespace, name))
+
+
+def _copy(instance):
+    return type(instance).from_dict(instance.as_dict())
+
+
+def _set_desired_state_hash(instance):
+    """Annotate instance with a hash of its desired state, and return the hash"""
+    annotations = dict(instance.metadata.annotations or {})
+    annotations.pop(DESIRED_STATE_HASH_ANNOTATION, None)
+    state = _desired_state(instance)
+    state["metadata"]["annotations"] = _desired_state(annotations)
+    digest = hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    annotations[DESIRED_STATE_HASH_ANNOTATION] = digest
+    instance.metadata.annotations = annotations
+    return digest
+
+
+def _desired_state(value):
+    """The fields set by fiaas-deploy-daemon, leaving out those only the API server sets or changes"""
+    if isinstance(value, Model):
+        return {field.name: _desired_state(getattr(value, field.name)) for field in value._meta.fields
+                if not isinstance(field, (ReadOnlyField, OnceField))}
+    if isinstance(value, list):
+        return [_desired_state(item) for item in value]
+    if isinstance(value, dict):
+        # Like Model.as_dict, which leaves out None values and empty dicts, so the API server never returns them
+        return {key: _desired_state(item) for key, item in value.items() if item is not None} or None
+    return value
+
+
+def _matches(resource_labels, labels):
+    """Check resource labels against a label selector, in any of the forms accepted by `Model.delete_list`"""
+    if hasattr(labels, "items"):
+        labels = labels.items()
+    for key, selector in labels:
+        if not isinstance(selector, LabelSelector):
+            selector = Equality(selector)
+        value = resource_labels.get(key)
+        if isinstance(selector, Exists):
+            matched = key in resource_labels
+        elif isinstance(selector, Inequality):
+            matched = value != selector.value
+        elif isinstance(selector, In):
+            matched = value in selector.value
+        elif isinstance(selector, NotIn):
+            matched = value not in selector.value
+        else:
+            matched = value == selector.value
+        if not matched:
+            return False
+    return True
@@ -30,9 +30,10 @@ LOG = logging.getLogger(__name__)
 
 
 class ServiceDeployer(object):
-    def __init__(self, config, owner_references):
+    def __init__(self, config, owner_references, resource_cache):
         self._service_type = config.service_type
         self._owner_references = owner_references
+        self._resource_cache = resource_cache
 
     def deploy(self, app_spec, selector, labels):
         if self._should_have_service(app_spec):
@@ -43,7 +44,7 @@ class ServiceDeployer(object):
     def delete(self, app_spec):
         LOG.info("Deleting service for %s", app_spec.name)
         try:
-            Service.delete(app_spec.name, app_spec.namespace)
+            self._resource_cache.delete(Service, app_spec.name, app_spec.namespace)
         except NotFound:
             pass
 
@@ -51,19 +52,17 @@ class ServiceDeployer(object):
     def _create(self, app_spec, selector, labels):
         LOG.info("Creating/updating service for %s with labels: %s", app_spec.name, labels)
         ports = [self._make_service_port(port_spec) for port_spec in app_spec.ports]
-        try:
-            svc = Service.get(app_spec.name, app_spec.namespace)
+        svc = self._resource_cache.find(Service, app_spec.name, app_spec.namespace)
+        if svc:
             ports = self._merge_ports(svc.spec.ports, ports)
-        except NotFound:
-            pass
         service_name = app_spec.name
         custom_labels = merge_dicts(app_spec.labels.service, labels)
         custom_annotations = merge_dicts(app_spec.annotations.service, self._make_tcp_port_annotation(app_spec))
         metadata = ObjectMeta(name=service_name, namespace=app_spec.namespace, labels=custom_labels, annotations=custom_annotations)
         spec = ServiceSpec(selector=selector, ports=ports, type=self._service_type)
-        svc = Service.get_or_create(metadata=metadata, spec=spec)
+        svc = self._resource_cache.update_or_create(Service, svc, metadata=metadata, spec=spec)
         self._owner_references.apply(svc, app_spec)
-        svc.save()
+        self._resource_cache.save(svc)
 
     @staticmethod
     def _merge_ports(existing_ports, wanted_ports):
@@ -14,31 +14,96 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import time
-from Queue import PriorityQueue
+import errno
+import fcntl
+import heapq
+import itertools
+import logging
+import os
+import select
+import threading
+from multiprocessing.pool import ThreadPool
 
 from monotonic import monotonic as time_monotonic
+from prometheus_client import Histogram
 
 from ..base_thread import DaemonThread
 
+LOG = logging.getLogger(__name__)
+RESCHEDULE_DELAY = 10
+
 
 class Scheduler(DaemonThread):
-    def __init__(self, time_func=time_monotonic, delay_func=time.sleep):
+    """Run tasks when they are due
+
+    A task is a callable, which returns True if it wants to be run again RESCHEDULE_DELAY seconds later.
+    The scheduler sleeps until the earliest task is due, or a new task is added, and then runs all due tasks back to
+    back. When configured with more than one scheduler worker, due tasks are run on a small pool of threads. A task
+    that raises an exception is run again RESCHEDULE_DELAY seconds later.
+
+    On Python 2, waiting on a Condition or Event with a timeout polls every 50ms, so the scheduler instead waits in
+    `select` on a pipe, which `add` writes to when a new task becomes the earliest one.
+    """
+    lag_histogram = Histogram("scheduler_lag", "Seconds from a task is due until it is run")
+
+    def __init__(self, config, time_func=time_monotonic):
         super(Scheduler, self).__init__()
-        self._tasks = PriorityQueue()
+        self._tasks = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        fcntl.fcntl(self._wakeup_write, fcntl.F_SETFL, fcntl.fcntl(self._wakeup_write, fcntl.F_GETFL) | os.O_NONBLOCK)
         self._time_func = time_func
-        self._delay_func = delay_func
+        self._executor = ThreadPool(config.scheduler_workers) if config.scheduler_workers > 1 else None
 
     def __call__(self, *args, **kwargs):
         while True:
-            execute_at, task = self._tasks.get()
-            if self._time_func() >= execute_at:
-                if task():
-                    self.add(task, 10)
-            else:
-                self.add(task)
-            self._delay_func(1)
+            for execute_at, task in self._wait_for_due_tasks():
+                if self._executor:
+                    self._executor.apply_async(self._run, (execute_at, task))
+                else:
+                    self._run(execute_at, task)
 
     def add(self, task, delay=1):
         execute_at = self._time_func() + delay
-        self._tasks.put((execute_at, task))
+        entry = (execute_at, next(self._sequence), task)
+        with self._lock:
+            heapq.heappush(self._tasks, entry)
+            earliest = self._tasks[0] is entry
+        if earliest:
+            self._wake_up()
+
+    def _wait_for_due_tasks(self):
+        while True:
+            with self._lock:
+                now = self._time_func()
+                due = []
+                while self._tasks and self._tasks[0][0] <= now:
+                    execute_at, _, task = heapq.heappop(self._tasks)
+                    due.append((execute_at, task))
+                if due:
+                    return due
+                timeout = self._tasks[0][0] - now if self._tasks else None
+            self._sleep(timeout)
+
+    def _sleep(self, timeout):
+        readable, _, _ = select.select([self._wakeup_read], [], [], timeout)
+        if readable:
+            os.read(self._wakeup_read, 4096)
+
+    def _wake_up(self):
+        try:
+            os.write(self._wakeup_write, b"x")
+        except OSError as e:
+            # A full pipe will wake up the scheduler anyway
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def _run(self, execute_at, task):
+        self.lag_histogram.observe(max(0, self._time_func() - execute_at))
+        try:
+            if task():
+                self.add(task, RESCHEDULE_DELAY)
+        except Exception:
+            LOG.exception("Error when running scheduled task %r, trying again in %d seconds", task, RESCHEDULE_DELAY)
+            self.add(task, RESCHEDULE_DELAY)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import json
+import logging
+import threading
+import time
+
+from k8s import config
+from k8s.base import WatchEvent
+from k8s.client import ClientError
+
+from .base_thread import DaemonThread
+
+LOG = logging.getLogger(__name__)
+RETRY_DELAY = 5
+# Extra seconds to wait for data on a watch, beyond the timeout given to the API server
+WATCH_READ_GRACE = 10
+DEFAULT_PAGE_SIZE = 500
+# Resources fetched in each request when listing, set from the configuration at startup
+list_page_size = DEFAULT_PAGE_SIZE
+
+
+class ResourceVersionExpired(Exception):
+    """The API server no longer has the requested resourceVersion, and the resources must be listed again"""
+
+
+def list_resources(model, namespace=None, labels=None, page_size=None):
+    """List resources, returning the items and the resourceVersion the list was taken at
+
+    :param model: the Model class to list
+    :param namespace: the namespace to list in, or None for all namespaces
+    :param labels: label selector, as accepted by `Model.find`
+    :param page_size: the number of resources to fetch in each request, default `list_page_size`
+    """
+    items = []
+    resource_version = None
+    for page, resource_version in list_pages(model, namespace, labels, page_size):
+        items.extend(page)
+    return items, resource_version
+
+
+def iter_resources(model, namespace=None, labels=None, page_size=None):
+    """Generate the resources of a list, fetching them a page at a time, see `list_pages`"""
+    for page, _ in list_pages(model, namespace, labels, page_size):
+        for item in page:
+            yield item
+
+
+def list_pages(model, namespace=None, labels=None, page_size=None):
+    """List resources in pages of at most page_size, generating the items of each page and the list's resourceVersion
+
+    The next page is only fetched when the previous one has been used, so only one page is held in memory. All pages
+    are from the same snapshot, with the same resourceVersion.
+    Raises ResourceVersionExpired if the API server expires the snapshot before all pages are read.
+    """
+    url = _list_url(model, namespace)
+    params = _selector_params(model, labels)
+    params["limit"] = page_size or list_page_size
+    while True:
+        try:
+            resp = model._client.get(url, params=dict(params))
+        except ClientError as e:
+            if e.response.status_code == 410 and "continue" in params:  # Gone
+                raise ResourceVersionExpired(str(e))
+            raise
+        data = resp.json()
+        metadata = data[u"metadata"]
+        yield [model.from_dict(item) for item in data[u"items"]], metadata[u"resourceVersion"]
+        token = metadata.get(u"continue")
+        if not token:
+            return
+        params["continue"] = token
+
+
+def watch_resources(model, namespace=None, labels=None, resource_version=None):
+    """Watch resources, starting after resource_version
+
+    Returns a generator of WatchEvents, which ends when the API server closes the connection, at the latest after
+    `stream_timeout` seconds from the k8s config.
+    Raises ResourceVersionExpired if the API server is unable to resume from resource_version.
+    """
+    params = _selector_params(model, labels)
+    params["watch"] = "true"
+    params["timeoutSeconds"] = config.stream_timeout
+    if resource_version:
+        params["resourceVersion"] = resource_version
+    try:
+        # The API server ends the watch after timeoutSeconds, so a longer silence means the connection is lost
+        resp = model._client.get(_list_url(model, namespace), params=params, stream=True,
+                                 timeout=config.stream_timeout + WATCH_READ_GRACE)
+    except ClientError as e:
+        if e.response.status_code == 410:  # Gone
+            raise ResourceVersionExpired(str(e))
+        raise
+    for line in resp.iter_lines(chunk_size=None):
+        event_json = _parse_event(line)
+        if event_json is None:
+            continue
+        if event_json.get(u"type") == u"ERROR":
+            _handle_error(model, event_json.get(u"object", {}))
+            return
+        yield WatchEvent(event_json, model)
+
+
+def _parse_event(line):
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        LOG.exception("Unable to parse JSON on watch event, discarding event. Line: %r", line)
+        return None
+
+
+def _handle_error(model, status):
+    if status.get(u"code") == 410:
+        raise ResourceVersionExpired(status.get(u"message"))
+    LOG.warning("Error event while watching %s: %r", model.__name__, status)
+
+
+def _list_url(model, namespace):
+    if namespace is None:
+        # Not all models define list_url, but every namespaced resource can also be listed across namespaces
+        return model._meta.list_url or model._meta.url_template.replace("/namespaces/{namespace}", "").format(name="")
+    return model._build_url(name="", namespace=namespace)
+
+
+def _selector_params(model, labels):
+    return {"labelSelector": model._label_selector(labels)} if labels else {}
+
+
+def resource_key(obj):
+    return obj.metadata.namespace, obj.metadata.name
+
+
+def _is_newer(obj, other):
+    """Compare resourceVersions, which are opaque strings, but in practice increasing integers"""
+    try:
+        return int(obj.metadata.resourceVersion) > int(other.metadata.resourceVersion)
+    except (TypeError, ValueError):
+        return obj.metadata.resourceVersion != other.metadata.resourceVersion
+
+
+class Informer(DaemonThread):
+    """Keep a local copy of a set of resources up to date, by listing them once and then watching for changes
+
+    When the connection drops, the watch is resumed from the last seen resourceVersion. The resources are only listed
+    again if the API server has expired that resourceVersion. Handlers added with `add_handler` are called with the
+    event type and the resource for every change, after the local copy has been updated. Changes found when listing
+    again are passed on the same way.
+    """
+
+    def __init__(self, model, namespace=None, labels=None):
+        self._model = model
+        super(Informer, self).__init__()
+        self._namespace = namespace
+        self._labels = labels
+        self._store = {}
+        self._resource_version = None
+        self._synced = threading.Event()
+        self._handlers = []
+        self._lock = threading.RLock()
+
+    def _make_name(self):
+        return "{}Informer".format(self._model.__name__)
+
+    def __call__(self):
+        while True:
+            try:
+                with self.working_on("{} watch".format(self._model.__name__)):
+                    if self._resource_version is None:
+                        self._relist()
+                    self._watch()
+            except ResourceVersionExpired:
+                LOG.info("Resource version %s of %s has expired, listing again", self._resource_version,
+                         self._model.__name__)
+                self._resource_version = None
+            except Exception:
+                LOG.exception("Error while watching for changes on %s", self._model.__name__)
+                time.sleep(RETRY_DELAY)
+
+    def add_handler(self, handler):
+        self._handlers.append(handler)
+
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def get(self, namespace, name):
+        """Return the local copy of a resource, or None if it doesn't exist"""
+        with self._lock:
+            return self._store.get((namespace, name))
+
+    def put(self, obj):
+        """Update the local copy with a resource just written to the API server, unless a newer version is known"""
+        key = resource_key(obj)
+        with self._lock:
+            current = self._store.get(key)
+            if current is None or _is_newer(obj, current):
+                self._store[key] = self._cached(obj)
+
+    def remove(self, namespace, name):
+        """Remove the local copy of a resource just deleted from the API server"""
+        with self._lock:
+            self._store.pop((namespace, name), None)
+
+    def list(self, namespace=None):
+        """Return the local copies of all resources, or those in namespace"""
+        with self._lock:
+            return [obj for key, obj in self._store.items() if namespace is None or key[0] == namespace]
+
+    def _cached(self, obj):
+        """Return the part of a resource to keep in the local copy. Subclasses can leave out what they never read"""
+        return obj
+
+    def _relist(self):
+        items, resource_version = list_resources(self._model, self._namespace, self._labels)
+        listed = {resource_key(item): self._cached(item) for item in items}
+        with self._lock:
+            previous, self._store = self._store, listed
+            self._resource_version = resource_version
+        self._synced.set()
+        for item in items:
+            old = previous.get(resource_key(item))
+            if old is None:
+                self._notify(WatchEvent.ADDED, item)
+            elif old.metadata.resourceVersion != item.metadata.resourceVersion:
+                self._notify(WatchEvent.MODIFIED, item)
+        for key, item in previous.items():
+            if key not in listed:
+                self._notify(WatchEvent.DELETED, item)
+
+    def _watch(self):
+        for event in watch_resources(self._model, self._namespace, self._labels, self._resource_version):
+            key = resource_key(event.object)
+            with self._lock:
+                current = self._store.get(key)
+                if event.type == WatchEvent.DELETED:
+                    self._store.pop(key, None)
+                elif current is None or not _is_newer(current, event.object):
+                    self._store[key] = self._cached(event.object)
+                self._resource_version = event.object.metadata.resourceVersion
+            self._notify(event.type, event.object)
+
+    def _notify(self, event_type, obj):
+        for handler in self._handlers:
+            try:
+                handler(event_type, obj)
+            except Exception:
+                LOG.exception("Error in handler for %s on %s", event_type, self._model.__name__)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import logging
+import socket
+import threading
+import time
+
+from k8s.client import NotFound
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter, Gauge
+
+from . import leases
+from .base_thread import DaemonThread
+
+LOG = logging.getLogger(__name__)
+LEADER_LEASE = "fiaas-deploy-daemon-leader"
+LEADER = "leader"
+STANDBY = "standby"
+
+leader_gauge = Gauge("leader_election_is_leader", "1 while this replica is the leader")
+transition_counter = Counter("leader_election_transitions", "Times this replica became leader or stopped being leader",
+                             ["change"])
+
+
+class LeaderElector(DaemonThread):
+    """Elect one replica to deploy, through a Lease, while the others stand by with their caches up to date
+
+    The leader renews the Lease every fifth of `leader-lease-duration`. A standby tries to take the Lease just as
+    often, and gets it once it is released or has gone `leader-lease-duration` without being renewed. The leader stops
+    acting as soon as two thirds of the duration have passed without a renewal, before anyone else can take over.
+
+    A replica that loses the leadership after having had it reports itself as unhealthy, so it is restarted as a
+    standby rather than finishing deploys that a new leader is already doing. Listeners added with `add_listener` are
+    called when this replica becomes leader.
+    """
+
+    def __init__(self, config, time_func=time_monotonic):
+        super(LeaderElector, self).__init__()
+        self._namespace = config.namespace
+        self._duration = config.leader_lease_duration
+        self._identity = config.replica_id or socket.gethostname()
+        self._time_func = time_func
+        self._observer = leases.LeaseObserver(time_func)
+        self._lease = None
+        self._renewed_at = None
+        self._holder = None
+        self._was_leader = False
+        self._lost = False
+        self._listeners = []
+        self._lock = threading.Lock()
+        leader_gauge.set_function(lambda: 1 if self.is_leader() else 0)
+
+    def __call__(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                LOG.exception("Error while renewing the leader lease")
+            self.check()
+            time.sleep(self._duration / 5.0)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def is_leader(self):
+        with self._lock:
+            return self._renewed_at is not None and self._time_func() - self._renewed_at < self._duration * 2 / 3.0
+
+    def is_healthy(self):
+        return not self._lost
+
+    def role(self):
+        return LEADER if self.is_leader() else STANDBY
+
+    def sync(self):
+        """Take or renew the leader lease if it is free, expired or already ours"""
+        try:
+            lease = leases.Lease.get(LEADER_LEASE, self._namespace)
+        except NotFound:
+            lease = None
+        holder = leases.holder(lease)
+        if holder == self._identity or holder is None or self._observer.expired(lease):
+            taken = leases.take(lease, LEADER_LEASE, self._namespace, self._identity, self._duration)
+            if taken is not None:
+                lease, holder = taken, self._identity
+                with self._lock:
+                    self._renewed_at = self._time_func()
+        self._lease = lease
+        self._holder = holder
+
+    def check(self):
+        """Tell listeners when this replica has become leader, and note when it has stopped being leader"""
+        leader = self.is_leader()
+        if leader == self._was_leader:
+            return
+        self._was_leader = leader
+        if leader:
+            LOG.info("%s is now the leader", self._identity)
+            transition_counter.labels("elected").inc()
+            for listener in self._listeners:
+                try:
+                    listener()
+                except Exception:
+                    LOG.exception("Error in listener for leadership")
+        else:
+            LOG.error("%s is no longer the leader, the lease is held by %s", self._identity, self._holder)
+            transition_counter.labels("lost").inc()
+            self._lost = True
+
+    def resign(self):
+        """Release the lease if this replica holds it, so a standby can take over right away"""
+        lease = self._lease
+        with self._lock:
+            self._renewed_at = None
+        if leases.holder(lease) == self._identity:
+            try:
+                leases.release(lease)
+                LOG.info("%s released the leadership", self._identity)
+            except Exception:
+                LOG.exception("Failed to release the leader lease")
+
+
+class NoElection(object):
+    """Stand-in for LeaderElector when leader election is disabled, always leading"""
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+    def current_work(self):
+        return None
+
+    def add_listener(self, listener):
+        pass
+
+    def is_leader(self):
+        return True
+
+    def is_healthy(self):
+        return True
+
+    def role(self):
+        return None
+
+    def resign(self):
+        pass
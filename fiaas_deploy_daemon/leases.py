@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Lease objects, used by replicas of the daemon to agree on who does what"""
+from __future__ import absolute_import
+
+import logging
+from datetime import datetime
+
+import six
+from k8s.base import Model
+from k8s.client import ClientError
+from k8s.fields import Field
+from k8s.models.common import ObjectMeta
+from monotonic import monotonic as time_monotonic
+
+LOG = logging.getLogger(__name__)
+LEASE_LABELS = {"app": "fiaas-deploy-daemon"}
+
+
+class LeaseSpec(Model):
+    holderIdentity = Field(six.text_type)  # noqa: N815
+    leaseDurationSeconds = Field(int)  # noqa: N815
+    acquireTime = Field(six.text_type)  # noqa: N815
+    renewTime = Field(six.text_type)  # noqa: N815
+    leaseTransitions = Field(int)  # noqa: N815
+
+
+class Lease(Model):
+    class Meta:
+        list_url = "/apis/coordination.k8s.io/v1/leases"
+        url_template = "/apis/coordination.k8s.io/v1/namespaces/{namespace}/leases/{name}"
+        watch_list_url = "/apis/coordination.k8s.io/v1/watch/leases"
+        watch_list_url_template = "/apis/coordination.k8s.io/v1/watch/namespaces/{namespace}/leases"
+
+    apiVersion = Field(six.text_type, "coordination.k8s.io/v1")  # NOQA
+    kind = Field(six.text_type, "Lease")
+
+    metadata = Field(ObjectMeta)
+    spec = Field(LeaseSpec)
+
+
+def now():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def holder(lease):
+    """Return the identity holding lease, or None if it is missing or released"""
+    if lease is None or lease.spec is None:
+        return None
+    return lease.spec.holderIdentity or None
+
+
+def take(lease, name, namespace, identity, duration):
+    """Create or renew lease for identity, returning the saved lease, or None if another replica got there first
+
+    The update is conditional on the resourceVersion of lease, so two replicas can't both take the same lease.
+    """
+    stamp = now()
+    if lease is None:
+        metadata = ObjectMeta(name=name, namespace=namespace, labels=dict(LEASE_LABELS))
+        lease = Lease(metadata=metadata, spec=LeaseSpec(leaseTransitions=0))
+    elif lease.spec is None:
+        lease.spec = LeaseSpec(leaseTransitions=0)
+    if holder(lease) != identity:
+        lease.spec.acquireTime = stamp
+        if holder(lease) is not None:
+            lease.spec.leaseTransitions = (lease.spec.leaseTransitions or 0) + 1
+    lease.spec.holderIdentity = identity
+    lease.spec.leaseDurationSeconds = duration
+    lease.spec.renewTime = stamp
+    return _save(lease)
+
+
+def release(lease):
+    """Give up lease, so another replica can take it right away. Returns False if it had changed in the meantime"""
+    lease.spec.holderIdentity = None
+    return _save(lease) is not None
+
+
+def _save(lease):
+    try:
+        lease.save()
+    except ClientError as e:
+        if e.response.status_code != 409:  # Conflict, or AlreadyExists when creating
+            raise
+        LOG.debug("Lease %s was changed by another replica", lease.metadata.name)
+        return None
+    return lease
+
+
+class LeaseObserver(object):
+    """Tell whether leases have expired, by how long they have gone unchanged as seen by this process
+
+    The clocks of different replicas can't be compared, so the renewTime written by the holder is only used to see that
+    the lease was renewed. A lease seen for the first time is given a full leaseDurationSeconds before it expires.
+    """
+
+    def __init__(self, time_func=time_monotonic):
+        self._time_func = time_func
+        self._seen = {}
+
+    def expired(self, lease):
+        if holder(lease) is None:
+            return True
+        key = (lease.metadata.namespace, lease.metadata.name)
+        version = (lease.spec.holderIdentity, lease.spec.renewTime)
+        current_time = self._time_func()
+        seen = self._seen.get(key)
+        if seen is None or seen[0] != version:
+            self._seen[key] = (version, current_time)
+            return False
+        return current_time - seen[1] > lease.spec.leaseDurationSeconds
@@ -14,9 +14,24 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+"""Lifecycle of deploys, and the subscribers notified when it changes
+
+Changes are sent with the `DEPLOY_STATUS_CHANGED` blinker signal, in the thread making the change. Subscribers that do
+more than update some state in memory should use `subscribe`, so the change is handed to them in a thread of their own,
+and a slow subscriber doesn't slow down deploys.
+"""
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+from itertools import count
 
-from collections import namedtuple
 from blinker import signal
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter, Gauge, Histogram
+
+from .base_thread import DaemonThread
+
+LOG = logging.getLogger(__name__)
 
 DEPLOY_STATUS_CHANGED = "deploy_status_changed"
 
@@ -24,6 +39,19 @@ STATUS_FAILED = "failed"
 STATUS_STARTED = "started"
 STATUS_SUCCESS = "success"
 STATUS_INITIATED = "initiated"
+STATUS_SUPERSEDED = "superseded"
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE)
+
+latency_histogram = Histogram("lifecycle_subscriber_latency",
+                              "Seconds from a lifecycle change until a subscriber has handled it", ["subscriber"])
+dropped_counter = Counter("lifecycle_subscriber_dropped", "Lifecycle changes dropped because a subscriber was behind",
+                          ["subscriber", "reason"])
+queue_gauge = Gauge("lifecycle_subscriber_queue_size", "Lifecycle changes waiting to be handled by a subscriber",
+                    ["subscriber"])
 
 
 Subject = namedtuple("Subject", ("uid", "app_name", "namespace", "deployment_id", "repository", "labels", "annotations"))
@@ -48,3 +76,97 @@ class Lifecycle(object):
 
     def failed(self, subject):
         self.change(STATUS_FAILED, subject)
+
+    def superseded(self, subject):
+        self.change(STATUS_SUPERSEDED, subject)
+
+
+def subscribe(name, handler, max_size, overflow=OVERFLOW_BLOCK, key=None):
+    """Call handler(sender, status, subject) for every lifecycle change, from a thread of its own
+
+    Changes wait for the handler in a queue of at most max_size changes. Overflow decides what happens to a new change:
+
+    - block: when the queue is full, the thread making the change waits until there is room
+    - drop-oldest: when the queue is full, the oldest queued change is dropped
+    - coalesce: a queued change with the same key(subject) is replaced, keeping its place in the queue. When there is
+      none and the queue is full, the thread making the change waits until there is room.
+
+    Returns the started Subscription.
+    """
+    subscription = Subscription(name, handler, max_size, overflow, key)
+    signal(DEPLOY_STATUS_CHANGED).connect(subscription.put, weak=False)
+    subscription.start()
+    return subscription
+
+
+class Subscription(DaemonThread):
+    def __init__(self, name, handler, max_size, overflow=OVERFLOW_BLOCK, key=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {!r}".format(overflow))
+        if overflow == OVERFLOW_COALESCE and key is None:
+            raise ValueError("A key is needed to coalesce lifecycle changes")
+        self._subscriber = name
+        super(Subscription, self).__init__()
+        self._handler = handler
+        self._max_size = max_size
+        self._overflow = overflow
+        self._key = key
+        self._queue = OrderedDict()
+        self._sequence = count()
+        self._handling = False
+        self._cond = threading.Condition()
+
+    def _make_name(self):
+        return "{}Subscription".format(self._subscriber)
+
+    def put(self, sender, status, subject):
+        change = (sender, status, subject, time_monotonic())
+        with self._cond:
+            if self._overflow == OVERFLOW_COALESCE:
+                key = self._key(subject)
+                if key in self._queue:
+                    self._queue[key] = change
+                    dropped_counter.labels(self._subscriber, "coalesced").inc()
+                    return
+            else:
+                key = next(self._sequence)
+            if len(self._queue) >= self._max_size:
+                if self._overflow == OVERFLOW_DROP_OLDEST:
+                    self._queue.popitem(last=False)
+                    dropped_counter.labels(self._subscriber, "overflow").inc()
+                else:
+                    while len(self._queue) >= self._max_size:
+                        self._cond.wait()
+            self._queue[key] = change
+            queue_gauge.labels(self._subscriber).set(len(self._queue))
+            self._cond.notify_all()
+
+    def flush(self):
+        """Wait until all queued changes are handled"""
+        with self._cond:
+            while self._queue or self._handling:
+                self._cond.wait()
+
+    def __call__(self):
+        while True:
+            self._process()
+
+    def _process(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            _, (sender, status, subject, queued_at) = self._queue.popitem(last=False)
+            queue_gauge.labels(self._subscriber).set(len(self._queue))
+            self._handling = True
+            self._cond.notify_all()
+        try:
+            with self.working_on(status):
+                self._handler(sender, status=status, subject=subject)
+        except Exception:
+            LOG.exception("Error in %s when handling %s for %s/%s", self._subscriber, status, subject.namespace,
+                          subject.app_name)
+        finally:
+            latency_histogram.labels(self._subscriber).observe(time_monotonic() - queued_at)
+            with self._cond:
+                self._handling = False
+                self._cond.notify_all()
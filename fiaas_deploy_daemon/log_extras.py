@@ -17,9 +17,20 @@
 import logging
 import traceback
 import threading
-from collections import defaultdict
+from collections import OrderedDict, deque
 
-_LOGS = defaultdict(list)
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter, Gauge
+
+DEFAULT_MAX_LINES = 500
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL = 6 * 60 * 60
+
+held_bytes_gauge = Gauge("status_logs_bytes", "Bytes of log messages held for ApplicationStatuses")
+dropped_lines_counter = Counter("status_logs_dropped_lines",
+                                "Oldest log messages of a deployment dropped to make room for newer messages")
+evictions_counter = Counter("status_logs_evictions", "Deployments whose log messages were evicted before their final "
+                                                     "status was saved", ["reason"])
 _LOG_EXTRAS = threading.local()
 _LOG_FORMAT = u"[%(asctime)s|%(levelname)7s] %(message)s " \
               u"[%(name)s|%(threadName)s|%(extras_namespace)s/%(extras_app_name)s]"
@@ -86,17 +97,106 @@ def set_extras(app_spec=None, app_name=None, namespace=None, deployment_id=None)
     _LOG_EXTRAS.is_set = True
 
 
+def get_extras():
+    """Return (app_name, namespace, deployment_id) set for the current thread, or None"""
+    if not getattr(_LOG_EXTRAS, "is_set", False):
+        return None
+    return _LOG_EXTRAS.app_name, _LOG_EXTRAS.namespace, _LOG_EXTRAS.deployment_id
+
+
+class LogStore(object):
+    """Log messages of each deployment, held until the final status of the deployment is saved
+
+    Each deployment keeps at most max_lines of its latest messages. When the messages of all deployments take up more
+    than max_bytes, the deployments least recently logged to are evicted, and deployments not logged to for ttl
+    seconds are expired, so deployments that never reach a final status are not held forever.
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 time_func=time_monotonic):
+        self._max_lines = max_lines
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._time_func = time_func
+        # Deployment key -> (messages, last logged to), least recently logged to first
+        self._logs = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def append(self, key, message):
+        now = self._time_func()
+        with self._lock:
+            entry = self._logs.pop(key, None)
+            messages = entry[0] if entry else deque(maxlen=self._max_lines)
+            if len(messages) == self._max_lines:
+                self._bytes -= _size(messages[0])
+                dropped_lines_counter.inc()
+            messages.append(message)
+            self._bytes += _size(message)
+            self._logs[key] = (messages, now)
+            self._expire(now)
+            self._evict(key)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._logs.get(key)
+            return list(entry[0]) if entry else []
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._logs.pop(key, None)
+            if entry is None:
+                return []
+            self._bytes -= sum(_size(message) for message in entry[0])
+            return list(entry[0])
+
+    def size(self):
+        """Return the number of bytes of log messages held"""
+        return self._bytes
+
+    def _expire(self, now):
+        for key, (_, logged_at) in list(self._logs.items()):
+            if now - logged_at < self._ttl:
+                break
+            self._remove(key, "ttl")
+
+    def _evict(self, current):
+        for key in list(self._logs.keys()):
+            if self._bytes <= self._max_bytes or key == current:
+                break
+            self._remove(key, "bytes")
+
+    def _remove(self, key, reason):
+        messages, _ = self._logs.pop(key)
+        self._bytes -= sum(_size(message) for message in messages)
+        evictions_counter.labels(reason).inc()
+
+
+def _size(message):
+    return len(message.encode("utf-8")) if isinstance(message, unicode) else len(message)
+
+
+_LOGS = LogStore()
+held_bytes_gauge.set_function(lambda: _LOGS.size())
+
+
+def init_log_store(max_lines, max_bytes, ttl):
+    """Replace the log store with one using the given limits, dropping any messages held"""
+    global _LOGS
+    _LOGS = LogStore(max_lines, max_bytes, ttl)
+
+
 def get_running_logs(app_name, namespace, deployment_id):
-    key = (app_name, namespace, deployment_id)
-    return _LOGS.get(key, [])
+    return _LOGS.get((app_name, namespace, deployment_id))
 
 
 def get_final_logs(app_name, namespace, deployment_id):
-    key = (app_name, namespace, deployment_id)
-    return _LOGS.pop(key, [])
+    return _LOGS.pop((app_name, namespace, deployment_id))
 
 
 def append_log(record, message):
     if hasattr(record, "extras"):
         key = (record.extras.get("app_name"), record.extras.get("namespace"), record.extras.get("deployment_id"))
-        _LOGS[key].append(message)
+        # Messages logged outside of a deployment would never be collected
+        if all(key):
+            _LOGS.append(key, message)
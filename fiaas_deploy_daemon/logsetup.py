@@ -22,7 +22,7 @@ import logging
 import sys
 
 from fiaas_deploy_daemon.log_extras import StatusHandler
-from .log_extras import ExtraFilter
+from .log_extras import ExtraFilter, init_log_store
 
 
 class FiaasFormatter(logging.Formatter):
@@ -91,6 +91,7 @@ def init_logging(config):
     if config.debug:
         root.setLevel(logging.DEBUG)
     root.addHandler(_create_default_handler(config))
+    init_log_store(config.status_log_lines, config.status_log_bytes, config.status_log_ttl)
     root.addHandler(StatusHandler())
     _set_special_levels()
 
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import logging
+import socket
+import threading
+import time
+import zlib
+
+from k8s.client import NotFound
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter, Gauge
+
+from . import leases
+from .base_thread import DaemonThread
+from .informer import list_resources
+
+LOG = logging.getLogger(__name__)
+SHARD_PREFIX = "fiaas-deploy-daemon-shard-"
+MEMBER_PREFIX = "fiaas-deploy-daemon-replica-"
+
+owned_gauge = Gauge("sharding_owned_shards", "Shards owned by this replica")
+members_gauge = Gauge("sharding_replicas", "Replicas sharing the shards, as seen by this replica")
+transition_counter = Counter("sharding_shard_transitions", "Shards acquired or lost by this replica", ["change"])
+
+
+def shard_of(namespace, name, shard_count):
+    return (zlib.crc32("{}/{}".format(namespace, name).encode("utf-8")) & 0xffffffff) % shard_count
+
+
+class ShardManager(DaemonThread):
+    """Share Applications between replicas, by hashing (namespace, name) into `shards` shards owned through Leases
+
+    Every replica keeps a member Lease of its own. Each shard has a Lease held by the replica owning it. Every third of
+    `shard-lease-duration`, a replica renews its leases, and takes free or expired shards until it owns its fair share
+    of the shards among the live members, the first members by name taking one more when the shards don't divide
+    evenly. A replica owning more than its share, for instance when a new replica has joined, releases its highest
+    shards for others to take. When a replica dies, its leases expire, and the other replicas take over its shards.
+
+    A replica stops acting on a shard as soon as it has gone `shard-lease-duration` without renewing it, even if it
+    can't reach the API server to find out whether someone else has taken it. Listeners added with `add_listener` are
+    called with the set of shards newly owned after each renewal, so Applications changed while nobody owned the shard
+    can be handled.
+    """
+
+    def __init__(self, config, time_func=time_monotonic):
+        super(ShardManager, self).__init__()
+        self._namespace = config.namespace
+        self._shard_count = config.shards
+        self._duration = config.shard_lease_duration
+        self._identity = config.replica_id or socket.gethostname()
+        self._time_func = time_func
+        self._observer = leases.LeaseObserver(time_func)
+        self._owned = {}
+        self._holders = {}
+        self._members = [self._identity]
+        self._listeners = []
+        self._lock = threading.Lock()
+        owned_gauge.set_function(lambda: len(self.owned_shards()))
+        members_gauge.set_function(lambda: len(self._members))
+
+    def __call__(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                LOG.exception("Error while renewing shard leases")
+            time.sleep(self._duration / 3.0)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def shard_of(self, namespace, name):
+        return shard_of(namespace, name, self._shard_count)
+
+    def owns(self, namespace, name):
+        shard = self.shard_of(namespace, name)
+        with self._lock:
+            return self._is_current(shard)
+
+    def owned_shards(self):
+        with self._lock:
+            return sorted(shard for shard in self._owned if self._is_current(shard))
+
+    def describe(self):
+        """Return the shards owned by this replica, and the holder of every shard as last seen"""
+        with self._lock:
+            return {
+                "replica": self._identity,
+                "replicas": list(self._members),
+                "shard_count": self._shard_count,
+                "owned": sorted(shard for shard in self._owned if self._is_current(shard)),
+                "holders": dict(self._holders),
+            }
+
+    def sync(self):
+        """Renew the leases of this replica, and take or release shards to own its share"""
+        found = {lease.metadata.name: lease for lease in list_resources(leases.Lease, self._namespace)[0]}
+        members = self._sync_members(found)
+        share, extra = divmod(self._shard_count, len(members))
+        if members.index(self._identity) < extra:
+            share += 1
+        before = set(self.owned_shards())
+        renewed, holders = {}, {}
+        mine = [shard for shard in range(self._shard_count)
+                if leases.holder(found.get(_shard_name(shard))) == self._identity]
+        for shard in mine:
+            lease = found[_shard_name(shard)]
+            if len(renewed) >= share:
+                if leases.release(lease):
+                    LOG.info("Released shard %d, owning more than %d shards of %d replicas", shard, share,
+                             len(members))
+                continue
+            if self._take(shard, lease):
+                renewed[shard] = self._time_func()
+                holders[shard] = self._identity
+        for shard in range(self._shard_count):
+            lease = found.get(_shard_name(shard))
+            if shard in renewed or shard in mine:
+                continue
+            if leases.holder(lease) is not None and not self._observer.expired(lease):
+                holders[shard] = leases.holder(lease)
+            elif len(renewed) < share and self._take(shard, lease):
+                renewed[shard] = self._time_func()
+                holders[shard] = self._identity
+        with self._lock:
+            self._owned = renewed
+            self._holders = holders
+            self._members = members
+        self._notify(before)
+
+    def _sync_members(self, found):
+        own_name = MEMBER_PREFIX + self._identity
+        leases.take(found.get(own_name), own_name, self._namespace, self._identity, self._duration)
+        members = {self._identity}
+        for name, lease in found.items():
+            if not name.startswith(MEMBER_PREFIX) or name == own_name:
+                continue
+            if self._observer.expired(lease):
+                LOG.info("Replica %s has gone away", name[len(MEMBER_PREFIX):])
+                _delete(name, self._namespace)
+            else:
+                members.add(leases.holder(lease))
+        return sorted(members)
+
+    def _take(self, shard, lease):
+        return leases.take(lease, _shard_name(shard), self._namespace, self._identity, self._duration) is not None
+
+    def _is_current(self, shard):
+        renewed = self._owned.get(shard)
+        return renewed is not None and self._time_func() - renewed < self._duration
+
+    def _notify(self, before):
+        owned = set(self.owned_shards())
+        acquired, lost = owned - before, before - owned
+        if lost:
+            LOG.info("No longer owning shards %s", sorted(lost))
+            transition_counter.labels("lost").inc(len(lost))
+        if acquired:
+            LOG.info("Now owning shards %s", sorted(acquired))
+            transition_counter.labels("acquired").inc(len(acquired))
+            for listener in self._listeners:
+                try:
+                    listener(acquired)
+                except Exception:
+                    LOG.exception("Error in listener for acquired shards")
+
+
+class Unsharded(object):
+    """Stand-in for ShardManager when sharding is disabled, owning all Applications"""
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+    def current_work(self):
+        return None
+
+    def add_listener(self, listener):
+        pass
+
+    def owns(self, namespace, name):
+        return True
+
+    def describe(self):
+        return {"replica": socket.gethostname(), "shard_count": 0}
+
+
+def _shard_name(shard):
+    return "{}{}".format(SHARD_PREFIX, shard)
+
+
+def _delete(name, namespace):
+    try:
+        leases.Lease.delete(name, namespace)
+    except NotFound:
+        pass  # already deleted by another replica
@@ -15,12 +15,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
+import re
+import sys
+import threading
+import traceback
 from Queue import Queue
 from collections import Iterator
 
 from k8s import config
 from requests_toolbelt.utils.dump import dump_all
 
+# The resource kind is the path segment after the API version, or after the namespace for namespaced resources
+_RESOURCE_KIND_PATTERN = re.compile(r"^/apis?/(?:[^/]+/)?v[^/]+/(?:watch/)?(?:namespaces/[^/]+/)?([^/?]+)")
+
 
 def merge_dicts(*args):
     result = {}
@@ -37,6 +44,22 @@ def log_request_response(resp, *args, **kwargs):
     log.debug("Request/Response\n" + data)
 
 
+def api_resource_kind(path_url):
+    """Return the plural resource name from the path of a request to the API server, e.g. deployments"""
+    match = _RESOURCE_KIND_PATTERN.match(path_url)
+    return match.group(1) if match else "unknown"
+
+
+def log_thread_stacks(log, idents=None):
+    """Log the stack of each thread with an ident in idents, or of all threads"""
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    for thread_ident, frame in sys._current_frames().items():
+        if idents is not None and thread_ident not in idents:
+            continue
+        log.info("Thread ident=0x%x name=%s", thread_ident, thread_names.get(thread_ident, "unknown"))
+        log.info("".join(traceback.format_stack(frame)))
+
+
 class IterableQueue(Queue, Iterator):
     def next(self):
         return self.get()
@@ -19,6 +19,7 @@ import logging
 import pinject
 
 from .dev_hose_auth import DevHoseAuth
+from .spool import DiskSpool, MemorySpool
 from .transformer import DevhoseDeploymentEventTransformer
 from .usage_reporter import UsageReporter
 
@@ -42,3 +43,8 @@ class UsageReportingBindings(pinject.BindingSpec):
             return DevHoseAuth(key, tenant)
         LOG.debug("Usage auth disabled")
         return False
+
+    def provide_usage_spool(self, config):
+        if config.usage_reporting_spool_dir:
+            return DiskSpool(config.usage_reporting_spool_dir, config.usage_reporting_spool_size)
+        return MemorySpool(config.usage_reporting_spool_size)
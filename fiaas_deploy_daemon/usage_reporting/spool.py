@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Spools holding usage events until they are delivered
+
+A spool is read from its head: `read` returns the events after a position, and the position after them, so several
+batches can be read before any of them are delivered. `ack` removes the events before a position from the head of the
+spool, once they are delivered.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import errno
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter
+
+LOG = logging.getLogger(__name__)
+SEGMENT_EVENTS = 1000
+_SEGMENT_PATTERN = re.compile(r"^(\d{20})\.jsonl$")
+_CURSOR = "cursor"
+
+dropped_counter = Counter("fiaas_usage_reporting_dropped", "Usage events dropped because the spool was full")
+
+
+class _Spool(object):
+    def __init__(self, max_events):
+        self._max_events = max_events
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def pending(self):
+        """Return the number of events held"""
+        return self._pending
+
+    def wait(self, count, timeout):
+        """Wait until count events are held, or at least one event has been held for up to timeout seconds"""
+        with self._cond:
+            while self._pending == 0:
+                self._cond.wait()
+            deadline = time_monotonic() + timeout
+            while self._pending < count:
+                remaining = deadline - time_monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+
+class MemorySpool(_Spool):
+    """Hold at most max_events events in memory, dropping the oldest when full
+
+    A position is the sequence number of an event, counting every event ever appended, so it still points at the same
+    event when older events are dropped between a read and its ack.
+    """
+
+    def __init__(self, max_events):
+        super(MemorySpool, self).__init__(max_events)
+        self._events = collections.deque()
+        self._first = 0
+
+    def append(self, event):
+        with self._cond:
+            if len(self._events) >= self._max_events:
+                self._events.popleft()
+                self._first += 1
+                dropped_counter.inc()
+            self._events.append(event)
+            self._pending = len(self._events)
+            self._cond.notify_all()
+
+    def head(self):
+        with self._cond:
+            return self._first
+
+    def read(self, position, max_events):
+        with self._cond:
+            # Events dropped since position was handed out are skipped
+            position = max(position, self._first)
+            start = position - self._first
+            events = list(itertools.islice(self._events, start, start + max_events))
+        return events, position + len(events)
+
+    def ack(self, position):
+        with self._cond:
+            while self._events and self._first < position:
+                self._events.popleft()
+                self._first += 1
+            self._pending = len(self._events)
+
+
+class DiskSpool(_Spool):
+    """Hold events in append-only files in directory, so they survive a restart
+
+    Events are appended as JSON lines to segment files of at most SEGMENT_EVENTS events. The position of the first
+    event not yet delivered is kept in a cursor file, and a segment is deleted once all its events are delivered. When
+    more than max_events are held, the oldest segment is dropped. A new segment is started every time the spool is
+    opened, so a line left incomplete by a crash is never appended to.
+    """
+
+    def __init__(self, directory, max_events):
+        super(DiskSpool, self).__init__(max_events)
+        self._directory = directory
+        _makedirs(directory)
+        self._counts = collections.OrderedDict()
+        for seq in sorted(_segments(directory)):
+            self._counts[seq] = _count_lines(self._path(seq))
+        self._cursor = self._load_cursor()
+        for seq in [seq for seq in self._counts if seq < self._cursor[0]]:
+            self._delete(seq)
+        self._pending = sum(self._counts.values()) - self._events_before_cursor()
+        self._write_seq = (max(self._counts) if self._counts else 0) + 1
+        self._counts[self._write_seq] = 0
+        self._file = io.open(self._path(self._write_seq), "ab")
+        if self._cursor[0] not in self._counts:
+            self._cursor = (min(self._counts), 0)
+        LOG.info("Opened usage reporting spool in %s, holding %d events", directory, self._pending)
+
+    def append(self, event):
+        line = (json.dumps(event) + "\n").encode("utf-8")
+        with self._cond:
+            if self._counts[self._write_seq] >= SEGMENT_EVENTS:
+                self._roll()
+            self._file.write(line)
+            self._file.flush()
+            self._counts[self._write_seq] += 1
+            self._pending += 1
+            while self._pending > self._max_events and self._cursor[0] != self._write_seq:
+                self._drop_oldest()
+            self._cond.notify_all()
+
+    def head(self):
+        with self._cond:
+            return self._cursor
+
+    def read(self, position, max_events):
+        """Read up to max_events events after position. Lines that can't be parsed are skipped, but count as read"""
+        events = []
+        lines_read = 0
+        seq, offset = position
+        # Hold the lock, so the segments aren't dropped while they are read
+        with self._cond:
+            if seq not in self._counts:
+                # The segment was dropped since position was read, go on from the oldest event held
+                seq, offset = self._cursor
+            while lines_read < max_events:
+                lines, offset = _read_lines(self._path(seq), offset, max_events - lines_read)
+                lines_read += len(lines)
+                events.extend(_parse(line) for line in lines)
+                if lines_read < max_events and seq < self._write_seq:
+                    seq, offset = self._next_seq(seq), 0
+                else:
+                    break
+        return [event for event in events if event is not None], (seq, offset)
+
+    def ack(self, position):
+        with self._cond:
+            if position[0] < self._cursor[0]:
+                # The segments read were dropped in the meantime
+                return
+            self._pending = max(0, self._pending - self._lines_between(self._cursor, position))
+            self._cursor = position
+            for seq in [seq for seq in self._counts if seq < position[0]]:
+                self._delete(seq)
+            self._save_cursor()
+
+    def _roll(self):
+        self._file.close()
+        self._write_seq += 1
+        self._counts[self._write_seq] = 0
+        self._file = io.open(self._path(self._write_seq), "ab")
+
+    def _drop_oldest(self):
+        seq, offset = self._cursor
+        dropped = _count_lines(self._path(seq), offset)
+        self._pending -= dropped
+        dropped_counter.inc(dropped)
+        self._delete(seq)
+        self._cursor = (self._next_seq(seq), 0)
+        self._save_cursor()
+
+    def _next_seq(self, seq):
+        with self._cond:
+            return min(s for s in self._counts if s > seq)
+
+    def _lines_between(self, start, end):
+        seq, offset = start
+        count = 0
+        while seq < end[0]:
+            count += _count_lines(self._path(seq), offset)
+            seq, offset = self._next_seq(seq), 0
+        return count + _count_lines(self._path(seq), offset, end[1])
+
+    def _events_before_cursor(self):
+        seq, offset = self._cursor
+        if seq not in self._counts:
+            return 0
+        return self._counts[seq] - _count_lines(self._path(seq), offset)
+
+    def _delete(self, seq):
+        del self._counts[seq]
+        try:
+            os.remove(self._path(seq))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _load_cursor(self):
+        try:
+            with io.open(os.path.join(self._directory, _CURSOR), "r") as f:
+                seq, offset = f.read().split()
+            return int(seq), int(offset)
+        except (IOError, ValueError):
+            return 0, 0
+
+    def _save_cursor(self):
+        path = os.path.join(self._directory, _CURSOR)
+        with io.open(path + ".tmp", "w") as f:
+            f.write("{} {}".format(*self._cursor))
+        os.rename(path + ".tmp", path)
+
+    def _path(self, seq):
+        return os.path.join(self._directory, "{:020d}.jsonl".format(seq))
+
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _segments(directory):
+    for name in os.listdir(directory):
+        match = _SEGMENT_PATTERN.match(name)
+        if match:
+            yield int(match.group(1))
+
+
+def _count_lines(path, offset=0, end=None):
+    """Count complete lines after offset, and before end if given"""
+    count = 0
+    with io.open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            if end is not None and offset > end:
+                break
+            if line.endswith(b"\n"):
+                count += 1
+    return count
+
+
+def _read_lines(path, offset, max_lines):
+    """Read up to max_lines complete lines from offset, returning them and the offset after them"""
+    lines = []
+    with io.open(path, "rb") as f:
+        f.seek(offset)
+        while len(lines) < max_lines:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            lines.append(line)
+            offset += len(line)
+    return lines, offset
+
+
+def _parse(line):
+    try:
+        return json.loads(line.decode("utf-8"))
+    except ValueError:
+        LOG.error("Discarding unreadable usage event in spool: %r", line)
+        return None
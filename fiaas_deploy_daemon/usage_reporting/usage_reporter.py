@@ -19,17 +19,22 @@ from __future__ import unicode_literals, absolute_import
 
 import collections
 import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
-import backoff
 import requests
-from blinker import signal
-from prometheus_client import Counter, Histogram
+from monotonic import monotonic as time_monotonic
+from prometheus_client import Counter, Gauge, Histogram
+from requests.adapters import HTTPAdapter
 
 from fiaas_deploy_daemon.base_thread import DaemonThread
-from fiaas_deploy_daemon.lifecycle import DEPLOY_STATUS_CHANGED, STATUS_STARTED, STATUS_SUCCESS, STATUS_FAILED
-from fiaas_deploy_daemon.tools import IterableQueue
+from fiaas_deploy_daemon.lifecycle import STATUS_STARTED, STATUS_SUCCESS, STATUS_FAILED, subscribe
 
 LOG = logging.getLogger(__name__)
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+RETRY_DELAY = 1
 
 UsageEvent = collections.namedtuple("UsageEvent", ("status", "app_name", "namespace", "deployment_id", "repository"))
 
@@ -37,31 +42,43 @@ reporting_histogram = Histogram("fiaas_usage_reporting_latency", "Request latenc
 reporting_success_counter = Counter("fiaas_usage_reporting_success", "Number of successfully reported usage events")
 reporting_retry_counter = Counter("fiaas_usage_reporting_retry", "Number of retries when reporting usage events")
 reporting_failure_counter = Counter("fiaas_usage_reporting_failure", "Number of failures when reporting usage events")
+spool_gauge = Gauge("fiaas_usage_reporting_spooled", "Number of usage events waiting to be reported")
+circuit_open_gauge = Gauge("fiaas_usage_reporting_circuit_open", "1 while reporting is paused after repeated failures")
 
 
-def _success_handler(details):
-    reporting_success_counter.inc()
-
-
-def _retry_handler(details):
-    reporting_retry_counter.inc()
-
+class UsageReporter(DaemonThread):
+    """Report the start, success and failure of deploys to the usage reporting endpoint
 
-def _failure_handler(details):
-    reporting_failure_counter.inc()
+    Events are put in the usage spool by a lifecycle subscription, so a slow spool never holds up a deploy, and
+    reported in batches of up to `usage-reporting-batch-size` events, waiting at most `usage-reporting-batch-delay`
+    milliseconds for a batch to fill. Up to `usage-reporting-workers` batches are sent at a time. With a batch size of
+    1, each event is sent as a JSON object. With a larger batch size, a list of objects is sent.
 
+    Events stay in the spool until they are reported, so when the endpoint fails they are tried again later. After
+    FAILURE_THRESHOLD failures in a row, nothing is sent for RESET_TIMEOUT seconds. A batch rejected as invalid by the
+    endpoint is dropped, since sending it again won't help, and so is an event that can't be transformed.
+    """
 
-class UsageReporter(DaemonThread):
-    def __init__(self, config, usage_transformer, session, usage_auth):
+    def __init__(self, config, usage_transformer, session, usage_auth, usage_spool):
         super(UsageReporter, self).__init__()
         self._session = session
         self._transformer = usage_transformer
-        self._event_queue = IterableQueue()
+        self._spool = usage_spool
         self._usage_reporting_endpoint = config.usage_reporting_endpoint
         self._usage_auth = usage_auth
+        self._batch_size = config.usage_reporting_batch_size
+        self._batch_delay = config.usage_reporting_batch_delay / 1000.0
+        self._workers = config.usage_reporting_workers
+        self._executor = ThreadPool(self._workers) if self._workers > 1 else None
+        self._breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT)
+        spool_gauge.set_function(self._spool.pending)
+        circuit_open_gauge.set_function(lambda: 0 if self._breaker.allow() else 1)
         if self._usage_reporting_endpoint and self._usage_auth:
             LOG.info("Usage reporting enabled, sending events to %s", self._usage_reporting_endpoint)
-            signal(DEPLOY_STATUS_CHANGED).connect(self._handle_signal)
+            # Keep a connection open for each worker
+            self._session.mount(self._usage_reporting_endpoint, HTTPAdapter(pool_maxsize=self._workers))
+            self._subscription = subscribe("UsageReporter", self._handle_signal, config.lifecycle_queue_size,
+                                           config.usage_reporting_overflow)
         else:
             LOG.debug("Usage reporting disabled: Endpoint: %r, UsageAuth: %r",
                       self._usage_reporting_endpoint, self._usage_auth)
@@ -69,26 +86,124 @@ class UsageReporter(DaemonThread):
     def _handle_signal(self, sender, status, subject):
         if status in [STATUS_STARTED, STATUS_SUCCESS, STATUS_FAILED]:
             status = status.upper()
-            self._event_queue.put(UsageEvent(status, subject.app_name, subject.namespace, subject.deployment_id, subject.repository))
+            event = UsageEvent(status, subject.app_name, subject.namespace, subject.deployment_id, subject.repository)
+            self._spool.append(list(event))
 
     def __call__(self):
-        for event in self._event_queue:
-            self._handle_event(event)
-
-    def _handle_event(self, event):
-        data = self._transformer(event.status, event.app_name, event.namespace, event.deployment_id, event.repository)
+        while True:
+            self._spool.wait(self._batch_size, self._batch_delay)
+            time.sleep(self._breaker.remaining())
+            try:
+                reported = self._report_batches()
+            except Exception:
+                LOG.exception("Error while reporting usage events")
+                reported = False
+            if not reported:
+                time.sleep(RETRY_DELAY)
+
+    def _report_batches(self):
+        """Send up to one batch per worker from the head of the spool, returning True if the first was done with"""
+        position = self._spool.head()
+        batches = []
+        for _ in range(self._workers):
+            events, next_position = self._spool.read(position, self._batch_size)
+            if not events:
+                break
+            batches.append((self._transform_all(events), next_position))
+            position = next_position
+        payloads = [payload for payload, _ in batches]
+        if self._executor:
+            results = self._executor.map(self._send, payloads)
+        else:
+            results = [self._send(payload) for payload in payloads]
+        done_position = None
+        # Events are removed from the spool in order, so a batch to be tried again keeps those after it too
+        for (_, next_position), result in zip(batches, results):
+            if not result:
+                break
+            done_position = next_position
+        if done_position is not None:
+            self._spool.ack(done_position)
+        return done_position is not None
+
+    def _transform_all(self, events):
+        """Transform spooled events for sending, dropping those that can't be transformed, since they never will be"""
+        payload = []
+        for event in events:
+            try:
+                payload.append(self._transform(UsageEvent(*event)))
+            except Exception:
+                LOG.exception("Dropping usage event that can't be transformed: %r", event)
+                reporting_failure_counter.inc()
+        return payload
+
+    def _transform(self, event):
+        return self._transformer(event.status, event.app_name, event.namespace, event.deployment_id, event.repository)
+
+    def _send(self, payload):
+        """Send a batch, returning True if it is done with, or False if it should be tried again"""
+        if not payload:
+            return True
+        if not self._breaker.allow():
+            return False
+        data = payload[0] if self._batch_size == 1 else payload
         try:
-            self._send_data(data)
+            with reporting_histogram.time():
+                resp = self._session.post(self._usage_reporting_endpoint, json=data, auth=self._usage_auth)
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            if _is_client_error(e.response):
+                LOG.error("Usage reporting endpoint rejected %d events, dropping them", len(payload), exc_info=True)
+                reporting_failure_counter.inc(len(payload))
+                self._breaker.success()
+                return True
+            return self._failed(payload)
         except requests.exceptions.RequestException:
-            LOG.error('Unable to send usage reporting event', exc_info=True)
-
-    @backoff.on_exception(backoff.expo,
-                          requests.exceptions.RequestException,
-                          max_tries=5,
-                          on_success=_success_handler,
-                          on_backoff=_retry_handler,
-                          on_giveup=_failure_handler)
-    @reporting_histogram.time()
-    def _send_data(self, data):
-        resp = self._session.post(self._usage_reporting_endpoint, json=data, auth=self._usage_auth)
-        resp.raise_for_status()
+            return self._failed(payload)
+        self._breaker.success()
+        reporting_success_counter.inc(len(payload))
+        return True
+
+    def _failed(self, payload):
+        LOG.error("Unable to send %d usage reporting events, will try again", len(payload), exc_info=True)
+        reporting_retry_counter.inc(len(payload))
+        self._breaker.failure()
+        return False
+
+
+class CircuitBreaker(object):
+    """Stop allowing calls after failure_threshold failures in a row, until reset_timeout seconds have passed"""
+
+    def __init__(self, failure_threshold, reset_timeout, time_func=time_monotonic):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._time_func = time_func
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        return self.remaining() == 0
+
+    def remaining(self):
+        """Return the seconds until calls are allowed again"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0, self._opened_at + self._reset_timeout - self._time_func())
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self._failure_threshold:
+                # After the timeout, a single failure opens the circuit again
+                self._opened_at = self._time_func()
+
+
+def _is_client_error(response):
+    return response is not None and 400 <= response.status_code < 500 and response.status_code != 429
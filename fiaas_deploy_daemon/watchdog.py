@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import logging
+import time
+
+from prometheus_client import Counter
+
+from .base_thread import DaemonThread
+from .tools import log_thread_stacks
+
+LOG = logging.getLogger(__name__)
+CHECK_INTERVAL = 10
+
+stuck_counter = Counter("watchdog_stuck_threads", "Threads found working on the same deploy or watch for too long",
+                        ["work"])
+
+
+class Watchdog(DaemonThread):
+    """Find threads stuck on a deploy or a watch, and a deploy queue that has stopped moving
+
+    A deploy worker that has worked on the same deploy for longer than `stuck-deploy-timeout` has its stack logged, and
+    is replaced by a new worker, so other applications are still deployed. A thread that has been on the same watch for
+    longer than `stuck-watch-timeout` can't be replaced without losing what it has seen, so its stack is logged and the
+    daemon is reported as unhealthy, to have it restarted. The daemon is also unhealthy when an application has waited
+    in the deploy queue for longer than `max-deploy-queue-lag`, or when as many replaced workers as there are deploy
+    workers are still stuck.
+    """
+
+    def __init__(self, config, deployer, deploy_queue, crd_watcher, status_index, resource_cache, quota_cache):
+        super(Watchdog, self).__init__()
+        self._config = config
+        self._deployer = deployer
+        self._deploy_queue = deploy_queue
+        self._crd_watcher = crd_watcher
+        self._status_index = status_index
+        self._resource_cache = resource_cache
+        self._quota_cache = quota_cache
+        self._reported = set()
+
+    def __call__(self):
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            try:
+                self.check()
+            except Exception:
+                LOG.exception("Error while checking for stuck threads")
+
+    def check(self):
+        reported = set()
+        for worker in self._deployer.workers():
+            if self._check_thread(worker, self._config.stuck_deploy_timeout, "deploy", reported):
+                self._deployer.replace(worker)
+        for thread in self._watch_threads():
+            self._check_thread(thread, self._config.stuck_watch_timeout, "watch", reported)
+        self._reported = reported
+
+    def is_healthy(self):
+        if any(_is_stuck(thread, self._config.stuck_watch_timeout) for thread in self._watch_threads()):
+            return False
+        if self._deploy_queue.lag() > self._config.max_deploy_queue_lag:
+            return False
+        return self._deployer.replaced_alive() < self._config.deploy_workers
+
+    def _check_thread(self, thread, timeout, work, reported):
+        """Log the stack of thread the first time it is found stuck on an item, and return True if it is stuck"""
+        current = thread.current_work()
+        if current is None or current[1] <= timeout:
+            return False
+        item, seconds = current
+        key = (thread.name, item)
+        reported.add(key)
+        if key not in self._reported:
+            LOG.error("%s has been working on %s for %d seconds, which is more than %d", thread.name, item, seconds,
+                      timeout)
+            log_thread_stacks(LOG, [thread.ident])
+            stuck_counter.labels(work).inc()
+        return True
+
+    def _watch_threads(self):
+        return [self._crd_watcher, self._status_index] + self._resource_cache.threads() + self._quota_cache.threads()
+
+
+def _is_stuck(thread, timeout):
+    current = thread.current_work()
+    return current is not None and current[1] > timeout
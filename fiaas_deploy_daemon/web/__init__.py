@@ -22,7 +22,7 @@ import pkgutil
 import pinject
 import yaml
 from flask import Flask, Blueprint, current_app, render_template, make_response, request_started, request_finished, \
-    got_request_exception, abort, request
+    got_request_exception, abort, request, jsonify
 from flask_talisman import Talisman, DENY
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, Counter, Histogram
 
@@ -44,6 +44,7 @@ frontpage_histogram = request_histogram.labels("frontpage")
 metrics_histogram = request_histogram.labels("metrics")
 transform_histogram = request_histogram.labels("transform")
 healthz_histogram = request_histogram.labels("healthz")
+shards_histogram = request_histogram.labels("shards")
 
 
 @web.route("/")
@@ -76,11 +77,18 @@ def defaults_versioned(version):
 @healthz_histogram.time()
 def healthz():
     if current_app.health_check.is_healthy():
-        return "OK", 200
+        role = current_app.leader_elector.role()
+        return "OK ({})".format(role) if role else "OK", 200
     else:
         return "I don't feel so good...", 500
 
 
+@web.route("/shards")
+@shards_histogram.time()
+def shards():
+    return jsonify(current_app.shard_manager.describe())
+
+
 @web.route("/transform", methods=['GET', 'POST'])
 @transform_histogram.time()
 def transform():
@@ -118,9 +126,11 @@ def _render_defaults(*args):
 
 
 class WebBindings(pinject.BindingSpec):
-    def provide_webapp(self, spec_factory, health_check):
+    def provide_webapp(self, spec_factory, health_check, shard_manager, leader_elector):
         app = Flask(__name__)
         app.health_check = health_check
+        app.shard_manager = shard_manager
+        app.leader_elector = leader_elector
         app.register_blueprint(web)
         app.spec_factory = spec_factory
         app.transformer = Transformer(spec_factory)
@@ -81,7 +81,7 @@ if __name__ == "__main__":
         author="FINN Team Infrastructure",
         author_email="FINN-TechteamInfrastruktur@finn.no",
         version="1.0",
-        packages=find_packages(exclude=("tests",)),
+        packages=find_packages(exclude=("tests", "benchmark")),
         zip_safe=True,
         include_package_data=True,
 
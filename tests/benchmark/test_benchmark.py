@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import _percentile
+
+
+@pytest.mark.parametrize("percentile,expected", (
+    (50, 5),
+    (99, 10),
+    (1, 1),
+))
+def test_percentile(percentile, expected):
+    assert _percentile(range(1, 11), percentile) == expected
+
+
+def test_percentile_of_nothing():
+    assert _percentile([], 50) is None
+
+
+def test_benchmark_deploys_all_applications():
+    # The daemon keeps running until the process exits, so run the benchmark in a process of its own
+    code = "import sys; from benchmark import main; sys.exit(main(sys.argv[1:]))"
+    output = subprocess.check_output([sys.executable, "-c", code, "--apps", "3", "--timeout", "60"])
+
+    results = json.loads(output)
+    assert results["succeeded"] == 3
+    assert results["timed_out"] == 0
+    assert results["time_to_ready_seconds"]["p99"] >= results["time_to_ready_seconds"]["p50"] > 0
+    assert results["api_calls_per_deploy"]["POST"] >= 3
+    assert results["peak_rss_bytes"] > 0
+
+
+def test_benchmark_with_fault_injection(tmpdir):
+    scenarios = tmpdir.join("scenarios.yml")
+    scenarios.write("""
+scenarios:
+  - name: conflicts
+    rules:
+      - verbs: [POST]
+        kinds: [services]
+        error_rate: 1
+        errors: {409: 1}
+""")
+    code = "import sys; from benchmark import main; sys.exit(main(sys.argv[1:]))"
+    process = subprocess.Popen([sys.executable, "-c", code, "--apps", "2", "--timeout", "60",
+                                "--scenario-file", str(scenarios)], stdout=subprocess.PIPE)
+    output, _ = process.communicate()
+
+    results = json.loads(output)["scenarios"]["conflicts"]
+    assert results["failed"] == 2
+    assert results["daemon"]["fiaas_upsert_conflict_retry"] >= 2
+    assert results["daemon"]["fiaas_upsert_conflict_failure"] >= 2
+    assert results["faults"]["POST services 409"] >= 4
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+import pytest
+from k8s import config
+from k8s.base import Equality, In, Inequality, NotIn, Exists
+from k8s.client import ClientError, NotFound
+from k8s.models.common import ObjectMeta
+from k8s.models.deployment import Deployment, DeploymentSpec
+from k8s.models.service import Service, ServicePort, ServiceSpec
+
+from benchmark.fake_api_server import FakeApiServer, _parse_selector, _selected
+from fiaas_deploy_daemon.crd.types import FiaasApplication
+from fiaas_deploy_daemon.informer import list_resources, list_pages, watch_resources, ResourceVersionExpired
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    server = FakeApiServer(history=5)
+    server.start()
+    monkeypatch.setattr(config, "api_server", server.url)
+    yield server
+    server.stop()
+
+
+def _service(name, labels=None):
+    return Service(metadata=ObjectMeta(name=name, namespace="default", labels=labels or {"app": name}),
+                   spec=ServiceSpec(ports=[ServicePort(name="http", port=80, targetPort=8080)]))
+
+
+def _application(name):
+    return {
+        "metadata": {"name": name, "namespace": "default", "labels": {"app": name}},
+        "spec": {"application": name, "image": "example.com/image:1", "config": {}},
+    }
+
+
+class TestFakeApiServer(object):
+    def test_create_and_get(self, api_server):
+        _service("one").save()
+
+        service = Service.get("one", "default")
+
+        assert service.spec.ports[0].port == 80
+        assert service.metadata.uid
+        assert service.metadata.resourceVersion == "1"
+
+    def test_get_missing_resource(self, api_server):
+        with pytest.raises(NotFound):
+            Service.get("missing", "default")
+
+    def test_update_increments_resource_version(self, api_server):
+        _service("one").save()
+        service = Service.get("one", "default")
+        service.spec.ports[0].port = 8000
+
+        service.save()
+
+        assert Service.get("one", "default").metadata.resourceVersion == "2"
+
+    def test_update_of_stale_resource_is_a_conflict(self, api_server):
+        _service("one").save()
+        stale = Service.get("one", "default")
+        Service.get("one", "default").save()
+
+        with pytest.raises(ClientError) as e:
+            stale.save()
+        assert e.value.response.status_code == 409
+
+    def test_delete(self, api_server):
+        _service("one").save()
+
+        Service.delete("one", "default")
+
+        with pytest.raises(NotFound):
+            Service.get("one", "default")
+        with pytest.raises(NotFound):
+            Service.delete("one", "default")
+
+    def test_find_with_label_selector(self, api_server):
+        _service("one", {"app": "one", "tier": "web"}).save()
+        _service("two", {"app": "two"}).save()
+
+        found = Service.find(labels={"app": In(["one", "two"]), "tier": Exists()})
+
+        assert [s.metadata.name for s in found] == ["one"]
+
+    def test_delete_collection_with_label_selector(self, api_server):
+        _service("one", {"app": "one", "tier": "web"}).save()
+        _service("two", {"app": "two"}).save()
+
+        Service.delete_list(labels={"tier": Equality("web")})
+
+        assert [s.metadata.name for s in Service.list()] == ["two"]
+
+    def test_deployment_is_rolled_out(self, api_server):
+        deployment = Deployment(metadata=ObjectMeta(name="one", namespace="default"), spec=DeploymentSpec(replicas=3))
+        deployment.save()
+
+        deployment = Deployment.get("one", "default")
+
+        assert deployment.status.availableReplicas == 3
+        assert deployment.status.observedGeneration == deployment.metadata.generation
+
+    def test_lists_in_pages(self, api_server):
+        for name in ("one", "two", "three"):
+            api_server.create("applications", "default", _application(name))
+
+        pages = list(list_pages(FiaasApplication, "default", page_size=2))
+
+        assert [[app.metadata.name for app in page] for page, _ in pages] == [["one", "three"], ["two"]]
+        assert len({resource_version for _, resource_version in pages}) == 1
+
+    def test_counts_calls(self, api_server):
+        _service("one").save()
+        Service.get("one", "default")
+        list_resources(Service, None)
+
+        calls = api_server.calls()
+
+        assert calls[("POST", "services")] == 1
+        assert calls[("GET", "services")] == 2
+
+    def test_listener_is_told_about_changes(self, api_server):
+        changes = []
+        api_server.add_listener(lambda event_type, plural, obj: changes.append((event_type, plural,
+                                                                                obj["metadata"]["name"])))
+
+        api_server.create("applications", "default", _application("one"))
+
+        assert changes == [("ADDED", "applications", "one")]
+
+
+class TestWatch(object):
+    def test_watch_resumes_from_resource_version(self, api_server):
+        api_server.create("applications", "default", _application("one"))
+        _, resource_version = list_resources(FiaasApplication, "default")
+        received = []
+        received_all = threading.Event()
+
+        def watch():
+            for event in watch_resources(FiaasApplication, "default", resource_version=resource_version):
+                received.append((event.type, event.object.metadata.name))
+                if len(received) == 2:
+                    received_all.set()
+                    return
+
+        thread = threading.Thread(target=watch)
+        thread.daemon = True
+        thread.start()
+        api_server.create("applications", "default", _application("two"))
+        api_server.create("applications", "other", _application("three"))
+        FiaasApplication.delete("one", "default")
+
+        assert received_all.wait(10)
+        assert received == [("ADDED", "two"), ("DELETED", "one")]
+
+    def test_watch_from_expired_resource_version(self, api_server):
+        for i in range(10):
+            api_server.create("applications", "default", _application("app-{}".format(i)))
+
+        with pytest.raises(ResourceVersionExpired):
+            list(watch_resources(FiaasApplication, "default", resource_version="1"))
+
+
+class TestLabelSelector(object):
+    @pytest.mark.parametrize("labels,selected", (
+        ({"app": Equality("one")}, True),
+        ({"app": Inequality("one")}, False),
+        ({"app": In(["one", "two"]), "tier": Exists()}, True),
+        ({"app": NotIn(["one", "two"])}, False),
+        ({"missing": Exists()}, False),
+        ({"app": Equality("one"), "tier": Equality("db")}, False),
+    ))
+    def test_selector(self, labels, selected):
+        obj = {"metadata": {"labels": {"app": "one", "tier": "web"}}}
+
+        assert _selected(obj, _parse_selector(Service._label_selector(labels))) is selected
+
+    def test_does_not_exist(self):
+        assert _parse_selector("!app,tier notin (a,b)") == [("app", "!", []), ("tier", "notin", ["a", "b"])]
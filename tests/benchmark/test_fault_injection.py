@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import random
+
+import mock
+import pytest
+import requests
+from k8s import config
+from k8s.client import Client, ClientError, ServerError
+from k8s.models.common import ObjectMeta
+from k8s.models.service import Service, ServicePort, ServiceSpec
+
+from benchmark.fake_api_server import FakeApiServer
+from benchmark.fault_injection import Distribution, Rule, Scenario, install, load_scenarios
+from fiaas_deploy_daemon.crd.types import FiaasApplication
+from fiaas_deploy_daemon.informer import watch_resources
+
+SCENARIOS = """
+scenarios:
+  - name: slow
+    rules:
+      - verbs: [get]
+        latency: 0.5
+  - name: broken
+    rules:
+      - verbs: [PUT]
+        kinds: [services]
+        error_rate: 1
+        errors: {409: 1}
+      - error_rate: 0.5
+"""
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    server = FakeApiServer()
+    server.start()
+    monkeypatch.setattr(config, "api_server", server.url)
+    monkeypatch.setattr(Client, "_session", requests.Session())
+    yield server
+    server.stop()
+
+
+def _service(name):
+    return Service(metadata=ObjectMeta(name=name, namespace="default", labels={"app": name}),
+                   spec=ServiceSpec(ports=[ServicePort(name="http", port=80, targetPort=8080)]))
+
+
+class TestDistribution(object):
+    def test_number_is_constant(self):
+        assert Distribution(0.5).sample(random.Random()) == 0.5
+
+    @pytest.mark.parametrize("spec", (
+        {"distribution": "uniform", "min": 1, "max": 2},
+        {"distribution": "exponential", "mean": 1.5},
+        {"distribution": "normal", "mean": 1.5, "stddev": 0.1},
+    ))
+    def test_distribution(self, spec):
+        rng = random.Random(1)
+        samples = [Distribution(spec).sample(rng) for _ in range(1000)]
+
+        assert min(samples) >= 0
+        assert 1 < sum(samples) / len(samples) < 2
+
+    def test_unknown_distribution(self):
+        with pytest.raises(ValueError):
+            Distribution({"distribution": "pareto"})
+
+
+class TestRule(object):
+    @pytest.mark.parametrize("verb,kind,matches", (
+        ("PUT", "services", True),
+        ("POST", "services", True),
+        ("PUT", "deployments", False),
+        ("GET", "services", False),
+    ))
+    def test_matches_verbs_and_kinds(self, verb, kind, matches):
+        rule = Rule(verbs=["put", "POST"], kinds=["services"])
+
+        assert rule.matches(verb, kind) is matches
+
+    def test_errors_are_weighted(self):
+        rule = Rule(error_rate=1, errors={"409": 3, 503: 1})
+        rng = random.Random(1)
+
+        errors = [rule.error(rng) for _ in range(1000)]
+
+        assert set(errors) == {409, 503}
+        assert 650 < errors.count(409) < 850
+
+    def test_no_errors_without_error_rate(self):
+        rule = Rule(latency=1)
+
+        assert rule.error(random.Random()) is None
+
+
+def test_load_scenarios(tmpdir):
+    path = tmpdir.join("scenarios.yml")
+    path.write(SCENARIOS)
+
+    scenarios = load_scenarios(str(path))
+
+    assert list(scenarios) == ["slow", "broken"]
+    assert scenarios["slow"].rule_for("GET", "services").latency(random.Random()) == 0.5
+    assert scenarios["slow"].rule_for("PUT", "services") is None
+
+
+class TestFaultInjectingAdapter(object):
+    def test_error_is_returned_without_sending_the_request(self, api_server):
+        _service("one").save()
+        adapter = install(Client._session, Scenario("conflicts", [Rule(verbs=["PUT"], error_rate=1,
+                                                                       errors={409: 1})]))
+        service = Service.get("one", "default")
+
+        with pytest.raises(ClientError) as e:
+            service.save()
+
+        assert e.value.response.status_code == 409
+        assert e.value.response.json()["reason"] == "Conflict"
+        assert api_server.calls()[("PUT", "services")] == 0
+        assert adapter.faults == {("PUT", "services", 409): 1}
+
+    def test_server_errors(self, api_server):
+        install(Client._session, Scenario("unavailable", [Rule(error_rate=1, errors={503: 1})]))
+
+        with pytest.raises(ServerError):
+            Service.get("one", "default")
+
+    def test_latency(self, api_server):
+        _service("one").save()
+        adapter = install(Client._session, Scenario("slow", [Rule(verbs=["GET"], latency=0.25)]))
+        sleep = mock.create_autospec(lambda seconds: None)
+        adapter._sleep = sleep
+
+        Service.get("one", "default")
+
+        sleep.assert_called_once_with(0.25)
+        assert adapter.faults == {("GET", "services", "latency"): 1}
+
+    def test_watch_is_disconnected(self, api_server):
+        adapter = install(Client._session, Scenario("flaky", [Rule(verbs=["WATCH"], disconnect_after=1)]))
+
+        events = list(watch_resources(FiaasApplication, "default", resource_version="1"))
+
+        assert events == []
+        assert adapter.faults == {("WATCH", "applications", "disconnect"): 1}
@@ -24,10 +24,15 @@ from k8s.models.common import ObjectMeta
 from requests import Response
 
 from fiaas_deploy_daemon.crd import status
-from fiaas_deploy_daemon.crd.status import _cleanup, OLD_STATUSES_TO_KEEP, LAST_UPDATED_KEY, now
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.crd.status import LAST_UPDATED_KEY, now
+from fiaas_deploy_daemon.crd.status_index import StatusIndex
 from fiaas_deploy_daemon.crd.types import FiaasApplicationStatus
-from fiaas_deploy_daemon.lifecycle import DEPLOY_STATUS_CHANGED, STATUS_INITIATED, STATUS_STARTED, STATUS_SUCCESS, STATUS_FAILED
-from fiaas_deploy_daemon.retry import UpsertConflict, CONFLICT_MAX_RETRIES
+from fiaas_deploy_daemon.leader_election import LeaderElector
+from fiaas_deploy_daemon.lifecycle import DEPLOY_STATUS_CHANGED, STATUS_INITIATED, STATUS_STARTED, STATUS_SUCCESS, STATUS_FAILED, \
+    STATUS_SUPERSEDED
+from fiaas_deploy_daemon.retry import CONFLICT_MAX_RETRIES
+from fiaas_deploy_daemon.sharding import ShardManager
 from fiaas_deploy_daemon.lifecycle import Subject
 from utils import configure_mock_fail_then_success
 
@@ -61,6 +66,16 @@ class TestStatusReport(object):
         monkeypatch.setattr("fiaas_deploy_daemon.crd.status.signal", s)
         yield s
 
+    @pytest.fixture
+    def status_index(self):
+        status_index = mock.create_autospec(StatusIndex, spec_set=True, instance=True)
+        status_index.get.return_value = None
+        return status_index
+
+    @pytest.fixture
+    def status_writer(self, signal, status_index):
+        return status.StatusWriter(status_index)
+
     @pytest.fixture
     def logs(self):
         with mock.patch("fiaas_deploy_daemon.crd.status._get_logs") as m:
@@ -81,13 +96,14 @@ class TestStatusReport(object):
                 STATUS_STARTED: u"RUNNING",
                 STATUS_FAILED: u"FAILED",
                 STATUS_SUCCESS: u"SUCCESS",
-                STATUS_INITIATED: u"INITIATED"
+                STATUS_INITIATED: u"INITIATED",
+                STATUS_SUPERSEDED: u"SUPERSEDED",
             }
             action2data = {
                 "create": (True, "post", "put"),
                 "update": (False, "put", "post")
             }
-            for result in (STATUS_STARTED, STATUS_FAILED, STATUS_SUCCESS, STATUS_INITIATED):
+            for result in (STATUS_STARTED, STATUS_FAILED, STATUS_SUCCESS, STATUS_INITIATED, STATUS_SUPERSEDED):
                 for action in ("create", "update"):
 
                     test_data = TestData(DEPLOY_STATUS_CHANGED, action, result, name2result[result], *action2data[action])
@@ -95,7 +111,7 @@ class TestStatusReport(object):
                     metafunc.addcall({"test_data": test_data}, test_id)
 
     @pytest.mark.usefixtures("post", "put", "find", "logs")
-    def test_action_on_signal(self, request, get, app_spec, test_data, signal):
+    def test_action_on_signal(self, request, get, app_spec, test_data, signal, status_index, status_writer):
         app_name = '{}-isb5oqum36ylo'.format(test_data.result)
         expected_logs = [LOG_LINE]
         if not test_data.new:
@@ -127,9 +143,6 @@ class TestStatusReport(object):
         annotations = app_spec.annotations._replace(status={"status/annotations": "true"})
         app_spec = app_spec._replace(name=test_data.result, labels=labels, annotations=annotations)
 
-        # setup status signals
-        status.connect_signals()
-
         # setup expected API call resulting from status update
         expected_call = {
             'apiVersion': 'fiaas.schibsted.io/v1',
@@ -174,6 +187,7 @@ class TestStatusReport(object):
         with mock.patch("fiaas_deploy_daemon.crd.status.now") as mnow:
             mnow.return_value = LAST_UPDATE
             signal(test_data.signal_name).send(status=test_data.status, subject=lifecycle_subject)
+            status_writer._process()
 
         # assert that the api function expected to be called was called, and that the ignored api function was not
         if test_data.action == "create":
@@ -184,6 +198,9 @@ class TestStatusReport(object):
         called_mock.assert_called_once_with(url, expected_call)
         ignored_mock = request.getfixturevalue(test_data.ignored_mock)
         ignored_mock.assert_not_called()
+        status_index.put.assert_called_once()
+        saved = status_index.put.call_args[0][0]
+        assert (saved.metadata.name, saved.result) == (app_name, test_data.result)
 
     @pytest.mark.parametrize("deployment_id", (
             u"fiaas/fiaas-deploy-daemon:latest",
@@ -195,32 +212,13 @@ class TestStatusReport(object):
         final_name = status.create_name(NAME, deployment_id)
         assert VALID_NAME.match(final_name), "Name is not valid"
 
-    def test_clean_up(self, app_spec, find, delete):
-        returned_statuses = [_create_status(i) for i in range(20)]
-        returned_statuses.append(_create_status(100, False))
-        random.shuffle(returned_statuses)
-        find.return_value = returned_statuses
-        _cleanup(app_spec.name, app_spec.namespace)
-        expected_calls = [mock.call("name-{}".format(i), "test") for i in range(20 - OLD_STATUSES_TO_KEEP)]
-        expected_calls.insert(0, mock.call("name-100", "test"))
-        assert delete.call_args_list == expected_calls
-
-    def test_ignore_notfound_on_cleanup(self, find, delete, app_spec):
-        delete.side_effect = NotFound()
-        find.return_value = [_create_status(i) for i in range(OLD_STATUSES_TO_KEEP + 1)]
-
-        try:
-            _cleanup(app_spec.name, app_spec.namespace)
-        except NotFound:
-            pytest.fail("delete raised NotFound on signal")
-
     @pytest.mark.parametrize("result,fail_times", (
             ((result, fail_times)
              for result in (STATUS_INITIATED, STATUS_STARTED, STATUS_STARTED, STATUS_FAILED)
              for fail_times in range(5))
     ))
     @pytest.mark.usefixtures("get", "post", "put", "find", "logs")
-    def test_retry_on_conflict(self, get_or_create, save, app_spec, signal, result, fail_times):
+    def test_retry_on_conflict(self, get_or_create, save, app_spec, signal, status_writer, result, fail_times):
 
         def _fail():
             response = mock.MagicMock(spec=Response)
@@ -231,14 +229,10 @@ class TestStatusReport(object):
         application_status = FiaasApplicationStatus(metadata=ObjectMeta(name=app_spec.name, namespace="default"))
         get_or_create.return_value = application_status
 
-        status.connect_signals()
         lifecycle_subject = _subject_from_app_spec(app_spec)
 
-        try:
-            signal(DEPLOY_STATUS_CHANGED).send(status=result, subject=lifecycle_subject)
-        except UpsertConflict as e:
-            if fail_times < CONFLICT_MAX_RETRIES:
-                pytest.fail('Exception {} was raised when signaling {}'.format(e, result))
+        signal(DEPLOY_STATUS_CHANGED).send(status=result, subject=lifecycle_subject)
+        status_writer._process()
 
         save_calls = min(fail_times + 1, CONFLICT_MAX_RETRIES)
         assert save.call_args_list == [mock.call()] * save_calls
@@ -250,7 +244,7 @@ class TestStatusReport(object):
             STATUS_FAILED
     ))
     @pytest.mark.usefixtures("get", "post", "put", "find", "logs")
-    def test_fail_on_error(self, get_or_create, save, app_spec, signal, result):
+    def test_fail_on_error(self, get_or_create, save, app_spec, signal, status_index, status_writer, result):
         response = mock.MagicMock(spec=Response)
         response.status_code = 403
 
@@ -259,12 +253,156 @@ class TestStatusReport(object):
         application_status = FiaasApplicationStatus(metadata=ObjectMeta(name=app_spec.name, namespace="default"))
         get_or_create.return_value = application_status
 
-        status.connect_signals()
         lifecycle_subject = _subject_from_app_spec(app_spec)
 
-        with pytest.raises(ClientError):
+        signal(DEPLOY_STATUS_CHANGED).send(status=result, subject=lifecycle_subject)
+        status_writer._process()
+
+        status_index.put.assert_not_called()
+
+    def test_coalesces_changes_of_the_same_deployment(self, app_spec, signal, status_index, status_writer):
+        lifecycle_subject = _subject_from_app_spec(app_spec)
+        for result in (STATUS_INITIATED, STATUS_STARTED, STATUS_SUCCESS):
             signal(DEPLOY_STATUS_CHANGED).send(status=result, subject=lifecycle_subject)
 
+        with mock.patch("fiaas_deploy_daemon.crd.status._save_status") as save_status:
+            status_writer._process()
+
+        save_status.assert_called_once_with(u"SUCCESS", lifecycle_subject, status_index)
+        status_index.put.assert_called_once_with(save_status.return_value)
+        assert not status_writer._pending
+
+    @pytest.mark.usefixtures("find", "logs")
+    def test_updates_known_status_conditionally_without_get(self, get, put, app_spec, signal, status_index,
+                                                            status_writer):
+        name = status.create_name(app_spec.name, app_spec.deployment_id)
+        status_index.get.return_value = FiaasApplicationStatus.from_dict({
+            "metadata": {"name": name, "namespace": app_spec.namespace, "resourceVersion": "7",
+                         "labels": {"app": app_spec.name}, "annotations": {LAST_UPDATED_KEY: LAST_UPDATE}},
+            "result": u"RUNNING",
+        })
+        put.return_value.json.return_value = {}
+
+        signal(DEPLOY_STATUS_CHANGED).send(status=STATUS_SUCCESS, subject=_subject_from_app_spec(app_spec))
+        status_writer._process()
+
+        get.assert_not_called()
+        body = put.call_args[0][1]
+        assert body["metadata"]["resourceVersion"] == "7"
+        assert body["result"] == u"SUCCESS"
+
+    @pytest.mark.usefixtures("get", "find", "logs")
+    def test_gets_current_status_when_known_status_is_stale(self, get_or_create, save, app_spec, signal,
+                                                            status_index, status_writer):
+        name = status.create_name(app_spec.name, app_spec.deployment_id)
+        metadata = ObjectMeta(name=name, labels={"app": app_spec.name}, annotations={LAST_UPDATED_KEY: LAST_UPDATE})
+        known = FiaasApplicationStatus(new=False, metadata=metadata)
+        status_index.get.side_effect = [known, None]
+        get_or_create.return_value = FiaasApplicationStatus(metadata=ObjectMeta(name=name))
+        response = mock.MagicMock(spec=Response)
+        response.status_code = 409
+        configure_mock_fail_then_success(save, fail=lambda: _raise(ClientError("Conflict", response=response)))
+
+        signal(DEPLOY_STATUS_CHANGED).send(status=STATUS_SUCCESS, subject=_subject_from_app_spec(app_spec))
+        status_writer._process()
+
+        status_index.remove.assert_called_once_with(app_spec.namespace, name)
+        assert save.call_count == 2
+        status_index.put.assert_called_once_with(get_or_create.return_value)
+
+    def test_flush_waits_until_queued_changes_are_saved(self, app_spec, signal, status_index, status_writer):
+        with mock.patch("fiaas_deploy_daemon.crd.status._save_status") as save_status:
+            status_writer.start()
+            signal(DEPLOY_STATUS_CHANGED).send(status=STATUS_SUCCESS, subject=_subject_from_app_spec(app_spec))
+            status_writer.flush()
+
+            save_status.assert_called_once()
+
+
+class TestStatusCleaner(object):
+    @pytest.fixture
+    def status_index(self):
+        status_index = mock.create_autospec(StatusIndex, spec_set=True, instance=True)
+        status_index.has_synced.return_value = True
+        return status_index
+
+    @pytest.fixture
+    def delete(self):
+        with mock.patch("fiaas_deploy_daemon.crd.status.FiaasApplicationStatus.delete", spec_set=True) as m:
+            yield m
+
+    @pytest.fixture
+    def config(self):
+        return Configuration([])
+
+    @pytest.fixture
+    def leader_elector(self):
+        leader_elector = mock.create_autospec(LeaderElector, spec_set=True, instance=True)
+        leader_elector.is_leader.return_value = True
+        return leader_elector
+
+    @pytest.fixture
+    def shard_manager(self):
+        shard_manager = mock.create_autospec(ShardManager, spec_set=True, instance=True)
+        shard_manager.owns.return_value = True
+        return shard_manager
+
+    @pytest.fixture
+    def status_cleaner(self, config, status_index, leader_elector, shard_manager):
+        return status.StatusCleaner(config, status_index, leader_elector, shard_manager)
+
+    def test_deletes_oldest_statuses_of_each_application(self, config, status_index, status_cleaner, delete):
+        statuses = [_create_status(i) for i in range(20)]
+        statuses.append(_create_status(100, False))
+        statuses.extend(_create_status(i, app_name="other") for i in range(config.statuses_to_keep))
+        random.shuffle(statuses)
+        status_index.list.return_value = statuses
+
+        status_cleaner.sweep()
+
+        expected_names = ["name-{}".format(i) for i in range(20 - config.statuses_to_keep)] + ["name-100"]
+        assert sorted(delete.call_args_list) == sorted(mock.call(name, "test") for name in expected_names)
+        assert sorted(status_index.remove.call_args_list) == sorted(mock.call("test", name) for name in expected_names)
+
+    def test_ignore_notfound_on_cleanup(self, config, status_index, status_cleaner, delete):
+        delete.side_effect = NotFound()
+        status_index.list.return_value = [_create_status(i) for i in range(config.statuses_to_keep + 1)]
+
+        status_cleaner.sweep()
+
+        status_index.remove.assert_called_once_with("test", "name-0")
+
+    def test_skips_sweep_until_statuses_are_listed(self, status_index, status_cleaner, delete):
+        status_index.has_synced.return_value = False
+
+        status_cleaner.sweep()
+
+        status_index.list.assert_not_called()
+        delete.assert_not_called()
+
+    def test_standby_leaves_sweep_to_leader(self, status_index, status_cleaner, leader_elector, delete):
+        leader_elector.is_leader.return_value = False
+
+        status_cleaner.sweep()
+
+        status_index.list.assert_not_called()
+        delete.assert_not_called()
+
+    def test_leaves_statuses_of_applications_in_other_shards(self, config, status_index, status_cleaner,
+                                                             shard_manager, delete):
+        shard_manager.owns.side_effect = lambda namespace, name: name == "name"
+        statuses = [_create_status(i) for i in range(config.statuses_to_keep + 1)]
+        statuses.extend(_create_status(i, app_name="other") for i in range(config.statuses_to_keep + 1))
+        status_index.list.return_value = statuses
+
+        status_cleaner.sweep()
+
+        delete.assert_called_once_with("name-0", "test")
+
+
+def _raise(e):
+    raise e
+
 
 def _subject_from_app_spec(app_spec):
     return Subject(app_spec.uid,
@@ -276,7 +414,8 @@ def _subject_from_app_spec(app_spec):
                    app_spec.annotations.status)
 
 
-def _create_status(i, annotate=True):
+def _create_status(i, annotate=True, app_name="name"):
     annotations = {LAST_UPDATED_KEY: "2020-12-12T23.59.{:02}".format(i)} if annotate else None
-    metadata = ObjectMeta(name="name-{}".format(i), namespace="test", annotations=annotations)
+    metadata = ObjectMeta(name="{}-{}".format(app_name, i), namespace="test", labels={"app": app_name},
+                          annotations=annotations)
     return FiaasApplicationStatus(new=False, metadata=metadata, result=u"SUCCESS")
@@ -17,21 +17,25 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import copy
 from Queue import Queue
 
 import mock
 import pytest
 from k8s.base import WatchEvent
 from k8s.client import NotFound
-from k8s.watcher import Watcher
 from requests import Response
 from yaml import YAMLError
 
 from fiaas_deploy_daemon.config import Configuration
 from fiaas_deploy_daemon.crd import CrdWatcher
+from fiaas_deploy_daemon.crd.status_index import StatusIndex
 from fiaas_deploy_daemon.crd.types import FiaasApplication, AdditionalLabelsOrAnnotations, FiaasApplicationStatus
 from fiaas_deploy_daemon.deployer import DeployerEvent
+from fiaas_deploy_daemon.informer import ResourceVersionExpired
+from fiaas_deploy_daemon.leader_election import LeaderElector
 from fiaas_deploy_daemon.lifecycle import Lifecycle, Subject
+from fiaas_deploy_daemon.sharding import ShardManager
 from fiaas_deploy_daemon.specs.factory import InvalidConfiguration
 
 ADD_EVENT = {
@@ -82,17 +86,43 @@ class TestWatcher(object):
 
     @pytest.fixture
     def watcher(self):
-        return mock.create_autospec(spec=Watcher, spec_set=True, instance=True)
+        with mock.patch("fiaas_deploy_daemon.crd.watcher.watch_resources") as m:
+            m.return_value = []
+            yield m
+
+    @pytest.fixture
+    def list_pages(self):
+        with mock.patch("fiaas_deploy_daemon.crd.watcher.list_pages") as m:
+            m.return_value = [([], "1")]
+            yield m
 
     @pytest.fixture
     def lifecycle(self):
         return mock.create_autospec(spec=Lifecycle, spec_set=True, instance=True)
 
     @pytest.fixture
-    def crd_watcher(self, spec_factory, deploy_queue, watcher, lifecycle):
-        crd_watcher = CrdWatcher(spec_factory, deploy_queue, Configuration([]), lifecycle)
-        crd_watcher._watcher = watcher
-        return crd_watcher
+    def status_index(self):
+        status_index = mock.create_autospec(StatusIndex, spec_set=True, instance=True)
+        status_index.has_synced.return_value = False
+        return status_index
+
+    @pytest.fixture
+    def shard_manager(self):
+        shard_manager = mock.create_autospec(ShardManager, spec_set=True, instance=True)
+        shard_manager.owns.return_value = True
+        return shard_manager
+
+    @pytest.fixture
+    def leader_elector(self):
+        leader_elector = mock.create_autospec(LeaderElector, spec_set=True, instance=True)
+        leader_elector.is_leader.return_value = True
+        return leader_elector
+
+    @pytest.fixture
+    def crd_watcher(self, spec_factory, deploy_queue, watcher, list_pages, lifecycle, status_index, shard_manager,
+                    leader_elector):
+        return CrdWatcher(spec_factory, deploy_queue, Configuration([]), lifecycle, status_index, shard_manager,
+                          leader_elector)
 
     @pytest.fixture(autouse=True)
     def status_get(self):
@@ -100,9 +130,10 @@ class TestWatcher(object):
             m.side_effect = NotFound
             yield m
 
-    def test_creates_custom_resource_definition_if_not_exists_when_watching_it(self, get, post, crd_watcher, watcher):
+    def test_creates_custom_resource_definition_if_not_exists_when_watching_it(self, get, post, crd_watcher,
+                                                                               list_pages):
         get.side_effect = NotFound("Something")
-        watcher.watch.side_effect = NotFound("Something")
+        list_pages.side_effect = NotFound("Something")
 
         expected_application = {
             'metadata': {
@@ -155,7 +186,7 @@ class TestWatcher(object):
         assert post.call_args_list == calls
 
     def test_is_able_to_watch_custom_resource_definition(self, crd_watcher, deploy_queue, watcher):
-        watcher.watch.return_value = [WatchEvent(ADD_EVENT, FiaasApplication)]
+        watcher.return_value = [WatchEvent(ADD_EVENT, FiaasApplication)]
 
         assert deploy_queue.qsize() == 0
         crd_watcher._watch(None)
@@ -171,7 +202,7 @@ class TestWatcher(object):
     def test_deploy(self, crd_watcher, deploy_queue, spec_factory, watcher, app_spec, event, deployer_event_type,
                     lifecycle, annotations, repository):
         event["object"]["spec"]["config"]["annotations"] = annotations
-        watcher.watch.return_value = [WatchEvent(event, FiaasApplication)]
+        watcher.return_value = [WatchEvent(event, FiaasApplication)]
 
         spec = event["object"]["spec"]
         app_name = spec["application"]
@@ -216,10 +247,28 @@ class TestWatcher(object):
             assert deployer_event == DeployerEvent(deployer_event_type, app_spec, None)
         assert deploy_queue.empty()
 
+    @pytest.mark.parametrize("event,priority", [
+        (ADD_EVENT, "high"),
+        (DELETED_EVENT, "low"),
+        (ADD_EVENT, "urgent"),
+    ])
+    def test_deploy_priority_from_annotation(self, crd_watcher, deploy_queue, spec_factory, watcher, app_spec, event,
+                                             priority):
+        event = copy.deepcopy(event)
+        event["object"]["metadata"]["annotations"] = {"fiaas/deploy-priority": priority}
+        watcher.return_value = [WatchEvent(event, FiaasApplication)]
+        spec_factory.return_value = app_spec
+
+        crd_watcher._watch(None)
+
+        expected = priority if priority != "urgent" else "normal"
+        assert deploy_queue.get_nowait().priority == expected
+
     @pytest.mark.parametrize("namespace", [None, "default"])
-    def test_watch_namespace(self, crd_watcher, watcher, namespace):
+    def test_watch_namespace(self, crd_watcher, watcher, list_pages, namespace):
         crd_watcher._watch(namespace)
-        watcher.watch.assert_called_once_with(namespace=namespace)
+        list_pages.assert_called_once_with(FiaasApplication, namespace)
+        watcher.assert_called_once_with(FiaasApplication, namespace, resource_version="1")
 
     @pytest.mark.parametrize("event,deployer_event_type,error,annotations,repository", [
         (ADD_EVENT, "UPDATE", YAMLError("invalid yaml"), {}, None),
@@ -233,7 +282,7 @@ class TestWatcher(object):
                                                  deployer_event_type,
                                                  error, lifecycle, annotations, repository):
         event["object"]["metadata"]["annotations"] = annotations
-        watcher.watch.return_value = [WatchEvent(event, FiaasApplication)]
+        watcher.return_value = [WatchEvent(event, FiaasApplication)]
 
         spec_factory.side_effect = error
 
@@ -259,10 +308,161 @@ class TestWatcher(object):
             ("ANY_OTHER_VALUE_THAN_SUCCESS", 1),
     ))
     def test_deploy_based_on_status_result(self, crd_watcher, deploy_queue, watcher, status_get, result, count):
-        watcher.watch.return_value = [WatchEvent(ADD_EVENT, FiaasApplication)]
+        watcher.return_value = [WatchEvent(ADD_EVENT, FiaasApplication)]
         status_get.side_effect = lambda *args, **kwargs: mock.DEFAULT  # disable default behavior of raising NotFound
         status_get.return_value = FiaasApplicationStatus(new=False, result=result)
 
         assert deploy_queue.qsize() == 0
         crd_watcher._watch(None)
         assert deploy_queue.qsize() == count
+
+    @pytest.mark.parametrize("result, count", (
+            ("SUCCESS", 0),
+            ("FAILED", 1),
+            (None, 1),
+    ))
+    def test_deploy_based_on_indexed_status_result(self, crd_watcher, deploy_queue, watcher, status_get,
+                                                   status_index, result, count):
+        watcher.return_value = [WatchEvent(ADD_EVENT, FiaasApplication)]
+        status_index.has_synced.return_value = True
+        status_index.result.return_value = result
+
+        crd_watcher._watch(None)
+
+        assert deploy_queue.qsize() == count
+        status_index.result.assert_called_once_with("example", "the-namespace", "deployment_id")
+        status_get.assert_not_called()
+
+    def test_resumes_watch_from_last_seen_resource_version(self, crd_watcher, deploy_queue, watcher, list_pages):
+        watcher.return_value = [WatchEvent(_with_resource_version(ADD_EVENT, "2"), FiaasApplication)]
+        crd_watcher._watch(None)
+        watcher.return_value = []
+        crd_watcher._watch(None)
+
+        list_pages.assert_called_once()
+        assert watcher.call_args_list == [
+            mock.call(FiaasApplication, None, resource_version="1"),
+            mock.call(FiaasApplication, None, resource_version="2"),
+        ]
+        assert deploy_queue.qsize() == 1
+
+    def test_relists_when_resource_version_has_expired(self, crd_watcher, watcher, list_pages):
+        watcher.side_effect = ResourceVersionExpired("too old")
+        crd_watcher._watch(None)
+        watcher.side_effect = None
+        list_pages.return_value = [([], "5")]
+        crd_watcher._watch(None)
+
+        assert list_pages.call_count == 2
+        assert watcher.call_args_list[-1] == mock.call(FiaasApplication, None, resource_version="5")
+
+    def test_relist_only_handles_changed_applications(self, crd_watcher, deploy_queue, watcher, list_pages):
+        unchanged = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "2")["object"])
+        list_pages.return_value = [([unchanged], "2")]
+        crd_watcher._watch(None)
+        assert deploy_queue.qsize() == 1
+
+        crd_watcher._resource_version = None
+        crd_watcher._watch(None)
+        assert deploy_queue.qsize() == 1
+
+        changed = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "7")["object"])
+        list_pages.return_value = [([changed], "7")]
+        crd_watcher._resource_version = None
+        crd_watcher._watch(None)
+        assert deploy_queue.qsize() == 2
+
+    def test_relist_deletes_applications_deleted_while_not_watching(self, crd_watcher, deploy_queue,
+                                                                    watcher, list_pages):
+        application = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "2")["object"])
+        list_pages.return_value = [([application], "2")]
+        crd_watcher._watch(None)
+        deploy_queue.get_nowait()
+
+        list_pages.return_value = [([], "9")]
+        crd_watcher._resource_version = None
+        crd_watcher._watch(None)
+
+        assert deploy_queue.get_nowait().action == "DELETE"
+        assert deploy_queue.empty()
+
+    def test_relist_keeps_applications_listed_on_later_pages(self, crd_watcher, deploy_queue, watcher, list_pages):
+        application = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "2")["object"])
+        list_pages.return_value = [([application], "2")]
+        crd_watcher._watch(None)
+        deploy_queue.get_nowait()
+
+        list_pages.return_value = [([], "9"), ([application], "9")]
+        crd_watcher._resource_version = None
+        crd_watcher._watch(None)
+
+        assert deploy_queue.empty()
+        assert watcher.call_args_list[-1] == mock.call(FiaasApplication, None, resource_version="9")
+
+    def test_ignores_applications_owned_by_other_replicas(self, crd_watcher, deploy_queue, watcher, shard_manager):
+        shard_manager.owns.return_value = False
+        watcher.return_value = [WatchEvent(ADD_EVENT, FiaasApplication)]
+
+        crd_watcher._watch(None)
+
+        shard_manager.owns.assert_called_with("the-namespace", "example")
+        assert deploy_queue.empty()
+
+    def test_handles_applications_in_acquired_shards(self, crd_watcher, deploy_queue, shard_manager):
+        application = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "2")["object"])
+        shard_manager.shard_of.return_value = 3
+        with mock.patch("fiaas_deploy_daemon.crd.watcher.iter_resources") as iter_resources:
+            iter_resources.return_value = [application]
+
+            crd_watcher._resync({1, 2})
+            assert deploy_queue.empty()
+
+            crd_watcher._resync({3})
+            assert deploy_queue.get_nowait().action == "UPDATE"
+
+    def test_standby_handles_applications_when_elected(self, crd_watcher, deploy_queue, watcher, leader_elector):
+        application = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "2")["object"])
+        leader_elector.is_leader.return_value = False
+        watcher.return_value = [WatchEvent(_with_resource_version(ADD_EVENT, "2"), FiaasApplication)]
+        crd_watcher._watch(None)
+        assert deploy_queue.empty()
+
+        leader_elector.is_leader.return_value = True
+        with mock.patch("fiaas_deploy_daemon.crd.watcher.iter_resources") as iter_resources:
+            iter_resources.return_value = [application]
+            crd_watcher._resync()
+
+        assert deploy_queue.get_nowait().action == "UPDATE"
+
+    @pytest.mark.parametrize("result", ("SUCCESS", "FAILED"))
+    def test_standby_leaves_finished_applications_alone_when_elected(self, crd_watcher, deploy_queue, watcher,
+                                                                     leader_elector, status_index, result):
+        application = FiaasApplication.from_dict(_with_resource_version(ADD_EVENT, "2")["object"])
+        status_index.has_synced.return_value = True
+        status_index.result.return_value = result
+        leader_elector.is_leader.return_value = False
+        watcher.return_value = [WatchEvent(_with_resource_version(ADD_EVENT, "2"), FiaasApplication)]
+        crd_watcher._watch(None)
+
+        leader_elector.is_leader.return_value = True
+        with mock.patch("fiaas_deploy_daemon.crd.watcher.iter_resources") as iter_resources:
+            iter_resources.return_value = [application]
+            crd_watcher._resync()
+
+        assert deploy_queue.empty()
+
+    def test_standby_forgets_applications_deleted_while_not_leading(self, crd_watcher, deploy_queue, watcher,
+                                                                    leader_elector):
+        leader_elector.is_leader.return_value = False
+        watcher.return_value = [WatchEvent(_with_resource_version(ADD_EVENT, "2"), FiaasApplication),
+                                WatchEvent(_with_resource_version(DELETED_EVENT, "3"), FiaasApplication)]
+        crd_watcher._watch(None)
+
+        assert crd_watcher._seen == {}
+        assert deploy_queue.empty()
+
+
+def _with_resource_version(event, resource_version):
+    event = copy.deepcopy(event)
+    event["object"]["metadata"]["resourceVersion"] = resource_version
+    return event
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.crd.status import create_name
+from fiaas_deploy_daemon.crd.status_index import StatusIndex
+from fiaas_deploy_daemon.crd.types import FiaasApplicationStatus
+
+
+def _status(name, resource_version, result):
+    metadata = {"name": name, "namespace": "default", "resourceVersion": resource_version}
+    return FiaasApplicationStatus.from_dict({"metadata": metadata, "result": result})
+
+
+class TestStatusIndex(object):
+    @pytest.fixture
+    def status_index(self):
+        return StatusIndex(Configuration([]))
+
+    def test_result_of_unknown_deployment_is_none(self, status_index):
+        assert status_index.result("app", "default", "deployment_id") is None
+
+    def test_result_is_looked_up_by_app_namespace_and_deployment_id(self, status_index):
+        status_index.put(_status(create_name("app", "deployment_id"), "1", "SUCCESS"))
+
+        assert status_index.result("app", "default", "deployment_id") == "SUCCESS"
+        assert status_index.result("app", "default", "other_deployment_id") is None
+        assert status_index.result("app", "other-namespace", "deployment_id") is None
+
+    def test_newer_status_replaces_older(self, status_index):
+        name = create_name("app", "deployment_id")
+        status_index.put(_status(name, "1", "RUNNING"))
+        status_index.put(_status(name, "2", "SUCCESS"))
+        status_index.put(_status(name, "1", "RUNNING"))
+
+        assert status_index.result("app", "default", "deployment_id") == "SUCCESS"
+
+    def test_logs_are_not_kept(self, status_index):
+        name = create_name("app", "deployment_id")
+        status = _status(name, "1", "SUCCESS")
+        status.logs = ["a long log line"]
+        status_index.put(status)
+
+        known = status_index.get("default", name)
+        assert known.logs == []
+        assert known.result == "SUCCESS"
+        assert known.metadata.resourceVersion == "1"
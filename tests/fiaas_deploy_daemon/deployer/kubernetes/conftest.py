@@ -14,10 +14,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import copy
+
 import pytest
 import mock
 
+from fiaas_deploy_daemon.config import Configuration
 from fiaas_deploy_daemon.deployer.kubernetes.owner_references import OwnerReferences
+from fiaas_deploy_daemon.deployer.kubernetes.resource_cache import ResourceCache, DESIRED_STATE_HASH_ANNOTATION
 
 
 @pytest.helpers.register
@@ -47,6 +51,20 @@ def create_metadata(app_name, namespace='default', labels=None, external=None, a
     return metadata
 
 
+@pytest.helpers.register
+def with_desired_state_hash(resource):
+    """Return a copy of resource, expecting the desired state hash annotation added by the ResourceCache"""
+    resource = copy.deepcopy(resource)
+    resource["metadata"].setdefault("annotations", {})[DESIRED_STATE_HASH_ANNOTATION] = mock.ANY
+    return resource
+
+
 @pytest.fixture
 def owner_references():
     return mock.create_autospec(OwnerReferences(), spec_set=True, instance=True)
+
+
+@pytest.fixture
+def resource_cache():
+    """A ResourceCache that has not been started, so all reads go to the API server"""
+    return ResourceCache(Configuration([]))
@@ -18,10 +18,13 @@ from k8s.models.common import ObjectMeta
 from k8s.models.resourcequota import ResourceQuota, ResourceQuotaSpec, NotBestEffort, BestEffort
 
 from fiaas_deploy_daemon.config import Configuration
-from fiaas_deploy_daemon.deployer.kubernetes.adapter import K8s, _make_selector
+from fiaas_deploy_daemon.deadline import deadline, current_deadline
+from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
+from fiaas_deploy_daemon.deployer.kubernetes.adapter import K8s, _make_selector, DeployFailed
 from fiaas_deploy_daemon.deployer.kubernetes.autoscaler import AutoscalerDeployer
 from fiaas_deploy_daemon.deployer.kubernetes.deployment import DeploymentDeployer
 from fiaas_deploy_daemon.deployer.kubernetes.ingress import IngressDeployer
+from fiaas_deploy_daemon.deployer.kubernetes.quota_cache import QuotaCache
 from fiaas_deploy_daemon.deployer.kubernetes.service import ServiceDeployer
 from fiaas_deploy_daemon.specs.models import ResourcesSpec, ResourceRequirementSpec
 
@@ -54,10 +57,16 @@ class TestK8s(object):
             yield mockk
 
     @pytest.fixture
-    def k8s(self, service_deployer, deployment_deployer, ingress_deployer, autoscaler_deployer):
+    def bookkeeper(self):
+        return mock.create_autospec(Bookkeeper, spec_set=True, instance=True)
+
+    @pytest.fixture
+    def k8s(self, service_deployer, deployment_deployer, ingress_deployer, autoscaler_deployer, bookkeeper):
         config = mock.create_autospec(Configuration([]), spec_set=True)
         config.version = FIAAS_VERSION
-        return K8s(config, service_deployer, deployment_deployer, ingress_deployer, autoscaler_deployer)
+        config.deploy_workers = 1
+        return K8s(config, service_deployer, deployment_deployer, ingress_deployer, autoscaler_deployer,
+                   QuotaCache(Configuration([])), bookkeeper)
 
     def test_make_labels(self, k8s, app_spec):
         actual = k8s._make_labels(app_spec)
@@ -129,3 +138,49 @@ class TestK8s(object):
         k8s.deploy(app_spec)
 
         pytest.helpers.assert_any_call(service_deployer.deploy, app_spec, selector, labels)
+
+    def test_times_each_phase(self, app_spec, k8s, bookkeeper):
+        k8s.deploy(app_spec)
+
+        assert sorted(c[0][0] for c in bookkeeper.time_phase.call_args_list) == [
+            "autoscaler", "deployment", "ingress", "resource_quota", "service"]
+
+    def test_single_failure_is_raised(self, app_spec, k8s, ingress_deployer, autoscaler_deployer):
+        error = ValueError("ingress failed")
+        ingress_deployer.deploy.side_effect = error
+
+        with pytest.raises(ValueError) as excinfo:
+            k8s.deploy(app_spec)
+
+        assert excinfo.value is error
+        autoscaler_deployer.deploy.assert_called_once()
+
+    def test_autoscaler_is_not_deployed_when_deployment_fails(self, app_spec, k8s, deployment_deployer,
+                                                              autoscaler_deployer, service_deployer):
+        deployment_deployer.deploy.side_effect = ValueError("deployment failed")
+
+        with pytest.raises(ValueError):
+            k8s.deploy(app_spec)
+
+        autoscaler_deployer.deploy.assert_not_called()
+        service_deployer.deploy.assert_called_once()
+
+    def test_failures_are_aggregated(self, app_spec, k8s, service_deployer, deployment_deployer):
+        service_deployer.deploy.side_effect = ValueError("service failed")
+        deployment_deployer.deploy.side_effect = KeyError("deployment failed")
+
+        with pytest.raises(DeployFailed) as excinfo:
+            k8s.deploy(app_spec)
+
+        assert sorted(phase for phase, _ in excinfo.value.errors) == ["deployment", "service"]
+
+    def test_phases_run_within_the_deadline_of_the_deploy(self, app_spec, k8s, service_deployer, ingress_deployer,
+                                                          deployment_deployer, autoscaler_deployer):
+        deadlines = []
+        for deployer in (service_deployer, ingress_deployer, deployment_deployer, autoscaler_deployer):
+            deployer.deploy.side_effect = lambda *args: deadlines.append(current_deadline())
+
+        with deadline(60) as expires:
+            k8s.deploy(app_spec)
+
+        assert deadlines == [expires] * 4
@@ -54,8 +54,8 @@ def test_autoscaler_enabled_and_2_max_replicas_and__requested_cpu_gives_autoscal
 
 class TestAutoscalerDeployer(object):
     @pytest.fixture
-    def deployer(self, owner_references):
-        return AutoscalerDeployer(owner_references)
+    def deployer(self, owner_references, resource_cache):
+        return AutoscalerDeployer(owner_references, resource_cache)
 
     @pytest.mark.usefixtures("get")
     def test_new_autoscaler(self, deployer, post, app_spec, owner_references):
@@ -84,7 +84,7 @@ class TestAutoscalerDeployer(object):
 
         deployer.deploy(app_spec, LABELS)
 
-        pytest.helpers.assert_any_call(post, AUTOSCALER_API, expected_autoscaler)
+        pytest.helpers.assert_any_call(post, AUTOSCALER_API, pytest.helpers.with_desired_state_hash(expected_autoscaler))
         owner_references.apply.assert_called_once_with(TypeMatcher(HorizontalPodAutoscaler), app_spec)
 
     @pytest.mark.usefixtures("get")
@@ -120,7 +120,7 @@ class TestAutoscalerDeployer(object):
 
         deployer.deploy(app_spec, LABELS)
 
-        pytest.helpers.assert_any_call(post, AUTOSCALER_API, expected_autoscaler)
+        pytest.helpers.assert_any_call(post, AUTOSCALER_API, pytest.helpers.with_desired_state_hash(expected_autoscaler))
 
     def test_no_autoscaler_gives_no_post(self, deployer, delete, post, app_spec):
         deployer.deploy(app_spec, LABELS)
@@ -169,8 +169,9 @@ class TestDeploymentDeployer(object):
         return mock.create_autospec(Secrets(config, None, None), spec_set=True, instance=True)
 
     @pytest.mark.usefixtures("get")
-    def test_managed_environment_variables(self, post, config, app_spec, datadog, prometheus, secrets, owner_references):
-        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references)
+    def test_managed_environment_variables(self, post, config, app_spec, datadog, prometheus, secrets, owner_references,
+                                           resource_cache):
+        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references, resource_cache)
         env = deployer._make_env(app_spec)
         env_keys = [var.name for var in env]
         assert 'FIAAS_ARTIFACT_NAME' in env_keys
@@ -181,23 +182,25 @@ class TestDeploymentDeployer(object):
         assert ('VERSION' not in env_keys) == config.disable_deprecated_managed_env_vars
 
     @pytest.mark.usefixtures("get")
-    def test_deploy_new_deployment(self, post, config, app_spec, datadog, prometheus, secrets, owner_references):
+    def test_deploy_new_deployment(self, post, config, app_spec, datadog, prometheus, secrets, owner_references,
+                                   resource_cache):
         expected_deployment = create_expected_deployment(config, app_spec)
         mock_response = create_autospec(Response)
         mock_response.json.return_value = expected_deployment
         post.side_effect = None
         post.return_value = mock_response
 
-        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references)
+        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references, resource_cache)
         deployer.deploy(app_spec, SELECTOR, LABELS, False)
 
-        pytest.helpers.assert_any_call(post, DEPLOYMENTS_URI, expected_deployment)
+        pytest.helpers.assert_any_call(post, DEPLOYMENTS_URI, pytest.helpers.with_desired_state_hash(expected_deployment))
         datadog.apply.assert_called_once_with(TypeMatcher(Deployment), app_spec, False)
         prometheus.apply.assert_called_once_with(TypeMatcher(Deployment), app_spec)
         secrets.apply.assert_called_once_with(TypeMatcher(Deployment), app_spec)
         owner_references.apply.assert_called_with(TypeMatcher(Deployment), app_spec)
 
-    def test_deploy_clears_alpha_beta_annotations(self, put, get, config, app_spec, datadog, prometheus, secrets, owner_references):
+    def test_deploy_clears_alpha_beta_annotations(self, put, get, config, app_spec, datadog, prometheus, secrets, owner_references,
+                                                  resource_cache):
         old_strongbox_spec = app_spec.strongbox._replace(enabled=True, groups=["group1", "group2"])
         old_app_spec = app_spec._replace(strongbox=old_strongbox_spec)
         old_deployment = create_expected_deployment(config, old_app_spec, add_init_container_annotations=True)
@@ -212,10 +215,10 @@ class TestDeploymentDeployer(object):
         put.side_effect = None
         put.return_value = put_mock_response
 
-        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references)
+        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references, resource_cache)
         deployer.deploy(app_spec, SELECTOR, LABELS, False)
 
-        pytest.helpers.assert_any_call(put, DEPLOYMENTS_URI + "testapp", expected_deployment)
+        pytest.helpers.assert_any_call(put, DEPLOYMENTS_URI + "testapp", pytest.helpers.with_desired_state_hash(expected_deployment))
         datadog.apply.assert_called_once_with(DeploymentMatcher(), app_spec, False)
         prometheus.apply.assert_called_once_with(DeploymentMatcher(), app_spec)
         secrets.apply.assert_called_once_with(DeploymentMatcher(), app_spec)
@@ -227,8 +230,8 @@ class TestDeploymentDeployer(object):
     ))
     def test_replicas_when_autoscaler_enabled(self, previous_replicas, max_replicas, min_replicas, cpu_request,
                                               expected_replicas, config, app_spec, get, put, post, datadog, prometheus,
-                                              secrets, owner_references):
-        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references)
+                                              secrets, owner_references, resource_cache):
+        deployer = DeploymentDeployer(config, datadog, prometheus, secrets, owner_references, resource_cache)
 
         image = "finntech/testimage:version2"
         version = "version2"
@@ -326,7 +329,7 @@ class TestDeploymentDeployer(object):
         deployer.deploy(app_spec, SELECTOR, LABELS, False)
 
         pytest.helpers.assert_no_calls(post)
-        pytest.helpers.assert_any_call(put, DEPLOYMENTS_URI + "testapp", expected_deployment)
+        pytest.helpers.assert_any_call(put, DEPLOYMENTS_URI + "testapp", pytest.helpers.with_desired_state_hash(expected_deployment))
         datadog.apply.assert_called_once_with(DeploymentMatcher(), app_spec, False)
         prometheus.apply.assert_called_once_with(DeploymentMatcher(), app_spec)
         secrets.apply.assert_called_once_with(DeploymentMatcher(), app_spec)
@@ -497,13 +497,13 @@ class TestIngressDeployer(object):
         return config
 
     @pytest.fixture
-    def deployer(self, config, ingress_tls, owner_references):
-        return IngressDeployer(config, ingress_tls, owner_references)
+    def deployer(self, config, ingress_tls, owner_references, resource_cache):
+        return IngressDeployer(config, ingress_tls, owner_references, resource_cache)
 
     @pytest.fixture
-    def deployer_no_suffix(self, config, ingress_tls, owner_references):
+    def deployer_no_suffix(self, config, ingress_tls, owner_references, resource_cache):
         config.ingress_suffixes = []
-        return IngressDeployer(config, ingress_tls, owner_references)
+        return IngressDeployer(config, ingress_tls, owner_references, resource_cache)
 
     def pytest_generate_tests(self, metafunc):
         fixtures = ("app_spec", "expected_ingress")
@@ -521,7 +521,7 @@ class TestIngressDeployer(object):
 
         deployer.deploy(app_spec, LABELS)
 
-        pytest.helpers.assert_any_call(post, INGRESSES_URI, expected_ingress)
+        pytest.helpers.assert_any_call(post, INGRESSES_URI, pytest.helpers.with_desired_state_hash(expected_ingress))
         owner_references.apply.assert_called_once_with(TypeMatcher(Ingress), app_spec)
         delete.assert_called_once_with(INGRESSES_URI, body=None, params=LABEL_SELECTOR_PARAMS)
 
@@ -591,8 +591,8 @@ class TestIngressDeployer(object):
 
         deployer.deploy(app_spec, LABELS)
 
-        post.assert_has_calls([mock.call(INGRESSES_URI, expected_ingress), mock.call(INGRESSES_URI, expected_ingress2),
-                               mock.call(INGRESSES_URI, expected_ingress3)])
+        post.assert_has_calls([mock.call(INGRESSES_URI, pytest.helpers.with_desired_state_hash(expected))
+                               for expected in (expected_ingress, expected_ingress2, expected_ingress3)])
         delete.assert_called_once_with(INGRESSES_URI, body=None, params=LABEL_SELECTOR_PARAMS)
 
     @pytest.mark.parametrize("spec_name", (
@@ -622,8 +622,9 @@ class TestIngressDeployer(object):
              [u'test.foo.rewrite.example.com', u'testapp.svc.test.example.com', u'testapp.127.0.0.1.xip.io']),
     ))
     @pytest.mark.usefixtures("delete")
-    def test_applies_ingress_tls(self, deployer, ingress_tls, app_spec, hosts):
-        with mock.patch("k8s.models.ingress.Ingress.get_or_create") as get_or_create:
+    def test_applies_ingress_tls(self, deployer, ingress_tls, resource_cache, app_spec, hosts):
+        with mock.patch.object(resource_cache, "get_or_create") as get_or_create, \
+                mock.patch.object(resource_cache, "save"):
             get_or_create.return_value = mock.create_autospec(Ingress, spec_set=True)
             deployer.deploy(app_spec, LABELS)
             ingress_tls.apply.assert_called_once_with(TypeMatcher(Ingress), app_spec, hosts, use_suffixes=True)
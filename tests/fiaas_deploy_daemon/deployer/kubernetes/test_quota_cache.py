@@ -0,0 +1,104 @@
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+from k8s.base import WatchEvent
+from k8s.models.resourcequota import ResourceQuota, NotBestEffort
+
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.deployer.kubernetes.quota_cache import QuotaCache
+
+
+def _quota(namespace, pods, resource_version="1"):
+    return ResourceQuota.from_dict({
+        "metadata": {"name": "quota", "namespace": namespace, "resourceVersion": resource_version},
+        "spec": {"hard": {"pods": pods}, "scopes": [NotBestEffort]},
+    })
+
+
+class TestQuotaCache(object):
+    @pytest.fixture
+    def resource_quota_list(self):
+        with mock.patch('k8s.models.resourcequota.ResourceQuota.list') as mockk:
+            mockk.return_value = [_quota("default", "0")]
+            yield mockk
+
+    @pytest.fixture
+    def now(self):
+        return [100.0]
+
+    @pytest.fixture
+    def quota_cache(self, now):
+        return QuotaCache(Configuration([]), time_func=lambda: now[0])
+
+    @pytest.fixture
+    def synced(self, quota_cache):
+        quota_cache._informer._synced.set()
+        quota_cache._informer.put(_quota("default", "0"))
+        quota_cache._informer.put(_quota("other", "10"))
+
+    def test_lists_quotas_until_synced(self, quota_cache, resource_quota_list):
+        assert quota_cache.besteffort_qos_is_required("default")
+        assert quota_cache.besteffort_qos_is_required("default")
+
+        assert resource_quota_list.call_count == 2
+
+    @pytest.mark.usefixtures("synced")
+    def test_decision_is_computed_once_per_namespace(self, quota_cache, resource_quota_list):
+        with mock.patch.object(quota_cache._informer, "list", wraps=quota_cache._informer.list) as informer_list:
+            assert quota_cache.besteffort_qos_is_required("default")
+            assert quota_cache.besteffort_qos_is_required("default")
+            assert not quota_cache.besteffort_qos_is_required("other")
+
+        assert informer_list.call_args_list == [mock.call("default"), mock.call("other")]
+        resource_quota_list.assert_not_called()
+
+    @pytest.mark.usefixtures("synced")
+    def test_changed_quota_invalidates_namespace(self, quota_cache):
+        assert quota_cache.besteffort_qos_is_required("default")
+        assert not quota_cache.besteffort_qos_is_required("other")
+
+        changed = _quota("default", "10", resource_version="2")
+        quota_cache._informer.put(changed)
+        quota_cache._on_change(WatchEvent.MODIFIED, changed)
+
+        assert not quota_cache.besteffort_qos_is_required("default")
+        assert "other" in quota_cache._decisions
+
+    @pytest.mark.usefixtures("synced")
+    def test_decision_is_not_cached_when_invalidated_while_computing(self, quota_cache):
+        informer_list = quota_cache._informer.list
+
+        def list_and_invalidate(namespace):
+            quotas = informer_list(namespace)
+            quota_cache.invalidate(namespace)
+            return quotas
+
+        with mock.patch.object(quota_cache._informer, "list", side_effect=list_and_invalidate):
+            assert quota_cache.besteffort_qos_is_required("default")
+
+        assert "default" not in quota_cache._decisions
+
+    @pytest.mark.usefixtures("synced")
+    def test_age_of_oldest_decision(self, quota_cache, now):
+        assert quota_cache.age() == 0
+        quota_cache.besteffort_qos_is_required("default")
+        now[0] = 130.0
+        quota_cache.besteffort_qos_is_required("other")
+        now[0] = 160.0
+
+        assert quota_cache.age() == 60.0
+        quota_cache.invalidate()
+        assert quota_cache.age() == 0
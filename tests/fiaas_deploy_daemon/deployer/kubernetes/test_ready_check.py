@@ -17,15 +17,19 @@
 
 import mock
 import pytest
+from k8s.models.deployment import Deployment
 from monotonic import monotonic as time_monotonic
 
 from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
 from fiaas_deploy_daemon.config import Configuration
-from fiaas_deploy_daemon.deployer.kubernetes.ready_check import ReadyCheck
+from fiaas_deploy_daemon.deployer.kubernetes.ready_check import ReadyCheck, ReadinessTracker
+from fiaas_deploy_daemon.deployer.kubernetes.resource_cache import ResourceCache
+from fiaas_deploy_daemon.leader_election import LeaderElector
 from fiaas_deploy_daemon.lifecycle import Lifecycle, Subject
 from fiaas_deploy_daemon.specs.models import LabelAndAnnotationSpec
 
 REPLICAS = 2
+DEPLOYMENT_ID = "test_app_deployment_id"
 
 
 class TestReadyCheck(object):
@@ -46,14 +50,25 @@ class TestReadyCheck(object):
     def config(self):
         return Configuration([])
 
+    @pytest.fixture
+    def readiness_tracker(self, resource_cache):
+        return ReadinessTracker(resource_cache)
+
+    @pytest.fixture
+    def leader_elector(self):
+        leader_elector = mock.create_autospec(LeaderElector, spec_set=True, instance=True)
+        leader_elector.is_leader.return_value = True
+        return leader_elector
+
     @pytest.mark.parametrize("generation,observed_generation", (
             (0, 0),
             (0, 1)
     ))
     def test_deployment_complete(self, get, app_spec, bookkeeper, generation, observed_generation, lifecycle,
-                                 lifecycle_subject, config):
+                                 lifecycle_subject, config,
+                                 readiness_tracker, leader_elector):
         self._create_response(get, generation=generation, observed_generation=observed_generation)
-        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker, leader_elector)
 
         assert ready() is False
         bookkeeper.success.assert_called_with(app_spec)
@@ -70,9 +85,10 @@ class TestReadyCheck(object):
             (2, 2, 2, 2, 1, 0),
     ))
     def test_deployment_incomplete(self, get, app_spec, bookkeeper, requested, replicas, available, updated,
-                                   generation, observed_generation, lifecycle, lifecycle_subject, config):
+                                   generation, observed_generation, lifecycle, lifecycle_subject, config,
+                                   readiness_tracker, leader_elector):
         self._create_response(get, requested, replicas, available, updated, generation, observed_generation)
-        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker, leader_elector)
 
         assert ready() is True
         bookkeeper.success.assert_not_called()
@@ -88,13 +104,14 @@ class TestReadyCheck(object):
             (2, 1, 1, 1, {"fiaas/source-repository": "xyz"}, "xyz"),
     ))
     def test_deployment_failed(self, get, app_spec, bookkeeper, requested, replicas, available, updated,
-                               lifecycle, lifecycle_subject, annotations, repository, config):
+                               lifecycle, lifecycle_subject, annotations, repository, config,
+                               readiness_tracker, leader_elector):
         if annotations:
             app_spec = app_spec._replace(annotations=LabelAndAnnotationSpec(*[annotations] * 6))
 
         self._create_response(get, requested, replicas, available, updated)
 
-        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker, leader_elector)
         ready._fail_after = time_monotonic()
 
         assert ready() is False
@@ -103,10 +120,11 @@ class TestReadyCheck(object):
         lifecycle.success.assert_not_called()
         lifecycle.failed.assert_called_with(lifecycle_subject)
 
-    def test_deployment_complete_deactivated(self, get, app_spec, bookkeeper, lifecycle, lifecycle_subject, config):
+    def test_deployment_complete_deactivated(self, get, app_spec, bookkeeper, lifecycle, lifecycle_subject, config,
+                                             readiness_tracker, leader_elector):
 
         self._create_response_zero_replicas(get)
-        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker, leader_elector)
 
         assert ready() is False
         bookkeeper.success.assert_called_with(app_spec)
@@ -114,14 +132,80 @@ class TestReadyCheck(object):
         lifecycle.success.assert_called_with(lifecycle_subject)
         lifecycle.failed.assert_not_called()
 
+    def test_check_is_superseded_by_newer_rollout(self, get, app_spec, bookkeeper, lifecycle, lifecycle_subject,
+                                                  config, readiness_tracker, leader_elector):
+        self._create_response(get, deployment_id="newer_deployment_id")
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker, leader_elector)
+        ready._fail_after = time_monotonic()
+
+        assert ready() is False
+        lifecycle.superseded.assert_called_once_with(lifecycle_subject)
+        lifecycle.success.assert_not_called()
+        lifecycle.failed.assert_not_called()
+        bookkeeper.failed.assert_not_called()
+        bookkeeper.superseded.assert_called_once_with(app_spec)
+
+    def test_notify_resolves_superseded_check(self, get, app_spec, bookkeeper, lifecycle, lifecycle_subject, config,
+                                              leader_elector):
+        tracker = mock.create_autospec(ReadinessTracker, spec_set=True, instance=True)
+        tracker.get_deployment.return_value = self._deployment(get, available=1, deployment_id="newer_deployment_id")
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, tracker, leader_elector)
+
+        ready.notify()
+
+        assert ready() is False
+        lifecycle.superseded.assert_called_once_with(lifecycle_subject)
+        tracker.unregister.assert_called_once_with(ready)
+
+    def test_waits_for_changes_when_incomplete(self, get, app_spec, bookkeeper, lifecycle, lifecycle_subject, config,
+                                               leader_elector):
+        tracker = mock.create_autospec(ReadinessTracker, spec_set=True, instance=True)
+        tracker.get_deployment.return_value = self._deployment(get, available=1)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, tracker, leader_elector)
+
+        assert ready() is True
+        tracker.unregister.assert_not_called()
+
+    def test_notify_reports_success_once(self, get, app_spec, bookkeeper, lifecycle, lifecycle_subject, config,
+                                         leader_elector):
+        tracker = mock.create_autospec(ReadinessTracker, spec_set=True, instance=True)
+        tracker.get_deployment.return_value = self._deployment(get)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, tracker, leader_elector)
+
+        ready.notify()
+        ready.notify()
+
+        assert ready() is False
+        lifecycle.success.assert_called_once_with(lifecycle_subject)
+        bookkeeper.success.assert_called_once_with(app_spec)
+        tracker.unregister.assert_called_once_with(ready)
+
+    def test_leaves_result_to_new_leader_when_leadership_is_lost(self, get, app_spec, bookkeeper, lifecycle,
+                                                                 lifecycle_subject, config, leader_elector):
+        tracker = mock.create_autospec(ReadinessTracker, spec_set=True, instance=True)
+        tracker.get_deployment.return_value = self._deployment(get)
+        ready = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, tracker, leader_elector)
+        leader_elector.is_leader.return_value = False
+
+        ready.notify()
+
+        assert ready() is False
+        lifecycle.success.assert_not_called()
+        bookkeeper.success.assert_not_called()
+        tracker.unregister.assert_called_once_with(ready)
+
+    def _deployment(self, get, **kwargs):
+        self._create_response(get, **kwargs)
+        return Deployment.from_dict(get.return_value.json.return_value)
+
     @staticmethod
     def _create_response(get, requested=REPLICAS, replicas=REPLICAS, available=REPLICAS, updated=REPLICAS,
-                         generation=0, observed_generation=0):
+                         generation=0, observed_generation=0, deployment_id=DEPLOYMENT_ID):
         get.side_effect = None
         resp = mock.MagicMock()
         get.return_value = resp
         resp.json.return_value = {
-            'metadata': pytest.helpers.create_metadata('testapp', generation=generation),
+            'metadata': _deployment_metadata(generation, deployment_id),
             'spec': {
                 'selector': {'matchLabels': {'app': 'testapp'}},
                 'template': {
@@ -150,7 +234,7 @@ class TestReadyCheck(object):
         resp = mock.MagicMock()
         get.return_value = resp
         resp.json.return_value = {
-            'metadata': pytest.helpers.create_metadata('testapp', generation=0),
+            'metadata': _deployment_metadata(0, DEPLOYMENT_ID),
             'spec': {
                 'selector': {'matchLabels': {'app': 'testapp'}},
                 'template': {
@@ -168,3 +252,70 @@ class TestReadyCheck(object):
                 'observedGeneration': 0,
             }
         }
+
+
+class TestReadinessTracker(object):
+    @pytest.fixture
+    def resource_cache(self):
+        return mock.create_autospec(ResourceCache, spec_set=True, instance=True)
+
+    @pytest.fixture
+    def tracker(self, resource_cache):
+        return ReadinessTracker(resource_cache)
+
+    @pytest.fixture
+    def handler(self, tracker, resource_cache):
+        resource_cache.add_handler.assert_called_once_with(Deployment, mock.ANY)
+        return resource_cache.add_handler.call_args[0][1]
+
+    @pytest.fixture
+    def check(self):
+        check = mock.create_autospec(ReadyCheck, spec_set=True, instance=True)
+        check.key = ("default", "testapp")
+        return check
+
+    @pytest.fixture
+    def deployment(self):
+        return Deployment.from_dict({"metadata": _deployment_metadata(1, DEPLOYMENT_ID)})
+
+    def test_reads_deployment_through_cache(self, tracker, resource_cache, deployment):
+        resource_cache.find.return_value = deployment
+
+        assert tracker.get_deployment("testapp", "default") is deployment
+        resource_cache.find.assert_called_once_with(Deployment, "testapp", "default")
+
+    def test_notifies_registered_check_on_change(self, tracker, handler, check, deployment):
+        tracker.register(check)
+
+        handler("MODIFIED", deployment)
+
+        check.notify.assert_called_once_with()
+
+    def test_replaced_check_is_notified(self, tracker, handler, check, deployment):
+        newer = mock.create_autospec(ReadyCheck, spec_set=True, instance=True)
+        newer.key = check.key
+        tracker.register(check)
+
+        tracker.register(newer)
+        handler("MODIFIED", deployment)
+
+        check.notify.assert_called_once_with()
+        newer.notify.assert_called_once_with()
+
+    def test_unregistered_check_is_not_notified(self, tracker, handler, check, deployment):
+        tracker.register(check)
+        tracker.unregister(check)
+
+        handler("MODIFIED", deployment)
+
+        check.notify.assert_not_called()
+
+
+def _deployment_metadata(generation, deployment_id):
+    labels = {
+        'app': 'testapp',
+        'fiaas/version': 'version',
+        'fiaas/deployed_by': '1',
+        'fiaas/deployment_id': deployment_id,
+    }
+    return pytest.helpers.create_metadata('testapp', labels=labels, generation=generation)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import copy
+import itertools
+
+import mock
+import pytest
+from k8s.base import Equality, Exists, Inequality
+from k8s.client import ClientError, NotFound
+from k8s.models.common import ObjectMeta
+from k8s.models.service import Service, ServiceSpec
+
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
+from fiaas_deploy_daemon.deployer.kubernetes.adapter import K8s
+from fiaas_deploy_daemon.deployer.kubernetes.autoscaler import AutoscalerDeployer
+from fiaas_deploy_daemon.deployer.kubernetes.deployment import DeploymentDeployer, DataDog, Prometheus, Secrets
+from fiaas_deploy_daemon.deployer.kubernetes.ingress import IngressDeployer, IngressTls
+from fiaas_deploy_daemon.deployer.kubernetes.quota_cache import QuotaCache
+from fiaas_deploy_daemon.deployer.kubernetes.resource_cache import CACHED_MODELS, MANAGED_LABELS, \
+    DESIRED_STATE_HASH_ANNOTATION, skipped_writes, _matches, _set_desired_state_hash
+from fiaas_deploy_daemon.deployer.kubernetes.service import ServiceDeployer
+from fiaas_deploy_daemon.retry import UpsertConflict
+from fiaas_deploy_daemon.specs.models import AutoscalerSpec, ResourcesSpec, ResourceRequirementSpec
+
+SERVICE_URI = '/api/v1/namespaces/default/services/testapp'
+
+
+def _service(resource_version, port=80, labels=None):
+    return {
+        "metadata": {"name": "testapp", "namespace": "default", "resourceVersion": resource_version,
+                     "labels": labels or {}},
+        "spec": {"ports": [{"name": "http", "protocol": "TCP", "port": port, "targetPort": 8080}]},
+    }
+
+
+def _response(data):
+    resp = mock.MagicMock()
+    resp.json.return_value = data
+    return resp
+
+
+def _synced(resource_cache, *services):
+    informer = resource_cache._informers[Service]
+    for service in services:
+        informer.put(Service.from_dict(service))
+    informer._synced.set()
+    return resource_cache
+
+
+class TestResourceCache(object):
+    def test_only_watches_managed_resources(self, resource_cache):
+        for model in CACHED_MODELS:
+            assert resource_cache._informers[model]._labels == MANAGED_LABELS
+
+    def test_reads_from_api_until_synced(self, get, resource_cache):
+        get.side_effect = None
+        get.return_value = _response(_service("5"))
+
+        service = resource_cache.find(Service, "testapp", "default")
+
+        assert service.metadata.resourceVersion == "5"
+        get.assert_called_once_with(SERVICE_URI)
+
+    def test_missing_resource_is_none(self, get, resource_cache):
+        assert resource_cache.find(Service, "testapp", "default") is None
+
+    def test_reads_from_cache_when_synced(self, get, resource_cache):
+        _synced(resource_cache, _service("5"))
+
+        service = resource_cache.find(Service, "testapp", "default")
+
+        assert service.metadata.resourceVersion == "5"
+        get.assert_not_called()
+
+    def test_changes_to_read_copy_do_not_change_cache(self, get, resource_cache):
+        _synced(resource_cache, _service("5"))
+
+        resource_cache.find(Service, "testapp", "default").spec.ports[0].port = 8000
+
+        assert resource_cache.find(Service, "testapp", "default").spec.ports[0].port == 80
+
+    def test_get_or_create_new(self, get, resource_cache):
+        _synced(resource_cache)
+        metadata = ObjectMeta(name="testapp", namespace="default")
+
+        service = resource_cache.get_or_create(Service, metadata=metadata, spec=ServiceSpec())
+
+        assert service._new
+        get.assert_not_called()
+
+    def test_saved_resource_is_cached(self, get, put, resource_cache):
+        _synced(resource_cache, _service("5"))
+        put.side_effect = None
+        put.return_value = _response(_service("6", port=8000))
+        service = resource_cache.find(Service, "testapp", "default")
+        service.spec.ports[0].port = 8000
+
+        resource_cache.save(service)
+
+        cached = resource_cache.find(Service, "testapp", "default")
+        assert cached.metadata.resourceVersion == "6"
+        assert cached.spec.ports[0].port == 8000
+
+    def test_older_version_does_not_replace_cached(self, resource_cache):
+        _synced(resource_cache, _service("7"))
+
+        resource_cache._informers[Service].put(Service.from_dict(_service("6")))
+
+        assert resource_cache.find(Service, "testapp", "default").metadata.resourceVersion == "7"
+
+    def test_reads_from_api_after_conflict(self, get, put, resource_cache):
+        _synced(resource_cache, _service("5"))
+        put.side_effect = ClientError("Conflict", response=mock.MagicMock(status_code=409))
+        get.side_effect = None
+        get.return_value = _response(_service("9"))
+
+        with pytest.raises(ClientError):
+            resource_cache.save(resource_cache.find(Service, "testapp", "default"))
+
+        assert resource_cache.find(Service, "testapp", "default").metadata.resourceVersion == "9"
+        assert resource_cache.find(Service, "testapp", "default").metadata.resourceVersion == "9"
+        get.assert_called_once_with(SERVICE_URI)
+
+    def test_deleted_after_update_is_retried_as_conflict(self, get, put, resource_cache):
+        _synced(resource_cache, _service("5"))
+        put.side_effect = ClientError("Not Found", response=mock.MagicMock(status_code=404))
+        get.side_effect = NotFound()
+
+        with pytest.raises(UpsertConflict):
+            resource_cache.save(resource_cache.find(Service, "testapp", "default"))
+
+        assert resource_cache.find(Service, "testapp", "default") is None
+        get.assert_called_once_with(SERVICE_URI)
+
+    def test_delete_removes_from_cache(self, get, delete, resource_cache):
+        _synced(resource_cache, _service("5"))
+
+        resource_cache.delete(Service, "testapp", "default")
+
+        delete.assert_called_once_with(SERVICE_URI)
+        assert resource_cache.find(Service, "testapp", "default") is None
+
+    def test_delete_list_removes_matching_from_cache(self, delete, resource_cache):
+        _synced(resource_cache, _service("5", labels={"app": "testapp", "fiaas/deployment_id": "1"}))
+        other = _service("6", labels={"app": "testapp", "fiaas/deployment_id": "2"})
+        other["metadata"]["name"] = "other"
+        _synced(resource_cache, other)
+
+        resource_cache.delete_list(Service, "default", [("fiaas/deployment_id", Inequality("2"))])
+
+        assert resource_cache.find(Service, "testapp", "default") is None
+        assert resource_cache.find(Service, "other", "default") is not None
+
+    def test_skips_saving_unchanged_resource(self, get, put, resource_cache):
+        _synced(resource_cache)
+        put.side_effect = lambda url, body: _response(body)
+        service = Service.from_dict(_service("5"))
+        resource_cache.save(service)
+        saved = resource_cache.find(Service, "testapp", "default")
+        assert DESIRED_STATE_HASH_ANNOTATION in saved.metadata.annotations
+        skipped = skipped_writes.labels("Service")._value.get()
+
+        resource_cache.save(Service.from_dict(_service("5")))
+
+        assert put.call_count == 1
+        assert skipped_writes.labels("Service")._value.get() == skipped + 1
+
+    def test_saves_changed_resource(self, get, put, resource_cache):
+        _synced(resource_cache)
+        put.side_effect = lambda url, body: _response(body)
+        resource_cache.save(Service.from_dict(_service("5")))
+
+        resource_cache.save(Service.from_dict(_service("5", port=81)))
+
+        assert put.call_count == 2
+
+    def test_desired_state_hash_ignores_fields_set_by_api_server(self):
+        rendered = Service.from_dict(_service("5"))
+        live = _service("6")
+        live["spec"]["clusterIP"] = "10.0.0.1"
+        live["metadata"]["annotations"] = {DESIRED_STATE_HASH_ANNOTATION: "old"}
+        live = Service.from_dict(live)
+
+        assert _set_desired_state_hash(rendered) == _set_desired_state_hash(live)
+
+
+@pytest.mark.parametrize("labels,selector,expected", (
+        ({"app": "a"}, {"app": "a"}, True),
+        ({"app": "a"}, {"app": Equality("b")}, False),
+        ({"app": "a"}, [("app", Exists()), ("app", Inequality("b"))], True),
+        ({"app": "a"}, {"fiaas/deployment_id": Exists()}, False),
+))
+def test_matches_label_selector(labels, selector, expected):
+    assert _matches(labels, selector) is expected
+
+
+class FakeApi(object):
+    """Keep resources written through the client in memory, counting the requests made"""
+
+    def __init__(self, get, post, put, delete):
+        self._resources = {}
+        self._resource_versions = itertools.count(1)
+        self.calls = {}
+        for method, mockk in (("GET", get), ("POST", post), ("PUT", put), ("DELETE", delete)):
+            mockk.side_effect = self._counted(method, getattr(self, "_" + method.lower()))
+
+    def reset(self):
+        self.calls = {}
+
+    def _counted(self, method, func):
+        def _call(url, *args, **kwargs):
+            self.calls[method] = self.calls.get(method, 0) + 1
+            return func(url, *args, **kwargs)
+        return _call
+
+    def _get(self, url, **kwargs):
+        if url.endswith("/") or url.endswith("/resourcequotas"):
+            return _response({"metadata": {"resourceVersion": "1"}, "items": []})
+        if url not in self._resources:
+            raise NotFound()
+        return _response(copy.deepcopy(self._resources[url]))
+
+    def _post(self, url, body, **kwargs):
+        return self._put(url + body["metadata"]["name"], body)
+
+    def _put(self, url, body, **kwargs):
+        stored = copy.deepcopy(body)
+        stored["metadata"]["resourceVersion"] = str(next(self._resource_versions))
+        self._resources[url] = stored
+        return _response(copy.deepcopy(stored))
+
+    def _delete(self, url, **kwargs):
+        return _response({})
+
+
+class Uncached(object):
+    """Read resources the way the sub-deployers did before the ResourceCache, with a GET for every read"""
+
+    @staticmethod
+    def find(model, name, namespace):
+        try:
+            return model.get(name, namespace)
+        except NotFound:
+            return None
+
+    @staticmethod
+    def get_or_create(model, **kwargs):
+        return model.get_or_create(**kwargs)
+
+    @staticmethod
+    def update_or_create(model, instance, **kwargs):
+        return model.get_or_create(**kwargs)
+
+    @staticmethod
+    def save(instance):
+        instance.save()
+
+    @staticmethod
+    def delete(model, name, namespace, **kwargs):
+        model.delete(name, namespace, **kwargs)
+
+    @staticmethod
+    def delete_list(model, namespace, labels, **kwargs):
+        model.delete_list(namespace=namespace, labels=labels, **kwargs)
+
+
+class TestApiCallsPerDeploy(object):
+    """Count the requests made by K8s.deploy to deploy an application with a Service, Ingress, Deployment and HPA again
+
+    Until the QuotaCache has listed the ResourceQuotas, one GET lists them. Through the cache, unchanged resources are
+    not saved.
+    """
+
+    @pytest.fixture
+    def fake_api(self, get, post, put, delete):
+        return FakeApi(get, post, put, delete)
+
+    @pytest.fixture
+    def config(self):
+        return Configuration(["--ingress-suffix", "svc.test.example.com"])
+
+    @pytest.fixture
+    def app_spec(self, app_spec):
+        requests = ResourceRequirementSpec(cpu="100m", memory=None)
+        return app_spec._replace(
+            autoscaler=AutoscalerSpec(enabled=True, min_replicas=2, max_replicas=3, cpu_threshold_percentage=50),
+            resources=ResourcesSpec(requests=requests, limits=ResourceRequirementSpec(cpu=None, memory=None)))
+
+    def _adapter(self, config, owner_references, cache, quota_cache):
+        datadog = mock.create_autospec(DataDog(config), spec_set=True, instance=True)
+        prometheus = mock.create_autospec(Prometheus(), spec_set=True, instance=True)
+        secrets = mock.create_autospec(Secrets(config, None, None), spec_set=True, instance=True)
+        ingress_tls = mock.create_autospec(IngressTls(config), spec_set=True, instance=True)
+        return K8s(config,
+                   ServiceDeployer(config, owner_references, cache),
+                   DeploymentDeployer(config, datadog, prometheus, secrets, owner_references, cache),
+                   IngressDeployer(config, ingress_tls, owner_references, cache),
+                   AutoscalerDeployer(owner_references, cache),
+                   quota_cache,
+                   mock.create_autospec(Bookkeeper, spec_set=True, instance=True))
+
+    def _count_redeploy(self, fake_api, adapter, app_spec):
+        adapter.deploy(app_spec)
+        fake_api.reset()
+        adapter.deploy(app_spec)
+        return fake_api.calls
+
+    def test_without_cache(self, fake_api, config, owner_references, app_spec):
+        adapter = self._adapter(config, owner_references, Uncached(), QuotaCache(config))
+
+        assert self._count_redeploy(fake_api, adapter, app_spec) == {"GET": 7, "PUT": 4, "DELETE": 1}
+
+    def test_cold_cache(self, fake_api, config, owner_references, resource_cache, app_spec):
+        adapter = self._adapter(config, owner_references, resource_cache, QuotaCache(config))
+
+        assert self._count_redeploy(fake_api, adapter, app_spec) == {"GET": 5, "DELETE": 1}
+
+    def test_synced_cache(self, fake_api, config, owner_references, resource_cache, app_spec):
+        for model in CACHED_MODELS:
+            resource_cache._informers[model]._synced.set()
+        quota_cache = QuotaCache(config)
+        quota_cache._informer._synced.set()
+        adapter = self._adapter(config, owner_references, resource_cache, quota_cache)
+
+        assert self._count_redeploy(fake_api, adapter, app_spec) == {"DELETE": 1}
@@ -37,10 +37,10 @@ class TestServiceDeployer(object):
         return request.param
 
     @pytest.fixture
-    def deployer(self, service_type, owner_references):
+    def deployer(self, service_type, owner_references, resource_cache):
         config = create_autospec(Configuration([]), spec_set=True)
         config.service_type = service_type
-        return ServiceDeployer(config, owner_references)
+        return ServiceDeployer(config, owner_references, resource_cache)
 
     @pytest.mark.usefixtures("get")
     def test_deploy_new_service(self, deployer, service_type, post, app_spec, owner_references):
@@ -66,7 +66,7 @@ class TestServiceDeployer(object):
 
         deployer.deploy(app_spec, SELECTOR, LABELS)
 
-        pytest.helpers.assert_any_call(post, SERVICES_URI, expected_service)
+        pytest.helpers.assert_any_call(post, SERVICES_URI, pytest.helpers.with_desired_state_hash(expected_service))
         owner_references.apply.assert_called_once_with(TypeMatcher(Service), app_spec)
 
     @pytest.mark.usefixtures("get")
@@ -103,7 +103,7 @@ class TestServiceDeployer(object):
 
         deployer.deploy(app_spec_custom_labels_and_annotations, SELECTOR, {})
 
-        pytest.helpers.assert_any_call(post, SERVICES_URI, expected_service)
+        pytest.helpers.assert_any_call(post, SERVICES_URI, pytest.helpers.with_desired_state_hash(expected_service))
 
     @pytest.mark.usefixtures("get")
     def test_deploy_new_service_with_multiple_ports(self, deployer, service_type, post, app_spec_thrift_and_http):
@@ -137,7 +137,7 @@ class TestServiceDeployer(object):
 
         deployer.deploy(app_spec_thrift_and_http, SELECTOR, LABELS)
 
-        pytest.helpers.assert_any_call(post, SERVICES_URI, expected_service)
+        pytest.helpers.assert_any_call(post, SERVICES_URI, pytest.helpers.with_desired_state_hash(expected_service))
 
     @pytest.mark.usefixtures("get")
     def test_deploy_new_service_with_multiple_tcp_ports(self, deployer, service_type, post,
@@ -172,7 +172,7 @@ class TestServiceDeployer(object):
 
         deployer.deploy(app_spec_multiple_thrift_ports, SELECTOR, LABELS)
 
-        pytest.helpers.assert_any_call(post, SERVICES_URI, expected_service)
+        pytest.helpers.assert_any_call(post, SERVICES_URI, pytest.helpers.with_desired_state_hash(expected_service))
 
     def test_update_service(self, deployer, service_type, get, post, put, app_spec):
         mock_response = create_autospec(Response)
@@ -220,7 +220,7 @@ class TestServiceDeployer(object):
         deployer.deploy(app_spec, SELECTOR, LABELS)
 
         pytest.helpers.assert_no_calls(post)
-        pytest.helpers.assert_any_call(put, SERVICES_URI + "testapp", expected_service)
+        pytest.helpers.assert_any_call(put, SERVICES_URI + "testapp", pytest.helpers.with_desired_state_hash(expected_service))
 
     def test_dont_deploy_service_with_no_ports(self, deployer, post, delete, app_spec_no_ports):
         deployer.deploy(app_spec_no_ports, SELECTOR, LABELS)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from datetime import timedelta
+
+import mock
+import pytest
+import requests
+
+from fiaas_deploy_daemon.deployer import DeployerEvent
+from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
+from fiaas_deploy_daemon.log_extras import set_extras
+
+
+def _response(method, path, status_code=200, elapsed=0.25):
+    resp = mock.create_autospec(requests.Response, instance=True)
+    resp.request = requests.Request(method, "https://k8s.example.com" + path).prepare()
+    resp.status_code = status_code
+    resp.elapsed = timedelta(seconds=elapsed)
+    return resp
+
+
+@pytest.fixture
+def clock():
+    with mock.patch("fiaas_deploy_daemon.deployer.bookkeeper.time_monotonic") as time_monotonic:
+        time_monotonic.return_value = 100
+        yield time_monotonic
+
+
+@pytest.fixture
+def histograms():
+    names = ("queue_wait_histogram", "apply_histogram", "rollout_histogram", "end_to_end_histogram")
+    patchers = [mock.patch.object(Bookkeeper, name) for name in names]
+    yield dict(zip(names, (patcher.start() for patcher in patchers)))
+    for patcher in patchers:
+        patcher.stop()
+
+
+class TestBookkeeper(object):
+    @pytest.fixture
+    def bookkeeper(self):
+        return Bookkeeper()
+
+    @pytest.mark.parametrize("method,path,verb,kind", (
+            ("GET", "/api/v1/namespaces/default/services/app", "GET", "services"),
+            ("PUT", "/apis/apps/v1/namespaces/default/deployments/app", "PUT", "deployments"),
+            ("DELETE", "/apis/extensions/v1beta1/namespaces/default/ingresses/?labelSelector=app%3Dapp", "DELETE",
+             "ingresses"),
+            ("GET", "/api/v1/namespaces/default/resourcequotas", "GET", "resourcequotas"),
+            ("GET", "/apis/fiaas.schibsted.io/v1/application-statuses/?watch=true", "WATCH", "application-statuses"),
+            ("GET", "/version", "GET", "unknown"),
+    ))
+    def test_observes_api_calls_by_verb_kind_and_status(self, bookkeeper, method, path, verb, kind):
+        with mock.patch.object(Bookkeeper, "api_call_histogram") as histogram:
+            bookkeeper._record_api_call(_response(method, path, 201))
+
+        histogram.labels.assert_called_once_with(verb, kind, 201)
+        histogram.labels.return_value.observe.assert_called_once_with(0.25)
+
+    def test_tracks_api_calls_of_session_once(self, bookkeeper):
+        session = requests.Session()
+        bookkeeper.track_api_calls(session)
+        bookkeeper.track_api_calls(session)
+
+        assert session.hooks["response"] == [bookkeeper._record_api_call]
+
+    def test_trace_collects_phases_and_api_calls_of_the_deploy(self, bookkeeper, app_spec):
+        set_extras(app_spec)
+        with bookkeeper.trace(app_spec) as trace:
+            with bookkeeper.time_phase("service"):
+                bookkeeper._record_api_call(_response("GET", "/api/v1/namespaces/default/services/app", 404))
+                bookkeeper._record_api_call(_response("POST", "/api/v1/namespaces/default/services/"))
+        bookkeeper._record_api_call(_response("GET", "/api/v1/namespaces/default/services/app"))
+
+        summary = trace.summary()
+        assert summary.startswith("phases: service ")
+        assert "GET services 404 x1 0.250s" in summary
+        assert "POST services 200 x1 0.250s" in summary
+        assert "GET services 200" not in summary
+
+    def test_api_calls_of_other_deploys_are_not_traced(self, bookkeeper, app_spec):
+        set_extras(app_name="other", namespace=app_spec.namespace, deployment_id=app_spec.deployment_id)
+        with bookkeeper.trace(app_spec) as trace:
+            bookkeeper._record_api_call(_response("GET", "/api/v1/namespaces/default/services/other"))
+
+        assert trace.summary() == "phases: none; API calls: none"
+
+    def test_observes_each_stage_of_a_deploy(self, bookkeeper, app_spec, clock, histograms):
+        event = DeployerEvent("UPDATE", app_spec, None)
+        bookkeeper.queued(event)
+        clock.return_value = 102
+        bookkeeper.dequeued(event)
+        clock.return_value = 105
+        bookkeeper.applied(app_spec)
+        clock.return_value = 112
+        bookkeeper.success(app_spec)
+
+        histograms["queue_wait_histogram"].labels.assert_called_once_with("normal")
+        histograms["queue_wait_histogram"].labels.return_value.observe.assert_called_once_with(2)
+        histograms["apply_histogram"].observe.assert_called_once_with(3)
+        histograms["rollout_histogram"].labels.assert_called_once_with("success")
+        histograms["rollout_histogram"].labels.return_value.observe.assert_called_once_with(7)
+        histograms["end_to_end_histogram"].labels.assert_called_once_with("success")
+        histograms["end_to_end_histogram"].labels.return_value.observe.assert_called_once_with(12)
+
+    def test_failure_before_applied_has_no_rollout(self, bookkeeper, app_spec, clock, histograms):
+        event = DeployerEvent("UPDATE", app_spec, None)
+        bookkeeper.queued(event)
+        bookkeeper.dequeued(event)
+        clock.return_value = 110
+        bookkeeper.failed(app_spec)
+
+        histograms["rollout_histogram"].labels.assert_not_called()
+        histograms["end_to_end_histogram"].labels.assert_called_once_with("failed")
+        histograms["end_to_end_histogram"].labels.return_value.observe.assert_called_once_with(10)
+
+    def test_delete_is_forgotten_when_dequeued(self, bookkeeper, app_spec, clock, histograms):
+        event = DeployerEvent("DELETE", app_spec, None)
+        bookkeeper.queued(event)
+        bookkeeper.dequeued(event)
+        bookkeeper.failed(app_spec)
+
+        histograms["queue_wait_histogram"].labels.return_value.observe.assert_called_once_with(0)
+        assert bookkeeper._timelines == {}
+        histograms["end_to_end_histogram"].labels.assert_not_called()
+
+    def test_queue_wait_is_observed_by_priority(self, bookkeeper, app_spec, clock, histograms):
+        event = DeployerEvent("UPDATE", app_spec, None, "high")
+        bookkeeper.queued(event)
+        clock.return_value = 101
+        bookkeeper.dequeued(event)
+
+        histograms["queue_wait_histogram"].labels.assert_called_once_with("high")
+        histograms["queue_wait_histogram"].labels.return_value.observe.assert_called_once_with(1)
+
+    def test_coalesced_event_is_forgotten_but_not_its_replacement(self, bookkeeper, app_spec, clock, histograms):
+        first = DeployerEvent("UPDATE", app_spec, None)
+        other = DeployerEvent("UPDATE", app_spec._replace(name="other"), None)
+        latest = DeployerEvent("UPDATE", app_spec._replace(name="other"), None)
+        bookkeeper.queued(first)
+        bookkeeper.queued(other)
+        bookkeeper.queued(latest)
+
+        bookkeeper.coalesced(first)
+        bookkeeper.coalesced(other)
+
+        assert [timeline["event"] for timeline in bookkeeper._timelines.values()] == [latest]
+
+    def test_superseded_deploy_is_forgotten(self, bookkeeper, app_spec, clock, histograms):
+        event = DeployerEvent("UPDATE", app_spec, None)
+        bookkeeper.queued(event)
+        bookkeeper.superseded(app_spec)
+        bookkeeper.success(app_spec)
+
+        histograms["end_to_end_histogram"].labels.assert_not_called()
+
+    def test_dropped_deploy_is_forgotten(self, bookkeeper, app_spec, clock, histograms):
+        event = DeployerEvent("UPDATE", app_spec, None)
+        bookkeeper.queued(event)
+        bookkeeper.dequeued(event)
+        bookkeeper.dropped(app_spec)
+
+        assert bookkeeper._timelines == {}
@@ -14,19 +14,22 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from Queue import Queue
-
 import mock
 import pytest
+from monotonic import monotonic as time_monotonic
 
 from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.deadline import current_deadline, DeadlineExceeded
 from fiaas_deploy_daemon.deployer import DeployerEvent
 from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
-from fiaas_deploy_daemon.deployer.deploy import Deployer
+from fiaas_deploy_daemon.deployer.deploy import Deployer, DeployerPool
+from fiaas_deploy_daemon.deployer.deploy_queue import DeployQueue
 from fiaas_deploy_daemon.deployer.kubernetes.adapter import K8s
-from fiaas_deploy_daemon.deployer.kubernetes.ready_check import ReadyCheck
+from fiaas_deploy_daemon.deployer.kubernetes.ready_check import ReadyCheck, ReadinessTracker
 from fiaas_deploy_daemon.deployer.scheduler import Scheduler
+from fiaas_deploy_daemon.leader_election import LeaderElector, NoElection
 from fiaas_deploy_daemon.lifecycle import Lifecycle, Subject, STATUS_STARTED, STATUS_FAILED
+from fiaas_deploy_daemon.sharding import ShardManager, Unsharded
 from fiaas_deploy_daemon.specs.models import LabelAndAnnotationSpec
 
 
@@ -59,8 +62,26 @@ class TestDeploy(object):
         return Configuration([])
 
     @pytest.fixture
-    def deployer(self, app_spec, bookkeeper, adapter, scheduler, lifecycle, lifecycle_subject, config):
-        deployer = Deployer(Queue(), bookkeeper, adapter, scheduler, lifecycle, config)
+    def readiness_tracker(self):
+        return mock.create_autospec(ReadinessTracker, spec_set=True, instance=True)
+
+    @pytest.fixture
+    def shard_manager(self):
+        shard_manager = mock.create_autospec(ShardManager, spec_set=True, instance=True)
+        shard_manager.owns.return_value = True
+        return shard_manager
+
+    @pytest.fixture
+    def leader_elector(self):
+        leader_elector = mock.create_autospec(LeaderElector, spec_set=True, instance=True)
+        leader_elector.is_leader.return_value = True
+        return leader_elector
+
+    @pytest.fixture
+    def deployer(self, app_spec, bookkeeper, adapter, scheduler, lifecycle, lifecycle_subject, config,
+                 readiness_tracker, shard_manager, leader_elector):
+        deployer = Deployer(DeployQueue(config, lifecycle, bookkeeper), bookkeeper, adapter, scheduler, lifecycle, config,
+                            readiness_tracker, shard_manager, leader_elector)
         deployer._queue = [DeployerEvent("UPDATE", app_spec, lifecycle_subject)]
         return deployer
 
@@ -96,8 +117,150 @@ class TestDeploy(object):
         lifecycle.state_change_signal.send.assert_called_with(status=STATUS_FAILED, subject=lifecycle_subject)
 
     def test_schedules_ready_check(self, app_spec, scheduler, bookkeeper, deployer, lifecycle, lifecycle_subject,
-                                   config):
+                                   config, readiness_tracker, leader_elector):
         deployer()
 
         lifecycle.state_change_signal.send.assert_called_once_with(status=STATUS_STARTED, subject=lifecycle_subject)
-        scheduler.add.assert_called_with(ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config))
+        expected_check = ReadyCheck(app_spec, bookkeeper, lifecycle, lifecycle_subject, config, readiness_tracker,
+                                    leader_elector)
+        scheduler.add.assert_called_with(expected_check)
+        readiness_tracker.register.assert_called_once_with(expected_check)
+
+    def test_deploys_within_deadline(self, deployer, adapter, config):
+        deadlines = []
+        adapter.deploy.side_effect = lambda app_spec: deadlines.append(current_deadline())
+
+        deployer()
+
+        assert 0 < deadlines[0] - time_monotonic() <= config.deploy_timeout
+        assert current_deadline() is None
+
+    def test_signals_failure_when_deadline_is_exceeded(self, app_spec, lifecycle, lifecycle_subject, deployer,
+                                                       adapter, bookkeeper, scheduler):
+        adapter.deploy.side_effect = DeadlineExceeded("Deadline exceeded before GET /api/v1/services")
+
+        deployer()
+
+        lifecycle.state_change_signal.send.assert_called_with(status=STATUS_FAILED, subject=lifecycle_subject)
+        bookkeeper.failed.assert_called_once_with(app_spec)
+        scheduler.add.assert_not_called()
+
+    def test_marks_event_as_done(self, app_spec, lifecycle_subject, deployer, adapter):
+        deploy_queue = mock.create_autospec(DeployQueue, spec_set=True, instance=True)
+        deployer._deploy_queue = deploy_queue
+        event = DeployerEvent("UPDATE", app_spec, lifecycle_subject)
+        deployer._queue = [event]
+        adapter.deploy.side_effect = Exception("message")
+
+        deployer()
+
+        deploy_queue.task_done.assert_called_once_with(event)
+
+    def test_retired_worker_stops_after_current_event(self, app_spec, lifecycle_subject, deployer, adapter):
+        deployer._queue = [DeployerEvent("UPDATE", app_spec, lifecycle_subject)] * 2
+        adapter.deploy.side_effect = lambda app_spec: deployer.retire()
+
+        deployer()
+
+        adapter.deploy.assert_called_once_with(app_spec)
+
+    def test_drops_event_of_application_in_shard_no_longer_owned(self, app_spec, deployer, adapter, lifecycle,
+                                                                 bookkeeper, shard_manager):
+        shard_manager.owns.return_value = False
+
+        deployer()
+
+        shard_manager.owns.assert_called_with(app_spec.namespace, app_spec.name)
+        adapter.deploy.assert_not_called()
+        lifecycle.state_change_signal.send.assert_not_called()
+        bookkeeper.dropped.assert_called_once_with(app_spec)
+
+    def test_drops_delete_of_application_in_shard_no_longer_owned(self, app_spec, deployer, adapter, shard_manager):
+        shard_manager.owns.return_value = False
+        deployer._queue = [DeployerEvent("DELETE", app_spec, None)]
+
+        deployer()
+
+        adapter.delete.assert_not_called()
+
+    def test_does_not_deploy_when_shard_is_lost_before_deploying(self, deployer, adapter, scheduler, bookkeeper,
+                                                                 lifecycle, shard_manager):
+        shard_manager.owns.side_effect = [True, False]
+
+        deployer()
+
+        lifecycle.state_change_signal.send.assert_not_called()
+        adapter.deploy.assert_not_called()
+        scheduler.add.assert_not_called()
+        bookkeeper.failed.assert_not_called()
+
+    def test_drops_events_queued_before_leadership_was_lost(self, deployer, adapter, lifecycle, leader_elector):
+        leader_elector.is_leader.return_value = False
+
+        deployer()
+
+        adapter.deploy.assert_not_called()
+        lifecycle.state_change_signal.send.assert_not_called()
+
+    def test_does_not_signal_start_when_leadership_is_lost_before_deploying(self, deployer, adapter, lifecycle,
+                                                                            leader_elector):
+        leader_elector.is_leader.side_effect = [True, False]
+
+        deployer()
+
+        lifecycle.state_change_signal.send.assert_not_called()
+        adapter.deploy.assert_not_called()
+
+
+class TestDeployerPool(object):
+    @pytest.fixture
+    def bookkeeper(self):
+        return mock.create_autospec(Bookkeeper)
+
+    @pytest.fixture
+    def deploy_queue(self, bookkeeper):
+        return DeployQueue(Configuration([]), mock.create_autospec(Lifecycle), bookkeeper)
+
+    @pytest.fixture
+    def pool(self, deploy_queue, bookkeeper):
+        config = Configuration(["--deploy-workers", "3"])
+        return DeployerPool(deploy_queue, bookkeeper, mock.create_autospec(K8s), mock.create_autospec(Scheduler),
+                            mock.create_autospec(Lifecycle), config, mock.create_autospec(ReadinessTracker), Unsharded(),
+                            NoElection())
+
+    def test_creates_configured_number_of_workers(self, pool, bookkeeper, deploy_queue):
+        assert len(pool._workers) == 3
+        assert len({worker.name for worker in pool._workers}) == 3
+        bookkeeper.set_workers.assert_called_once_with(3)
+        bookkeeper.track_queue.assert_called_once_with(deploy_queue)
+
+    def test_is_alive_only_if_all_workers_are_alive(self, pool):
+        pool._workers = [mock.create_autospec(Deployer, instance=True) for _ in range(3)]
+        for worker in pool._workers:
+            worker.is_alive.return_value = True
+        assert pool.is_alive()
+
+        pool._workers[1].is_alive.return_value = False
+        assert not pool.is_alive()
+
+    def test_replace_starts_new_worker(self, pool):
+        stuck = pool.workers()[1]
+
+        with mock.patch.object(Deployer, "start") as start:
+            pool.replace(stuck)
+
+        workers = pool.workers()
+        assert stuck not in workers
+        assert workers[1].name == stuck.name
+        assert stuck._retired
+        start.assert_called_once_with()
+
+    def test_counts_replaced_workers_still_alive(self, pool):
+        stuck = pool.workers()[0]
+        with mock.patch.object(Deployer, "start"):
+            pool.replace(stuck)
+
+        with mock.patch.object(Deployer, "is_alive", return_value=True):
+            assert pool.replaced_alive() == 1
+        with mock.patch.object(Deployer, "is_alive", return_value=False):
+            assert pool.replaced_alive() == 0
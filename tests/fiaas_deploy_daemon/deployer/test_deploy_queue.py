@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+import mock
+import pytest
+
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.deployer import DeployerEvent
+from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
+from fiaas_deploy_daemon.deployer.deploy_queue import DeployQueue
+from fiaas_deploy_daemon.lifecycle import Lifecycle, Subject
+
+
+def _event(app_spec, name, namespace="default", deployment_id="1", action="UPDATE", priority="normal"):
+    app_spec = app_spec._replace(name=name, namespace=namespace, deployment_id=deployment_id)
+    subject = None
+    if action == "UPDATE":
+        subject = Subject(app_spec.uid, name, namespace, deployment_id, None, None, None)
+    return DeployerEvent(action, app_spec, subject, priority)
+
+
+class TestDeployQueue(object):
+    @pytest.fixture
+    def lifecycle(self):
+        return mock.create_autospec(Lifecycle, spec_set=True, instance=True)
+
+    @pytest.fixture
+    def bookkeeper(self):
+        return mock.create_autospec(Bookkeeper, spec_set=True, instance=True)
+
+    @pytest.fixture
+    def config(self):
+        return Configuration(["--namespace-weight", "heavy=2"])
+
+    @pytest.fixture
+    def deploy_queue(self, config, lifecycle, bookkeeper):
+        return DeployQueue(config, lifecycle, bookkeeper)
+
+    def test_hands_out_events_in_order(self, deploy_queue, app_spec):
+        events = [_event(app_spec, name) for name in ("a", "b", "c")]
+        for event in events:
+            deploy_queue.put(event)
+
+        assert deploy_queue.qsize() == 3
+        assert [deploy_queue.get() for _ in events] == events
+        assert deploy_queue.empty()
+
+    def test_same_application_in_other_namespace_is_independent(self, deploy_queue, app_spec):
+        first = _event(app_spec, "a", namespace="one")
+        second = _event(app_spec, "a", namespace="two")
+        deploy_queue.put(first)
+        deploy_queue.put(second)
+
+        assert deploy_queue.get() == first
+        assert deploy_queue.get() == second
+
+    def test_holds_back_events_for_application_in_progress(self, deploy_queue, app_spec):
+        first = _event(app_spec, "a", deployment_id="1")
+        second = _event(app_spec, "a", deployment_id="2")
+        other = _event(app_spec, "b")
+        deploy_queue.put(first)
+        assert deploy_queue.get() == first
+        deploy_queue.put(second)
+        deploy_queue.put(other)
+
+        assert deploy_queue.get() == other
+        assert deploy_queue.qsize() == 1
+
+        deploy_queue.task_done(first)
+        assert deploy_queue.get() == second
+
+    def test_get_blocks_until_application_is_done(self, deploy_queue, app_spec):
+        first = _event(app_spec, "a", deployment_id="1")
+        second = _event(app_spec, "a", deployment_id="2")
+        deploy_queue.put(first)
+        assert deploy_queue.get() == first
+        deploy_queue.put(second)
+
+        result = []
+        getter = threading.Thread(target=lambda: result.append(deploy_queue.get()))
+        getter.daemon = True
+        getter.start()
+        getter.join(0.1)
+        assert result == []
+
+        deploy_queue.task_done(first)
+        getter.join(5)
+        assert result == [second]
+
+    @pytest.mark.parametrize("action", ("UPDATE", "DELETE"))
+    def test_newer_event_replaces_waiting_event(self, deploy_queue, lifecycle, bookkeeper, app_spec, action):
+        first = _event(app_spec, "a", deployment_id="1")
+        other = _event(app_spec, "b")
+        latest = _event(app_spec, "a", deployment_id="2", action=action)
+        for event in (first, other, latest):
+            deploy_queue.put(event)
+
+        assert deploy_queue.qsize() == 2
+        assert deploy_queue.get() == latest
+        assert deploy_queue.get() == other
+        lifecycle.superseded.assert_called_once_with(first.lifecycle_subject)
+        bookkeeper.coalesced.assert_called_once_with(first)
+
+    def test_superseded_status_is_not_updated_by_put(self, deploy_queue, lifecycle, bookkeeper, app_spec):
+        first = _event(app_spec, "a", deployment_id="1")
+        latest = _event(app_spec, "a", deployment_id="2")
+        deploy_queue.put(first)
+        deploy_queue.put(latest)
+
+        lifecycle.superseded.assert_not_called()
+        assert deploy_queue.get() == latest
+        lifecycle.superseded.assert_called_once_with(first.lifecycle_subject)
+
+    def test_does_not_replace_event_in_progress(self, deploy_queue, lifecycle, app_spec):
+        first = _event(app_spec, "a", deployment_id="1")
+        second = _event(app_spec, "a", deployment_id="2")
+        deploy_queue.put(first)
+        assert deploy_queue.get() == first
+        deploy_queue.put(second)
+
+        deploy_queue.task_done(first)
+        assert deploy_queue.get() == second
+        lifecycle.superseded.assert_not_called()
+
+    def test_superseded_delete_has_no_subject(self, deploy_queue, lifecycle, bookkeeper, app_spec):
+        delete = _event(app_spec, "a", action="DELETE")
+        update = _event(app_spec, "a", deployment_id="2")
+        deploy_queue.put(delete)
+        deploy_queue.put(update)
+
+        assert deploy_queue.get() == update
+        bookkeeper.coalesced.assert_called_once_with(delete)
+        lifecycle.superseded.assert_not_called()
+
+    def test_namespaces_take_turns(self, deploy_queue, app_spec):
+        busy = [_event(app_spec, name, namespace="busy") for name in ("a", "b", "c")]
+        quiet = [_event(app_spec, name, namespace="quiet") for name in ("d", "e")]
+        for event in busy + quiet:
+            deploy_queue.put(event)
+
+        assert [deploy_queue.get() for _ in range(5)] == [busy[0], quiet[0], busy[1], quiet[1], busy[2]]
+
+    def test_namespace_takes_as_many_turns_as_its_weight(self, deploy_queue, app_spec):
+        heavy = [_event(app_spec, name, namespace="heavy") for name in ("a", "b", "c")]
+        light = [_event(app_spec, name, namespace="light") for name in ("d", "e")]
+        for event in heavy + light:
+            deploy_queue.put(event)
+
+        assert [deploy_queue.get() for _ in range(5)] == [heavy[0], heavy[1], light[0], heavy[2], light[1]]
+
+    def test_higher_priority_goes_first(self, deploy_queue, app_spec):
+        low = _event(app_spec, "a", priority="low")
+        normal = _event(app_spec, "b", namespace="other")
+        high = _event(app_spec, "c", priority="high")
+        for event in (low, normal, high):
+            deploy_queue.put(event)
+
+        assert [deploy_queue.get() for _ in range(3)] == [high, normal, low]
+
+    def test_newer_event_takes_its_own_priority(self, deploy_queue, app_spec):
+        first = _event(app_spec, "a", deployment_id="1")
+        other = _event(app_spec, "b")
+        hotfix = _event(app_spec, "a", deployment_id="2", priority="high")
+        for event in (first, other, hotfix):
+            deploy_queue.put(event)
+
+        assert deploy_queue.get() == hotfix
+        assert deploy_queue.get() == other
+        assert deploy_queue.empty()
+
+    def test_priority_of_event_waiting_for_application_in_progress(self, deploy_queue, app_spec):
+        first = _event(app_spec, "a", deployment_id="1")
+        second = _event(app_spec, "a", deployment_id="2", priority="high")
+        other = _event(app_spec, "b")
+        deploy_queue.put(first)
+        assert deploy_queue.get() == first
+        deploy_queue.put(second)
+        deploy_queue.put(other)
+
+        deploy_queue.task_done(first)
+        assert deploy_queue.get() == second
+        assert deploy_queue.get() == other
+
+    def test_reports_depth_of_each_namespace(self, deploy_queue, bookkeeper, app_spec):
+        deploy_queue.put(_event(app_spec, "a", namespace="one"))
+        deploy_queue.put(_event(app_spec, "b", namespace="one"))
+        deploy_queue.put(_event(app_spec, "a", namespace="one", deployment_id="2"))
+        deploy_queue.put(_event(app_spec, "c", namespace="two"))
+        deploy_queue.get()
+
+        assert bookkeeper.namespace_depth.call_args_list == [
+            mock.call("one", 1), mock.call("one", 2), mock.call("two", 1), mock.call("one", 1)]
+
+    def test_lag_counts_from_first_waiting_event(self, config, lifecycle, bookkeeper, app_spec):
+        now = [100]
+        deploy_queue = DeployQueue(config, lifecycle, bookkeeper, time_func=lambda: now[0])
+        assert deploy_queue.lag() == 0
+
+        deploy_queue.put(_event(app_spec, "a", deployment_id="1"))
+        now[0] = 110
+        deploy_queue.put(_event(app_spec, "b"))
+        deploy_queue.put(_event(app_spec, "a", deployment_id="2"))
+        now[0] = 130
+        assert deploy_queue.lag() == 30
+
+        deploy_queue.get()
+        assert deploy_queue.lag() == 20
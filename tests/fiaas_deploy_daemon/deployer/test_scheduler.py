@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+import mock
+import pytest
+
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.deployer.scheduler import Scheduler, RESCHEDULE_DELAY
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestScheduler(object):
+    @pytest.fixture
+    def time_func(self):
+        return FakeTime()
+
+    @pytest.fixture
+    def scheduler(self, time_func):
+        return Scheduler(Configuration([]), time_func=time_func)
+
+    def test_runs_due_tasks_in_order(self, scheduler, time_func):
+        tasks = [mock.Mock(name="task{}".format(i), return_value=False) for i in range(3)]
+        scheduler.add(tasks[2], delay=3)
+        scheduler.add(tasks[0], delay=1)
+        scheduler.add(tasks[1], delay=1)
+        time_func.now += 2
+
+        due = scheduler._wait_for_due_tasks()
+
+        assert [task for _, task in due] == tasks[:2]
+
+    def test_reschedules_task_asking_for_it(self, scheduler, time_func):
+        task = mock.Mock(return_value=True)
+        scheduler.add(task, delay=0)
+
+        for execute_at, due_task in scheduler._wait_for_due_tasks():
+            scheduler._run(execute_at, due_task)
+
+        task.assert_called_once_with()
+        assert scheduler._tasks[0][0] == time_func.now + RESCHEDULE_DELAY
+
+    def test_reschedules_task_which_fails(self, scheduler, time_func):
+        task = mock.Mock(side_effect=Exception("message"))
+        scheduler.add(task, delay=0)
+
+        for execute_at, due_task in scheduler._wait_for_due_tasks():
+            scheduler._run(execute_at, due_task)
+
+        task.assert_called_once_with()
+        assert scheduler._tasks[0][0] == time_func.now + RESCHEDULE_DELAY
+
+    def test_sleeps_once_until_next_task_is_due(self, scheduler, time_func):
+        task = mock.Mock()
+        scheduler.add(task, delay=5)
+
+        def _select(read, write, error, timeout):
+            time_func.now += timeout
+            return [], [], []
+
+        with mock.patch("select.select", side_effect=_select) as select:
+            due = scheduler._wait_for_due_tasks()
+
+        select.assert_called_once_with(mock.ANY, [], [], 5)
+        assert [due_task for _, due_task in due] == [task]
+
+    def test_adding_task_wakes_up_waiting_scheduler(self, scheduler):
+        due = []
+        waiter = threading.Thread(target=lambda: due.extend(scheduler._wait_for_due_tasks()))
+        waiter.daemon = True
+        waiter.start()
+        waiter.join(0.1)
+        assert due == []
+
+        task = mock.Mock()
+        scheduler.add(task, delay=0)
+        waiter.join(5)
+
+        assert [due_task for _, due_task in due] == [task]
+
+    def test_runs_tasks_on_executor_when_configured(self, time_func):
+        scheduler = Scheduler(Configuration(["--scheduler-workers", "2"]), time_func=time_func)
+        assert scheduler._executor is not None
+        done = threading.Event()
+        scheduler.add(lambda: done.set(), delay=0)
+
+        scheduler.start()
+
+        assert done.wait(5)
@@ -70,6 +70,60 @@ class TestConfig(object):
         assert config.enable_deprecated_multi_namespace_support is False
         assert config.enable_deprecated_tls_entry_per_host is False
         assert config.disable_deprecated_managed_env_vars is False
+        assert config.deploy_workers == 4
+        assert config.scheduler_workers == 1
+        assert config.api_connect_timeout == 5
+        assert config.api_read_timeout == 20
+        assert config.api_watch_timeout == 300
+        assert config.deploy_timeout == 300
+        assert config.stuck_deploy_timeout == 600
+        assert config.stuck_watch_timeout == 900
+        assert config.max_deploy_queue_lag == 1800
+        assert config.status_log_lines == 500
+        assert config.status_log_bytes == 16 * 1024 * 1024
+        assert config.status_log_ttl == 6 * 60 * 60
+        assert config.usage_reporting_batch_size == 1
+        assert config.usage_reporting_workers == 2
+        assert config.usage_reporting_spool_dir is None
+        assert config.usage_reporting_overflow == "block"
+        assert config.api_list_page_size == 500
+        assert config.shards == 0
+        assert config.shard_lease_duration == 15
+        assert config.replica_id is None
+        assert config.leader_election is False
+        assert config.leader_lease_duration == 15
+        assert config.namespace_weights == {}
+        assert config.lifecycle_queue_size == 1000
+
+    @pytest.mark.parametrize("arg", ["--deploy-workers", "--scheduler-workers"])
+    @pytest.mark.parametrize("value", ["0", "-1"])
+    def test_invalid_worker_count(self, arg, value):
+        with pytest.raises(SystemExit):
+            Configuration([arg, value])
+
+    def test_namespace_weights(self):
+        config = Configuration(["--namespace-weight", "one=3", "--namespace-weight", "two=1"])
+        assert config.namespace_weights == {"one": 3, "two": 1}
+
+    @pytest.mark.parametrize("value", ["one", "one=0", "one=x"])
+    def test_invalid_namespace_weight(self, value):
+        with pytest.raises(SystemExit):
+            Configuration(["--namespace-weight", value])
+
+    def test_leader_election_excludes_shards(self):
+        with pytest.raises(SystemExit):
+            Configuration(["--leader-election", "--shards", "4"])
+
+    @pytest.mark.parametrize("arg", ["--api-connect-timeout", "--api-read-timeout"])
+    @pytest.mark.parametrize("value", ["0", "-0.5"])
+    def test_invalid_api_timeout(self, arg, value):
+        with pytest.raises(SystemExit):
+            Configuration([arg, value])
+
+    def test_fractional_api_timeout(self):
+        config = Configuration(["--api-connect-timeout", "0.5"])
+
+        assert config.api_connect_timeout == 0.5
 
     @pytest.mark.parametrize("arg,key", [
         ("--api-server", "api_server"),
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import socket
+
+import pytest
+import requests
+from monotonic import monotonic as time_monotonic
+from requests.exceptions import ReadTimeout
+
+from fiaas_deploy_daemon.deadline import deadline, current_deadline, DeadlineExceeded, install, timeout_counter
+
+
+@pytest.fixture
+def unresponsive_server():
+    """A server that accepts connections, but never responds"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(5)
+    yield "http://127.0.0.1:{}".format(sock.getsockname()[1])
+    sock.close()
+
+
+@pytest.fixture
+def session():
+    session = requests.Session()
+    install(session, 1, 0.2)
+    return session
+
+
+def _timeouts(kind):
+    return timeout_counter.labels(kind)._value.get()
+
+
+class TestDeadline(object):
+    def test_no_deadline(self):
+        assert current_deadline() is None
+
+    def test_deadline_in_seconds(self):
+        with deadline(10) as expires:
+            assert current_deadline() == expires
+            assert 9 < expires - time_monotonic() <= 10
+        assert current_deadline() is None
+
+    def test_inner_deadline_can_only_shorten(self):
+        with deadline(10) as outer:
+            with deadline(20) as inner:
+                assert inner == outer
+            with deadline(5) as inner:
+                assert inner < outer
+                assert current_deadline() == inner
+            assert current_deadline() == outer
+
+    def test_expires_is_kept(self):
+        expires = time_monotonic() + 10
+
+        with deadline(expires=expires):
+            assert current_deadline() == expires
+
+    def test_without_deadline_current_is_kept(self):
+        with deadline(10) as outer:
+            with deadline(expires=None) as inner:
+                assert inner == outer
+
+
+class TestTimeoutAdapter(object):
+    def test_read_timeout(self, session, unresponsive_server):
+        before = _timeouts("deployments")
+
+        with pytest.raises(ReadTimeout):
+            session.get(unresponsive_server + "/apis/apps/v1/namespaces/default/deployments/app", timeout=20)
+
+        assert _timeouts("deployments") == before + 1
+
+    def test_deadline_shortens_read_timeout(self, unresponsive_server):
+        session = requests.Session()
+        install(session, 1, 20)
+        start = time_monotonic()
+
+        with deadline(0.2), pytest.raises(ReadTimeout):
+            session.get(unresponsive_server + "/api/v1/namespaces/default/services/app")
+
+        assert time_monotonic() - start < 5
+
+    def test_request_after_deadline_is_not_sent(self, session, unresponsive_server):
+        before = _timeouts("services")
+
+        with deadline(-1), pytest.raises(DeadlineExceeded):
+            session.get(unresponsive_server + "/api/v1/namespaces/default/services/app")
+
+        assert _timeouts("services") == before + 1
@@ -17,8 +17,12 @@ import pytest
 
 from fiaas_deploy_daemon import HealthCheck
 from fiaas_deploy_daemon.base_thread import DaemonThread
+from fiaas_deploy_daemon.leader_election import LeaderElector
+from fiaas_deploy_daemon.watchdog import Watchdog
 
-THREADS = ["deployer", "scheduler", "crd_watcher", "usage_reporter"]
+THREADS = ["deployer", "scheduler", "resource_cache", "quota_cache", "crd_watcher", "status_index", "status_writer",
+           "status_cleaner", "usage_reporter", "shard_manager", "leader_elector",
+           "watchdog"]
 
 
 def _create_mock(failing):
@@ -27,25 +31,56 @@ def _create_mock(failing):
     return m
 
 
+def _create_watchdog(failing):
+    m = mock.create_autospec(Watchdog, instance=True)
+    m.is_alive.return_value = not failing
+    m.is_healthy.return_value = True
+    return m
+
+
+def _create_leader_elector(failing):
+    m = mock.create_autospec(LeaderElector, instance=True)
+    m.is_alive.return_value = not failing
+    m.is_healthy.return_value = True
+    return m
+
+
+def _create_threads(failing):
+    special = {"watchdog": _create_watchdog, "leader_elector": _create_leader_elector}
+    return [special.get(name, _create_mock)(failing(name)) for name in THREADS]
+
+
 class TestHealthCheck(object):
     @pytest.mark.parametrize("fails", THREADS)
     def test_one_thread_fails(self, fails):
-        threads = (_create_mock(name == fails) for name in THREADS)
+        threads = _create_threads(lambda name: name == fails)
         health_check = HealthCheck(*threads)
         assert not health_check.is_healthy()
 
     @pytest.mark.parametrize("lives", THREADS)
     def test_one_thread_lives(self, lives):
-        threads = (_create_mock(name != lives) for name in THREADS)
+        threads = _create_threads(lambda name: name != lives)
         health_check = HealthCheck(*threads)
         assert not health_check.is_healthy()
 
     def test_all_threads_fail(self):
-        threads = (_create_mock(True) for _ in THREADS)
+        threads = _create_threads(lambda name: True)
         health_check = HealthCheck(*threads)
         assert not health_check.is_healthy()
 
     def test_all_threads_live(self):
-        threads = (_create_mock(False) for _ in THREADS)
+        threads = _create_threads(lambda name: False)
         health_check = HealthCheck(*threads)
         assert health_check.is_healthy()
+
+    def test_deposed_leader_fails(self):
+        threads = _create_threads(lambda name: False)
+        threads[THREADS.index("leader_elector")].is_healthy.return_value = False
+        health_check = HealthCheck(*threads)
+        assert not health_check.is_healthy()
+
+    def test_unhealthy_watchdog_fails(self):
+        threads = _create_threads(lambda name: False)
+        threads[-1].is_healthy.return_value = False
+        health_check = HealthCheck(*threads)
+        assert not health_check.is_healthy()
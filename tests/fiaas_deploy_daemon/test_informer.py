@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+
+import mock
+import pytest
+from k8s import config
+from k8s.base import Equality
+from k8s.client import ClientError
+from k8s.models.deployment import Deployment
+
+from fiaas_deploy_daemon.informer import Informer, list_resources, iter_resources, watch_resources, \
+    ResourceVersionExpired, WATCH_READ_GRACE, DEFAULT_PAGE_SIZE
+
+NAMESPACED_URL = "/apis/apps/v1/namespaces/default/deployments/"
+
+
+def _deployment(name, resource_version, namespace="default"):
+    return {
+        "metadata": {"name": name, "namespace": namespace, "resourceVersion": resource_version},
+        "spec": {"replicas": 1},
+    }
+
+
+def _list_response(resource_version, *items, **kwargs):
+    resp = mock.MagicMock()
+    metadata = {"resourceVersion": resource_version}
+    if kwargs.get("continue_token"):
+        metadata["continue"] = kwargs["continue_token"]
+    resp.json.return_value = {"metadata": metadata, "items": list(items)}
+    return resp
+
+
+def _watch_response(*events):
+    resp = mock.MagicMock()
+    resp.iter_lines.return_value = [json.dumps(e) if isinstance(e, dict) else e for e in events]
+    return resp
+
+
+class TestListAndWatch(object):
+    def test_list_returns_items_and_resource_version(self, get):
+        get.side_effect = None
+        get.return_value = _list_response("10", _deployment("one", "5"), _deployment("two", "7"))
+
+        items, resource_version = list_resources(Deployment, "default", {"app": Equality("one")})
+
+        assert [d.metadata.name for d in items] == ["one", "two"]
+        assert resource_version == "10"
+        get.assert_called_once_with(NAMESPACED_URL, params={"labelSelector": "app=one", "limit": DEFAULT_PAGE_SIZE})
+
+    def test_list_in_all_namespaces(self, get):
+        get.side_effect = None
+        get.return_value = _list_response("10")
+
+        list_resources(Deployment)
+
+        get.assert_called_once_with(Deployment._meta.list_url, params={"limit": DEFAULT_PAGE_SIZE})
+
+    def test_list_fetches_all_pages(self, get):
+        get.side_effect = [_list_response("10", _deployment("one", "5"), continue_token="next"),
+                           _list_response("10", _deployment("two", "7"))]
+
+        items, resource_version = list_resources(Deployment, "default", page_size=1)
+
+        assert [d.metadata.name for d in items] == ["one", "two"]
+        assert resource_version == "10"
+        assert get.call_args_list == [mock.call(NAMESPACED_URL, params={"limit": 1}),
+                                      mock.call(NAMESPACED_URL, params={"limit": 1, "continue": "next"})]
+
+    def test_iter_resources_fetches_next_page_when_needed(self, get):
+        get.side_effect = [_list_response("10", _deployment("one", "5"), continue_token="next"),
+                           _list_response("10", _deployment("two", "7"))]
+
+        resources = iter_resources(Deployment, "default", page_size=1)
+
+        assert next(resources).metadata.name == "one"
+        assert get.call_count == 1
+        assert next(resources).metadata.name == "two"
+        assert get.call_count == 2
+
+    def test_list_raises_when_continue_token_has_expired(self, get):
+        get.side_effect = [_list_response("10", _deployment("one", "5"), continue_token="next"),
+                           ClientError("Gone", response=mock.MagicMock(status_code=410))]
+
+        with pytest.raises(ResourceVersionExpired):
+            list_resources(Deployment, "default", page_size=1)
+
+    def test_watch_resumes_from_resource_version(self, get):
+        get.side_effect = None
+        get.return_value = _watch_response({"type": "MODIFIED", "object": _deployment("one", "11")}, "")
+
+        events = list(watch_resources(Deployment, "default", resource_version="10"))
+
+        assert [(e.type, e.object.metadata.resourceVersion) for e in events] == [("MODIFIED", "11")]
+        get.assert_called_once_with(NAMESPACED_URL, params={"watch": "true", "resourceVersion": "10",
+                                                            "timeoutSeconds": config.stream_timeout},
+                                    stream=True, timeout=config.stream_timeout + WATCH_READ_GRACE)
+
+    def test_watch_raises_on_expired_resource_version_event(self, get):
+        get.side_effect = None
+        get.return_value = _watch_response({"type": "ERROR", "object": {"code": 410, "message": "too old"}})
+
+        with pytest.raises(ResourceVersionExpired):
+            list(watch_resources(Deployment, "default", resource_version="1"))
+
+    def test_watch_raises_on_gone_response(self, get):
+        response = mock.MagicMock(status_code=410)
+        get.side_effect = ClientError("Gone", response=response)
+
+        with pytest.raises(ResourceVersionExpired):
+            list(watch_resources(Deployment, "default", resource_version="1"))
+
+    def test_watch_ends_on_other_errors(self, get):
+        get.side_effect = None
+        get.return_value = _watch_response({"type": "ERROR", "object": {"code": 500}},
+                                           {"type": "ADDED", "object": _deployment("one", "11")})
+
+        assert list(watch_resources(Deployment, "default")) == []
+
+
+class TestInformer(object):
+    @pytest.fixture
+    def handler(self):
+        return mock.MagicMock()
+
+    @pytest.fixture
+    def informer(self, handler):
+        informer = Informer(Deployment, "default")
+        informer.add_handler(handler)
+        return informer
+
+    def test_keeps_local_copy_up_to_date(self, get, informer, handler):
+        get.side_effect = [
+            _list_response("10", _deployment("one", "5"), _deployment("two", "7")),
+            _watch_response({"type": "MODIFIED", "object": _deployment("one", "11")},
+                            {"type": "DELETED", "object": _deployment("two", "12")}),
+        ]
+
+        assert not informer.has_synced()
+        informer._relist()
+        informer._watch()
+
+        assert informer.has_synced()
+        assert informer.get("default", "one").metadata.resourceVersion == "11"
+        assert informer.get("default", "two") is None
+        assert informer._resource_version == "12"
+        assert [(c[0][0], c[0][1].metadata.name) for c in handler.call_args_list] == [
+            ("ADDED", "one"), ("ADDED", "two"), ("MODIFIED", "one"), ("DELETED", "two")
+        ]
+
+    def test_relist_reports_changes_since_last_list(self, get, informer, handler):
+        get.side_effect = [
+            _list_response("10", _deployment("one", "5"), _deployment("two", "7")),
+            _list_response("20", _deployment("one", "5"), _deployment("two", "15"), _deployment("three", "16")),
+        ]
+        informer._relist()
+        handler.reset_mock()
+
+        informer._relist()
+
+        assert sorted((c[0][0], c[0][1].metadata.name) for c in handler.call_args_list) == [
+            ("ADDED", "three"), ("MODIFIED", "two")
+        ]
+
+    def test_relist_reports_deleted(self, get, informer, handler):
+        get.side_effect = [
+            _list_response("10", _deployment("one", "5")),
+            _list_response("20"),
+        ]
+        informer._relist()
+        handler.reset_mock()
+
+        informer._relist()
+
+        handler.assert_called_once_with("DELETED", mock.ANY)
+        assert informer.get("default", "one") is None
+
+    def test_handler_errors_do_not_stop_updates(self, get, informer, handler):
+        handler.side_effect = Exception("handler failed")
+        get.side_effect = [_list_response("10", _deployment("one", "5"))]
+
+        informer._relist()
+
+        assert informer.get("default", "one") is not None
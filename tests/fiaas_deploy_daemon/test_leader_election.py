@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+from k8s import config
+
+from benchmark.fake_api_server import FakeApiServer
+from fiaas_deploy_daemon.leader_election import LeaderElector, LEADER_LEASE
+from fiaas_deploy_daemon.leases import Lease
+
+DURATION = 15
+
+
+class _Config(object):
+    def __init__(self, replica_id):
+        self.namespace = "default"
+        self.leader_lease_duration = DURATION
+        self.replica_id = replica_id
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    server = FakeApiServer()
+    server.start()
+    monkeypatch.setattr(config, "api_server", server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def clock():
+    return [0]
+
+
+def _elector(replica_id, clock):
+    return LeaderElector(_Config(replica_id), time_func=lambda: clock[0])
+
+
+def _sync(*electors):
+    for elector in electors:
+        elector.sync()
+        elector.check()
+
+
+class TestLeaderElector(object):
+    def test_first_replica_is_elected(self, api_server, clock):
+        a, b = _elector("a", clock), _elector("b", clock)
+        listener = mock.Mock()
+        a.add_listener(listener)
+
+        _sync(a, b)
+
+        assert a.is_leader()
+        assert a.role() == "leader"
+        listener.assert_called_once_with()
+        assert not b.is_leader()
+        assert b.role() == "standby"
+        assert b.is_healthy()
+        assert Lease.get(LEADER_LEASE, "default").spec.holderIdentity == "a"
+
+    def test_leader_keeps_leading_while_renewing(self, api_server, clock):
+        a, b = _elector("a", clock), _elector("b", clock)
+        for _ in range(5):
+            _sync(a, b)
+            clock[0] += DURATION / 3
+
+        assert a.is_leader()
+        assert not b.is_leader()
+
+    def test_leader_stops_leading_before_lease_expires(self, api_server, clock):
+        a = _elector("a", clock)
+        _sync(a)
+
+        clock[0] += DURATION * 2 / 3
+
+        assert not a.is_leader()
+
+    def test_standby_takes_over_when_lease_expires(self, api_server, clock):
+        a, b = _elector("a", clock), _elector("b", clock)
+        listener = mock.Mock()
+        b.add_listener(listener)
+        _sync(a, b)
+
+        clock[0] += DURATION + 1
+        _sync(b)
+        a.check()
+
+        assert b.is_leader()
+        listener.assert_called_once_with()
+        assert not a.is_leader()
+        assert not a.is_healthy()
+        assert Lease.get(LEADER_LEASE, "default").spec.holderIdentity == "b"
+
+    def test_standby_takes_over_when_leader_resigns(self, api_server, clock):
+        a, b = _elector("a", clock), _elector("b", clock)
+        _sync(a, b)
+
+        a.resign()
+        _sync(b)
+
+        assert b.is_leader()
+        assert not a.is_leader()
+
+    def test_leader_that_can_not_renew_stops_leading(self, api_server, clock):
+        a = _elector("a", clock)
+        _sync(a)
+
+        with mock.patch("fiaas_deploy_daemon.leader_election.leases.Lease.get", side_effect=IOError):
+            clock[0] += DURATION / 3
+            with pytest.raises(IOError):
+                a.sync()
+            a.check()
+            assert a.is_leader()
+
+            clock[0] += DURATION / 3
+            a.check()
+            assert not a.is_leader()
+            assert not a.is_healthy()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+import mock
+import pytest
+from blinker import Namespace
+
+from fiaas_deploy_daemon.lifecycle import Lifecycle, Subscription, subscribe, Subject, OVERFLOW_BLOCK, \
+    OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE, STATUS_INITIATED, STATUS_STARTED, STATUS_SUCCESS
+
+
+def _subject(name="app", deployment_id="1"):
+    return Subject("uid", name, "default", deployment_id, None, None, None)
+
+
+def _key(subject):
+    return subject.app_name
+
+
+class TestSubscription(object):
+    @pytest.fixture
+    def handler(self):
+        return mock.MagicMock()
+
+    @pytest.fixture
+    def signal(self, monkeypatch):
+        s = Namespace().signal
+        monkeypatch.setattr("fiaas_deploy_daemon.lifecycle.signal", s)
+        monkeypatch.setattr(Lifecycle, "state_change_signal", s("deploy_status_changed"))
+        yield s
+
+    def test_lifecycle_changes_are_handled_in_subscription_thread(self, signal, handler):
+        subscription = subscribe("Test", handler, 10)
+        subject = Lifecycle().initiate("uid", "app", "default", "1")
+
+        subscription.flush()
+
+        handler.assert_called_once_with(None, status=STATUS_INITIATED, subject=subject)
+
+    def test_handled_in_order(self, handler):
+        subscription = Subscription("Test", handler, 10)
+        subscription.put(None, STATUS_STARTED, _subject("a"))
+        subscription.put(None, STATUS_STARTED, _subject("b"))
+
+        subscription._process()
+        subscription._process()
+
+        assert handler.call_args_list == [mock.call(None, status=STATUS_STARTED, subject=_subject("a")),
+                                          mock.call(None, status=STATUS_STARTED, subject=_subject("b"))]
+
+    def test_drop_oldest_when_full(self, handler):
+        subscription = Subscription("Test", handler, 2, OVERFLOW_DROP_OLDEST)
+        for name in ("a", "b", "c"):
+            subscription.put(None, STATUS_STARTED, _subject(name))
+
+        subscription._process()
+        subscription._process()
+
+        assert [c[1]["subject"].app_name for c in handler.call_args_list] == ["b", "c"]
+
+    def test_coalesce_replaces_queued_change_in_place(self, handler):
+        subscription = Subscription("Test", handler, 10, OVERFLOW_COALESCE, key=_key)
+        subscription.put(None, STATUS_STARTED, _subject("a"))
+        subscription.put(None, STATUS_STARTED, _subject("b"))
+        subscription.put(None, STATUS_SUCCESS, _subject("a"))
+
+        subscription._process()
+        subscription._process()
+
+        assert handler.call_args_list == [mock.call(None, status=STATUS_SUCCESS, subject=_subject("a")),
+                                          mock.call(None, status=STATUS_STARTED, subject=_subject("b"))]
+        assert not subscription._queue
+
+    def test_block_waits_for_room(self, handler):
+        subscription = Subscription("Test", handler, 1, OVERFLOW_BLOCK)
+        subscription.put(None, STATUS_STARTED, _subject("a"))
+        producer = threading.Thread(target=subscription.put, args=(None, STATUS_STARTED, _subject("b")))
+        producer.daemon = True
+        producer.start()
+        producer.join(0.1)
+        assert producer.is_alive()
+
+        subscription._process()
+        producer.join(1)
+
+        assert not producer.is_alive()
+        assert len(subscription._queue) == 1
+
+    def test_handler_errors_are_logged(self, handler):
+        handler.side_effect = [Exception("boom"), None]
+        subscription = Subscription("Test", handler, 10)
+        subscription.put(None, STATUS_STARTED, _subject("a"))
+        subscription.put(None, STATUS_STARTED, _subject("b"))
+
+        subscription._process()
+        subscription._process()
+
+        assert handler.call_count == 2
+
+    @pytest.mark.parametrize("overflow,key", (("unknown", None), (OVERFLOW_COALESCE, None)))
+    def test_invalid_overflow(self, handler, overflow, key):
+        with pytest.raises(ValueError):
+            Subscription("Test", handler, 10, overflow, key)
@@ -18,7 +18,8 @@ import logging
 
 import pytest
 
-from fiaas_deploy_daemon.log_extras import StatusHandler, set_extras, get_final_logs
+from fiaas_deploy_daemon.log_extras import StatusHandler, set_extras, get_final_logs, get_running_logs, LogStore, \
+    append_log
 
 TEST_MESSAGE = "This is a test log message"
 
@@ -54,3 +55,62 @@ class TestLogExtras(object):
     def test_require_all_three_fields(self, spec, name, namespace, deployment_id):
         with pytest.raises(TypeError):
             set_extras(app_spec=spec, app_name=name, namespace=namespace, deployment_id=deployment_id)
+
+    def test_record_without_extras_is_not_stored(self):
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, TEST_MESSAGE, None, None)
+        record.extras = {"app_name": "", "namespace": "", "deployment_id": ""}
+
+        append_log(record, TEST_MESSAGE)
+
+        assert get_running_logs("", "", "") == []
+
+
+class TestLogStore(object):
+    @pytest.fixture
+    def clock(self):
+        return [100]
+
+    @pytest.fixture
+    def store(self, clock):
+        return LogStore(max_lines=3, max_bytes=20, ttl=60, time_func=lambda: clock[0])
+
+    def test_keeps_latest_lines_of_each_deployment(self, store):
+        for i in range(5):
+            store.append("a", u"line {}".format(i))
+
+        assert store.get("a") == [u"line 2", u"line 3", u"line 4"]
+        assert store.size() == 18
+
+    def test_pop_forgets_deployment(self, store):
+        store.append("a", u"line")
+
+        assert store.pop("a") == [u"line"]
+        assert store.get("a") == []
+        assert store.size() == 0
+
+    def test_evicts_least_recently_logged_to_when_over_budget(self, store):
+        store.append("a", u"aaaaaa")
+        store.append("b", u"bbbbbb")
+        store.append("a", u"aaaaaa")
+        store.append("c", u"cccccc")
+
+        assert store.get("b") == []
+        assert store.get("a") == [u"aaaaaa", u"aaaaaa"]
+        assert store.get("c") == [u"cccccc"]
+        assert store.size() == 18
+
+    def test_counts_bytes_of_encoded_messages(self, store):
+        store.append("a", u"\xe6\xf8\xe5")
+
+        assert store.size() == 6
+
+    def test_expires_deployments_not_logged_to(self, store, clock):
+        store.append("a", u"a")
+        clock[0] = 130
+        store.append("b", u"b")
+        clock[0] = 170
+        store.append("c", u"c")
+
+        assert store.get("a") == []
+        assert store.get("b") == [u"b"]
+        assert store.size() == 2
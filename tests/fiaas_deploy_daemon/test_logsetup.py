@@ -92,3 +92,6 @@ class _FakeConfig(object):
     def __init__(self, log_format="plain", debug=False):
         self.log_format = log_format
         self.debug = debug
+        self.status_log_lines = 500
+        self.status_log_bytes = 1024
+        self.status_log_ttl = 60
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+from k8s import config
+
+from benchmark.fake_api_server import FakeApiServer
+from fiaas_deploy_daemon.leases import Lease
+from fiaas_deploy_daemon.sharding import ShardManager, shard_of
+
+SHARDS = 4
+DURATION = 15
+APPS = ["app-{}".format(i) for i in range(20)]
+
+
+class _Config(object):
+    def __init__(self, replica_id, shards=SHARDS):
+        self.namespace = "default"
+        self.shards = shards
+        self.shard_lease_duration = DURATION
+        self.replica_id = replica_id
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    server = FakeApiServer()
+    server.start()
+    monkeypatch.setattr(config, "api_server", server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def clock():
+    return [0]
+
+
+def _manager(replica_id, clock, shards=SHARDS):
+    return ShardManager(_Config(replica_id, shards), time_func=lambda: clock[0])
+
+
+def _owners(managers, app):
+    return [m for m in managers if m.owns("default", app)]
+
+
+class TestShardManager(object):
+    def test_single_replica_owns_all_shards(self, api_server, clock):
+        manager = _manager("a", clock)
+
+        manager.sync()
+
+        assert manager.owned_shards() == list(range(SHARDS))
+        assert all(manager.owns("default", app) for app in APPS)
+        assert manager.describe()["holders"] == {shard: "a" for shard in range(SHARDS)}
+        assert Lease.get("fiaas-deploy-daemon-shard-0", "default").spec.holderIdentity == "a"
+
+    def test_new_replica_gets_its_share(self, api_server, clock):
+        a, b = _manager("a", clock), _manager("b", clock)
+        a.sync()
+        b.sync()
+        assert b.owned_shards() == []
+
+        a.sync()
+        b.sync()
+
+        assert a.owned_shards() == [0, 1]
+        assert b.owned_shards() == [2, 3]
+        assert all(len(_owners([a, b], app)) == 1 for app in APPS)
+        assert b.describe()["replicas"] == ["a", "b"]
+
+    def test_every_replica_gets_a_shard_when_shards_do_not_divide_evenly(self, api_server, clock):
+        managers = [_manager(replica_id, clock, shards=8) for replica_id in "abcde"]
+        for _ in range(3):
+            for manager in managers:
+                manager.sync()
+
+        assert [len(manager.owned_shards()) for manager in managers] == [2, 2, 2, 1, 1]
+        assert all(len(_owners(managers, app)) == 1 for app in APPS)
+
+    def test_shards_of_dead_replica_are_taken_over(self, api_server, clock):
+        a, b = _manager("a", clock), _manager("b", clock)
+        for manager in (a, b, a, b):
+            manager.sync()
+        listener = mock.Mock()
+        a.add_listener(listener)
+
+        # The first time a sees the last renewal of b, it gives b a full lease duration to renew again
+        for _ in range(5):
+            clock[0] += DURATION // 3
+            a.sync()
+        assert b.owned_shards() == []
+
+        assert a.owned_shards() == list(range(SHARDS))
+        listener.assert_called_once_with({2, 3})
+        assert a.describe()["replicas"] == ["a"]
+
+    def test_shard_is_not_owned_when_renewal_fails(self, api_server, clock):
+        manager = _manager("a", clock)
+        manager.sync()
+
+        clock[0] += DURATION
+        with mock.patch("fiaas_deploy_daemon.sharding.list_resources", side_effect=IOError("unreachable")):
+            with pytest.raises(IOError):
+                manager.sync()
+
+        assert manager.owned_shards() == []
+
+
+def test_shard_of_is_stable():
+    assert shard_of("default", "app", SHARDS) == shard_of("default", "app", SHARDS)
+    assert {shard_of("default", app, SHARDS) for app in APPS} == set(range(SHARDS))
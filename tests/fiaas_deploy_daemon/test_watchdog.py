@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import mock
+import pytest
+
+from fiaas_deploy_daemon.base_thread import DaemonThread
+from fiaas_deploy_daemon.config import Configuration
+from fiaas_deploy_daemon.crd.watcher import CrdWatcher
+from fiaas_deploy_daemon.deployer import DeployerEvent
+from fiaas_deploy_daemon.deployer.bookkeeper import Bookkeeper
+from fiaas_deploy_daemon.deployer.deploy import Deployer, DeployerPool
+from fiaas_deploy_daemon.deployer.deploy_queue import DeployQueue
+from fiaas_deploy_daemon.deployer.kubernetes.adapter import K8s
+from fiaas_deploy_daemon.deployer.kubernetes.quota_cache import QuotaCache
+from fiaas_deploy_daemon.deployer.kubernetes.ready_check import ReadinessTracker
+from fiaas_deploy_daemon.deployer.kubernetes.resource_cache import ResourceCache
+from fiaas_deploy_daemon.deployer.scheduler import Scheduler
+from fiaas_deploy_daemon.informer import Informer
+from fiaas_deploy_daemon.leader_election import NoElection
+from fiaas_deploy_daemon.lifecycle import Lifecycle
+from fiaas_deploy_daemon.sharding import Unsharded
+from fiaas_deploy_daemon.watchdog import Watchdog
+
+
+def _thread(spec, name, work=None):
+    thread = mock.create_autospec(spec, instance=True)
+    thread.name = name
+    thread.current_work.return_value = work
+    return thread
+
+
+class TestDaemonThread(object):
+    def test_current_work(self):
+        thread = DaemonThread()
+        assert thread.current_work() is None
+
+        with thread.working_on("item"):
+            item, seconds = thread.current_work()
+            assert item == "item"
+            assert 0 <= seconds < 1
+
+        assert thread.current_work() is None
+
+
+class TestWatchdog(object):
+    @pytest.fixture
+    def config(self):
+        return Configuration(["--deploy-workers", "2", "--stuck-deploy-timeout", "60", "--stuck-watch-timeout", "120",
+                              "--max-deploy-queue-lag", "300"])
+
+    @pytest.fixture
+    def workers(self):
+        return [_thread(Deployer, "Deployer-0"), _thread(Deployer, "Deployer-1")]
+
+    @pytest.fixture
+    def deployer(self, workers):
+        deployer = mock.create_autospec(DeployerPool, spec_set=True, instance=True)
+        deployer.workers.return_value = workers
+        deployer.replaced_alive.return_value = 0
+        return deployer
+
+    @pytest.fixture
+    def deploy_queue(self):
+        deploy_queue = mock.create_autospec(DeployQueue, spec_set=True, instance=True)
+        deploy_queue.lag.return_value = 0
+        return deploy_queue
+
+    @pytest.fixture
+    def crd_watcher(self):
+        return _thread(CrdWatcher, "CrdWatcher")
+
+    @pytest.fixture
+    def informer(self):
+        return _thread(Informer, "DeploymentInformer")
+
+    @pytest.fixture
+    def watchdog(self, config, deployer, deploy_queue, crd_watcher, informer):
+        resource_cache = mock.create_autospec(ResourceCache, spec_set=True, instance=True)
+        resource_cache.threads.return_value = [informer]
+        quota_cache = mock.create_autospec(QuotaCache, spec_set=True, instance=True)
+        quota_cache.threads.return_value = []
+        return Watchdog(config, deployer, deploy_queue, crd_watcher, _thread(Informer, "StatusIndex"), resource_cache,
+                        quota_cache)
+
+    def test_healthy_when_nothing_is_stuck(self, watchdog, deployer, workers, informer):
+        workers[0].current_work.return_value = ("app", 59)
+        informer.current_work.return_value = ("Deployment watch", 119)
+
+        watchdog.check()
+
+        assert watchdog.is_healthy()
+        deployer.replace.assert_not_called()
+
+    @mock.patch("fiaas_deploy_daemon.watchdog.log_thread_stacks")
+    def test_replaces_stuck_deploy_worker(self, log_thread_stacks, watchdog, deployer, workers):
+        workers[1].current_work.return_value = ("app", 61)
+
+        watchdog.check()
+
+        deployer.replace.assert_called_once_with(workers[1])
+        log_thread_stacks.assert_called_once_with(mock.ANY, [workers[1].ident])
+        assert watchdog.is_healthy()
+
+    @mock.patch("fiaas_deploy_daemon.watchdog.log_thread_stacks")
+    def test_replaces_deploy_worker_stuck_on_app_spec(self, log_thread_stacks, watchdog, deployer, config, app_spec):
+        adapter = mock.create_autospec(K8s, spec_set=True, instance=True)
+        bookkeeper = mock.create_autospec(Bookkeeper, spec_set=True, instance=True)
+        lifecycle = mock.create_autospec(Lifecycle, spec_set=True, instance=True)
+        worker = Deployer(DeployQueue(config, lifecycle, bookkeeper), bookkeeper, adapter,
+                          mock.create_autospec(Scheduler, spec_set=True, instance=True), lifecycle, config,
+                          mock.create_autospec(ReadinessTracker, spec_set=True, instance=True), Unsharded(),
+                          NoElection())
+        worker._queue = [DeployerEvent("UPDATE", app_spec, None)]
+        deployer.workers.return_value = [worker]
+
+        def stuck_deploy(app_spec):
+            item, started = worker._work
+            worker._work = (item, started - 61)
+            watchdog.check()
+
+        adapter.deploy.side_effect = stuck_deploy
+
+        worker()
+
+        deployer.replace.assert_called_once_with(worker)
+
+    @mock.patch("fiaas_deploy_daemon.watchdog.log_thread_stacks")
+    def test_stuck_watch_is_unhealthy_and_logged_once(self, log_thread_stacks, watchdog, informer):
+        informer.current_work.return_value = ("Deployment watch", 121)
+
+        watchdog.check()
+        watchdog.check()
+
+        assert not watchdog.is_healthy()
+        log_thread_stacks.assert_called_once_with(mock.ANY, [informer.ident])
+
+    def test_queue_lag_is_unhealthy(self, watchdog, deploy_queue):
+        deploy_queue.lag.return_value = 301
+
+        assert not watchdog.is_healthy()
+
+    def test_too_many_stuck_replaced_workers_is_unhealthy(self, watchdog, deployer):
+        deployer.replaced_alive.return_value = 1
+        assert watchdog.is_healthy()
+
+        deployer.replaced_alive.return_value = 2
+        assert not watchdog.is_healthy()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+
+# Copyright 2017-2019 The FIAAS Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import unicode_literals, absolute_import
+
+import os
+
+import mock
+import pytest
+
+from fiaas_deploy_daemon.usage_reporting.spool import MemorySpool, DiskSpool
+
+
+def _read_all(spool):
+    events, _ = spool.read(spool.head(), 1000)
+    return events
+
+
+class TestSpools(object):
+    @pytest.fixture(params=("memory", "disk"))
+    def spool(self, request, tmpdir):
+        if request.param == "memory":
+            return MemorySpool(100)
+        return DiskSpool(str(tmpdir.join("spool")), 100)
+
+    def test_reads_batches_in_order(self, spool):
+        for i in range(5):
+            spool.append(["event", i])
+
+        first, position = spool.read(spool.head(), 2)
+        second, position = spool.read(position, 2)
+        third, position = spool.read(position, 2)
+
+        assert first == [["event", 0], ["event", 1]]
+        assert second == [["event", 2], ["event", 3]]
+        assert third == [["event", 4]]
+        assert spool.read(position, 2)[0] == []
+        assert spool.pending() == 5
+
+    def test_ack_removes_events_from_head(self, spool):
+        for i in range(3):
+            spool.append(["event", i])
+
+        _, position = spool.read(spool.head(), 2)
+        spool.ack(position)
+
+        assert _read_all(spool) == [["event", 2]]
+        assert spool.pending() == 1
+
+    def test_wait_returns_when_batch_is_full(self, spool):
+        spool.append(["event", 0])
+        spool.append(["event", 1])
+
+        spool.wait(2, 60)
+
+
+class TestMemorySpool(object):
+    def test_drops_oldest_when_full(self):
+        spool = MemorySpool(2)
+        for i in range(3):
+            spool.append(["event", i])
+
+        assert _read_all(spool) == [["event", 1], ["event", 2]]
+
+    def test_ack_after_dropping_oldest_keeps_events_not_read(self):
+        spool = MemorySpool(3)
+        for i in range(3):
+            spool.append(["event", i])
+        events, position = spool.read(spool.head(), 2)
+        spool.append(["event", 3])
+
+        spool.ack(position)
+
+        assert events == [["event", 0], ["event", 1]]
+        assert _read_all(spool) == [["event", 2], ["event", 3]]
+        assert spool.pending() == 2
+
+    def test_read_after_dropping_oldest_goes_on_from_first_event_held(self):
+        spool = MemorySpool(2)
+        spool.append(["event", 0])
+        position = spool.head()
+        for i in range(1, 4):
+            spool.append(["event", i])
+
+        events, _ = spool.read(position, 10)
+
+        assert events == [["event", 2], ["event", 3]]
+
+
+class TestDiskSpool(object):
+    @pytest.fixture
+    def directory(self, tmpdir):
+        return str(tmpdir.join("spool"))
+
+    def test_events_survive_reopening(self, directory):
+        spool = DiskSpool(directory, 100)
+        for i in range(3):
+            spool.append(["event", i])
+        _, position = spool.read(spool.head(), 1)
+        spool.ack(position)
+
+        reopened = DiskSpool(directory, 100)
+
+        assert _read_all(reopened) == [["event", 1], ["event", 2]]
+        assert reopened.pending() == 2
+
+    @mock.patch("fiaas_deploy_daemon.usage_reporting.spool.SEGMENT_EVENTS", 2)
+    def test_deletes_delivered_segments(self, directory):
+        spool = DiskSpool(directory, 100)
+        for i in range(5):
+            spool.append(["event", i])
+
+        events, position = spool.read(spool.head(), 3)
+        spool.ack(position)
+
+        assert events == [["event", 0], ["event", 1], ["event", 2]]
+        assert len([name for name in os.listdir(directory) if name.endswith(".jsonl")]) == 2
+        assert _read_all(spool) == [["event", 3], ["event", 4]]
+
+    @mock.patch("fiaas_deploy_daemon.usage_reporting.spool.SEGMENT_EVENTS", 2)
+    def test_drops_oldest_segment_when_full(self, directory):
+        spool = DiskSpool(directory, 3)
+        for i in range(4):
+            spool.append(["event", i])
+
+        assert _read_all(spool) == [["event", 2], ["event", 3]]
+        assert spool.pending() == 2
+
+    def test_skips_incomplete_line_after_crash(self, directory):
+        spool = DiskSpool(directory, 100)
+        spool.append(["event", 0])
+        with open(os.path.join(directory, sorted(os.listdir(directory))[-1]), "ab") as f:
+            f.write(b'["event", 1')
+
+        reopened = DiskSpool(directory, 100)
+        reopened.append(["event", 2])
+
+        assert _read_all(reopened) == [["event", 0], ["event", 2]]
+
+    def test_unreadable_line_is_acked_with_the_events_around_it(self, directory):
+        spool = DiskSpool(directory, 100)
+        spool.append(["event", 0])
+        with open(os.path.join(directory, sorted(os.listdir(directory))[-1]), "ab") as f:
+            f.write(b'not json\n')
+        reopened = DiskSpool(directory, 100)
+        reopened.append(["event", 2])
+        assert reopened.pending() == 3
+
+        events, position = reopened.read(reopened.head(), 3)
+        reopened.ack(position)
+
+        assert events == [["event", 0], ["event", 2]]
+        assert reopened.pending() == 0
+
+    @mock.patch("fiaas_deploy_daemon.usage_reporting.spool.SEGMENT_EVENTS", 2)
+    def test_read_from_dropped_segment_goes_on_from_head(self, directory):
+        spool = DiskSpool(directory, 3)
+        position = spool.head()
+        for i in range(4):
+            spool.append(["event", i])
+
+        events, _ = spool.read(position, 10)
+
+        assert events == [["event", 2], ["event", 3]]
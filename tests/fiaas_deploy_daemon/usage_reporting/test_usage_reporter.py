@@ -18,13 +18,22 @@ from __future__ import unicode_literals, absolute_import
 
 import mock
 import pytest
-from blinker import signal
+import requests
+from blinker import Namespace
 from requests.auth import AuthBase
 
 from fiaas_deploy_daemon import Configuration
 from fiaas_deploy_daemon.lifecycle import Subject, DEPLOY_STATUS_CHANGED, STATUS_STARTED, STATUS_FAILED, STATUS_SUCCESS
 from fiaas_deploy_daemon.usage_reporting import DevhoseDeploymentEventTransformer
-from fiaas_deploy_daemon.usage_reporting.usage_reporter import UsageReporter, UsageEvent
+from fiaas_deploy_daemon.usage_reporting.spool import MemorySpool
+from fiaas_deploy_daemon.usage_reporting.usage_reporter import UsageReporter, UsageEvent, CircuitBreaker, \
+    FAILURE_THRESHOLD
+
+
+def _response(status_code):
+    resp = requests.Response()
+    resp.status_code = status_code
+    return resp
 
 
 class TestUsageReporter(object):
@@ -32,8 +41,19 @@ class TestUsageReporter(object):
     def config(self):
         config = mock.create_autospec(Configuration([]), spec_set=True)
         config.usage_reporting_endpoint = "http://example.com/usage"
+        config.usage_reporting_batch_size = 1
+        config.usage_reporting_batch_delay = 100
+        config.usage_reporting_workers = 1
+        config.usage_reporting_overflow = "block"
+        config.lifecycle_queue_size = 10
         return config
 
+    @pytest.fixture
+    def signal(self, monkeypatch):
+        s = Namespace().signal
+        monkeypatch.setattr("fiaas_deploy_daemon.lifecycle.signal", s)
+        yield s
+
     @pytest.fixture
     def mock_transformer(self, config):
         return mock.create_autospec(DevhoseDeploymentEventTransformer(config))
@@ -46,6 +66,14 @@ class TestUsageReporter(object):
     def mock_auth(self):
         return mock.create_autospec(AuthBase())
 
+    @pytest.fixture
+    def spool(self):
+        return MemorySpool(100)
+
+    @pytest.fixture
+    def reporter(self, signal, config, mock_transformer, mock_session, mock_auth, spool):
+        return UsageReporter(config, mock_transformer, mock_session, mock_auth, spool)
+
     @pytest.mark.parametrize("result,repository", [
         (STATUS_STARTED, None),
         (STATUS_FAILED, None),
@@ -54,14 +82,14 @@ class TestUsageReporter(object):
         (STATUS_FAILED, "repo"),
         (STATUS_SUCCESS, "repo"),
     ])
-    def test_signal_to_event(self, config, mock_transformer, mock_session, mock_auth, app_spec, result, repository):
-        reporter = UsageReporter(config, mock_transformer, mock_session, mock_auth)
-
+    def test_signal_to_event(self, signal, reporter, spool, app_spec, result, repository):
         lifecycle_subject = Subject(uid=app_spec.uid, app_name=app_spec.name, namespace=app_spec.namespace,
                                     deployment_id=app_spec.deployment_id, repository=repository, labels=None, annotations=None)
         signal(DEPLOY_STATUS_CHANGED).send(status=result, subject=lifecycle_subject)
+        reporter._subscription.flush()
 
-        event = reporter._event_queue.get_nowait()
+        events, _ = spool.read(spool.head(), 1)
+        event = UsageEvent(*events[0])
 
         assert event.status == result.split("_")[-1].upper()
         assert event.app_name == app_spec.name
@@ -69,24 +97,106 @@ class TestUsageReporter(object):
         assert event.deployment_id == app_spec.deployment_id
         assert event.repository == repository
 
-    def test_event_to_transformer(self, config, mock_transformer, mock_session, mock_auth):
+    def test_event_to_transformer(self, reporter, spool, mock_transformer):
         event = UsageEvent("status", "name", "namespace", "deployment_id", "repository")
-        reporter = UsageReporter(config, mock_transformer, mock_session, mock_auth)
-        reporter._event_queue = [event]
+        spool.append(list(event))
 
-        reporter()
+        reporter._report_batches()
 
         mock_transformer.assert_called_once_with(event.status, event.app_name, event.namespace, event.deployment_id,
                                                  event.repository)
 
-    def test_post_to_webhook(self, config, mock_transformer, mock_session, mock_auth):
+    def test_post_to_webhook(self, reporter, spool, config, mock_transformer, mock_session, mock_auth):
         event = UsageEvent("status", "name", "namespace", "deployment_id", "repository")
-        reporter = UsageReporter(config, mock_transformer, mock_session, mock_auth)
-        reporter._event_queue = [event]
+        spool.append(list(event))
 
         payload = {"dummy": "payload"}
         mock_transformer.return_value = payload
 
-        reporter()
+        reporter._report_batches()
 
         mock_session.post.assert_called_once_with(config.usage_reporting_endpoint, json=payload, auth=mock_auth)
+        assert spool.pending() == 0
+
+    def test_posts_batches_as_lists(self, config, mock_transformer, mock_session, mock_auth, spool):
+        config.usage_reporting_batch_size = 2
+        config.usage_reporting_workers = 2
+        reporter = UsageReporter(config, mock_transformer, mock_session, mock_auth, spool)
+        for name in ("a", "b", "c"):
+            spool.append(list(UsageEvent("STARTED", name, "namespace", "deployment_id", None)))
+        mock_transformer.side_effect = lambda status, app_name, *args: {"application": app_name}
+
+        assert reporter._report_batches()
+
+        mock_session.post.assert_has_calls([
+            mock.call(config.usage_reporting_endpoint, json=[{"application": "a"}, {"application": "b"}],
+                      auth=mock_auth),
+            mock.call(config.usage_reporting_endpoint, json=[{"application": "c"}], auth=mock_auth),
+        ], any_order=True)
+        assert spool.pending() == 0
+
+    def test_keeps_events_when_endpoint_fails(self, reporter, spool, mock_session):
+        spool.append(list(UsageEvent("STARTED", "name", "namespace", "deployment_id", None)))
+        mock_session.post.return_value = _response(503)
+
+        assert not reporter._report_batches()
+
+        assert spool.pending() == 1
+
+    def test_drops_events_rejected_by_endpoint(self, reporter, spool, mock_session):
+        spool.append(list(UsageEvent("STARTED", "name", "namespace", "deployment_id", None)))
+        mock_session.post.return_value = _response(400)
+
+        assert reporter._report_batches()
+
+        assert spool.pending() == 0
+
+    def test_drops_events_that_can_not_be_transformed(self, config, mock_transformer, mock_session, mock_auth, spool):
+        config.usage_reporting_batch_size = 3
+        reporter = UsageReporter(config, mock_transformer, mock_session, mock_auth, spool)
+        for name in ("a", "bad", "c"):
+            spool.append(list(UsageEvent("STARTED", name, "namespace", "deployment_id", None)))
+        spool.append(["not", "an", "event"])
+
+        def transform(status, app_name, *args):
+            if app_name == "bad":
+                raise ValueError("bad event")
+            return {"application": app_name}
+        mock_transformer.side_effect = transform
+
+        assert reporter._report_batches()
+        mock_session.post.assert_called_once_with(config.usage_reporting_endpoint,
+                                                  json=[{"application": "a"}, {"application": "c"}], auth=mock_auth)
+        assert reporter._report_batches()
+        assert mock_session.post.call_count == 1
+        assert spool.pending() == 0
+
+    def test_stops_sending_after_repeated_failures(self, reporter, spool, mock_session):
+        spool.append(list(UsageEvent("STARTED", "name", "namespace", "deployment_id", None)))
+        mock_session.post.side_effect = requests.exceptions.ConnectionError()
+
+        for _ in range(FAILURE_THRESHOLD + 2):
+            reporter._report_batches()
+
+        assert mock_session.post.call_count == FAILURE_THRESHOLD
+        assert spool.pending() == 1
+
+
+class TestCircuitBreaker(object):
+    def test_opens_after_failures_and_closes_after_timeout(self):
+        now = [100]
+        breaker = CircuitBreaker(2, 30, time_func=lambda: now[0])
+
+        breaker.failure()
+        assert breaker.allow()
+        breaker.failure()
+        assert not breaker.allow()
+        assert breaker.remaining() == 30
+
+        now[0] = 130
+        assert breaker.allow()
+        breaker.failure()
+        assert not breaker.allow()
+
+        breaker.success()
+        assert breaker.allow()
@@ -145,6 +145,8 @@ def assert_k8s_resource_matches(resource, expected_dict, image, service_type, de
     _ensure_key_missing(actual_dict, "metadata", "uid")
     # an internal annotation used to track ReplicaSets tied to a particular version of a Deployment
     _ensure_key_missing(actual_dict, "metadata", "annotations", "deployment.kubernetes.io/revision")
+    # a hash of the desired state, used by fiaas-deploy-daemon to skip writing unchanged resources
+    _ensure_key_missing(actual_dict, "metadata", "annotations", "fiaas/desired-state-hash")
     # status is managed by Kubernetes itself, and is not part of the configuration of the resource
     _ensure_key_missing(actual_dict, "status")
     # autoscaling.alpha.kubernetes.io/conditions is automatically set when converting from